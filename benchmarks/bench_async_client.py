@@ -0,0 +1,75 @@
+""" Many asyncio workers reporting metrics from one process.
+
+Compares the blocking ``Client`` (every update wrapped in the loop's default
+executor, as trainers had to do before) with ``AsyncClient``. Reports the
+wall time for all workers to finish and the updates/sec the loop sustained.
+Usage::
+
+    python -m benchmarks.bench_async_client --workers 1000 --steps 100
+"""
+import argparse
+import asyncio
+import time
+
+from traintracker.async_client import AsyncClient
+from traintracker.client import Client
+from traintracker.server import Server
+from traintracker.util.defs import *
+from tests.server_utils import serve_in_thread
+
+
+async def run_executor(address: Tuple[str, int], n_workers: int, n_steps: int) -> float:
+    loop = asyncio.get_running_loop()
+    c = Client()
+    c.connect(*address)
+    for i in range(n_workers):
+        c.add_plot(PlotType.accuracy, str(i))
+
+    async def worker(plot_id: int):
+        for step in range(n_steps):
+            await loop.run_in_executor(None, c.update_plot, plot_id, np.array([0.5, step], dtype=np.float32))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(n_workers)))
+    elapsed = time.perf_counter() - start
+    c.shutdown_server()
+    c.close_connection()
+    return elapsed
+
+
+async def run_async(address: Tuple[str, int], n_workers: int, n_steps: int) -> float:
+    c = AsyncClient()
+    await c.connect(*address)
+    for i in range(n_workers):
+        c.add_plot(PlotType.accuracy, str(i))
+
+    async def worker(plot_id: int):
+        for step in range(n_steps):
+            c.update_plot(plot_id, np.array([0.5, step], dtype=np.float32))
+            await c.drain()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(n_workers)))
+    elapsed = time.perf_counter() - start
+    c.shutdown_server()
+    await c.close_connection()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=1000)
+    parser.add_argument("--steps", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'client':>20} {'seconds':>10} {'updates/s':>12}")
+    for label, bench in (("Client + executor", run_executor), ("AsyncClient", run_async)):
+        s = Server()
+        thread, address = serve_in_thread(s)
+        elapsed = asyncio.run(bench(address, args.workers, args.steps))
+        thread.join()
+        print(f"{label:>20} {elapsed:>10.2f} {args.workers * args.steps / elapsed:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
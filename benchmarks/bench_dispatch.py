@@ -0,0 +1,73 @@
+""" Latency of one server tick (``Server._update_plots``) by number of registered plots.
+
+Measures an idle tick (no pending data) and a tick where 1% of the plots (at
+least one) have a pending row. If dask is installed, the previous dask based
+fan-out is measured as a baseline.
+Usage::
+
+    python -m benchmarks.bench_dispatch --plots 1 100 1000 --ticks 200
+"""
+import argparse
+import time
+import warnings
+from bokeh.document.document import Document
+
+from traintracker.server import Server
+from traintracker.util.defs import *
+from typing import Callable
+
+try:
+    from dask import delayed, compute
+except ImportError:
+    compute = None
+
+
+def dask_update_plots(server: Server) -> None:
+    compute(
+        delayed(plot.update_from_queue)(server._queues[name]) for name, plot, in enumerate(server._plots)
+    )
+
+
+def tick_latency(server: Server, tick: Callable, n_ticks: int, n_dirty: int) -> float:
+    """ Returns the median tick latency in microseconds. """
+    doc = Document()
+    server._make_document(doc)
+    row: bytes = np.array([0.5, 1], dtype=np.float32).tobytes()
+    latencies: List[float] = []
+    for _ in range(n_ticks):
+        for plot_id in range(n_dirty):
+            server._handle_plot_update(plot_id, row)
+        start = time.perf_counter()
+        tick(server)
+        latencies.append(time.perf_counter() - start)
+        # discard the scheduled streams, they are not part of the tick
+        for callback in list(doc.session_callbacks):
+            doc.remove_next_tick_callback(callback)
+    return float(np.median(latencies)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--plots", type=int, nargs="+", default=[1, 100, 1000])
+    parser.add_argument("--ticks", type=int, default=200)
+    args = parser.parse_args()
+
+    ticks: Dict[str, Callable] = {"dirty set": Server._update_plots}
+    if compute:
+        ticks["dask"] = dask_update_plots
+
+    print(f"{'plots':>6} {'dispatcher':>11} {'idle us':>10} {'1% dirty us':>12}")
+    for n_plots in args.plots:
+        server = Server()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            for plot_id in range(n_plots):
+                server._add_plot(PlotType.accuracy, str(plot_id))
+        for name, tick in ticks.items():
+            idle = tick_latency(server, tick, args.ticks, 0)
+            dirty = tick_latency(server, tick, args.ticks, max(n_plots // 100, 1))
+            print(f"{n_plots:>6} {name:>11} {idle:>10,.1f} {dirty:>12,.1f}")
+
+
+if __name__ == '__main__':
+    main()
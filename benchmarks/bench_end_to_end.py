@@ -0,0 +1,234 @@
+""" End-to-end throughput and latency: trainer -> server -> browser.
+
+Starts a server with its plot server, drives it with synthetic trackers from
+separate processes and follows the plots with headless Bokeh sessions in
+place of browsers. Reports the trainers' per-update latency, the updates/sec
+the server sustained, the time spent in the server's ``_update_plots`` ticks
+and the number and size of the document patches sent to the browser.
+Usage::
+
+    python -m benchmarks.bench_end_to_end --drivers 2 --trackers 10 --updates 2000 --rate 500 \\
+        --browsers 5 --output results.jsonl
+
+Results are printed as JSON; ``--output`` appends them to a JSON lines file
+so they can be tracked over time.
+"""
+import argparse
+import json
+import multiprocessing as mp
+import platform
+import socket
+import threading
+import time
+from bokeh.client import pull_session
+from bokeh.models import ColumnDataSource
+from tornado.ioloop import IOLoop
+
+from traintracker.client import Client
+from traintracker.server import Server
+from traintracker.trackers import TrainValLossTracker
+from traintracker.util.defs import *
+from tests.server_utils import serve_in_thread
+
+PERCENTILES: List[int] = [50, 90, 99]
+
+
+def driver_main(address: Tuple[str, int], driver_id: int, n_trackers: int, n_updates: int, rate: float,
+                options: Dict, barrier, results) -> None:
+    c = Client(**options)
+    c.connect(*address)
+    trackers = [TrainValLossTracker(f"driver {driver_id}/{i}", c) for i in range(n_trackers)]
+    # every plot exists before the browser connects
+    for tracker in trackers:
+        c.server_id(tracker.id)
+    losses: NDArray = np.random.rand(n_updates, 2)
+    latencies: NDArray = np.empty(n_updates * n_trackers, dtype=np.int64)
+    period: float = 1 / rate if rate else 0.
+    barrier.wait()
+
+    clock = time.perf_counter_ns
+    start: float = time.perf_counter()
+    i = 0
+    for step in range(n_updates):
+        for tracker in trackers:
+            t0 = clock()
+            tracker.update(losses[step, 0], losses[step, 1], step)
+            latencies[i] = clock() - t0
+            i += 1
+        if period:
+            # a fixed rate, as a training loop would
+            delay = start + (step + 1) * period - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    elapsed = time.perf_counter() - start
+    dropped = c.dropped
+    c.close_connection()
+    results.put((latencies, elapsed, dropped))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_plot_server(s: Server, thread: threading.Thread) -> int:
+    """ Start the plot server on the server's loop, like ``start_plot_server`` without opening a browser. """
+    port = free_port()
+    started = threading.Event()
+
+    def start():
+        s._serve_plots(port)
+        started.set()
+
+    thread.loop.call_soon_threadsafe(start)
+    started.wait()
+    return port
+
+
+def instrument(s: Server) -> Dict[str, List]:
+    """ Record the time of every tick and the rows the server receives. """
+    stats: Dict[str, List] = {"ticks": [], "received": [0], "last_received": [0.]}
+    update_plots, record = s._update_plots, s._record
+
+    def timed_update_plots():
+        start = time.perf_counter_ns()
+        update_plots()
+        stats["ticks"].append(time.perf_counter_ns() - start)
+
+    def counted_record(plot_id, new_data):
+        record(plot_id, new_data)
+        stats["received"][0] += len(np.atleast_2d(new_data))
+        stats["last_received"][0] = time.perf_counter()
+
+    s._update_plots, s._record = timed_update_plots, counted_record
+    return stats
+
+
+def browser_rows(doc) -> int:
+    return sum(len(source.data["step"]) for source in doc.select({"type": ColumnDataSource})
+               if "step" in source.data)
+
+
+def follow(plots_port: int, io_loop: IOLoop, patches: List[int]):
+    """ A headless browser session, the size of every patch it receives is appended to ``patches``. """
+    session = pull_session(url=f"http://localhost:{plots_port}/", io_loop=io_loop)
+    handle_patch = session._handle_patch
+
+    def counted_patch(message):
+        size = sum(len(part) for part in (message.header_json, message.metadata_json, message.content_json))
+        patches.append(size + sum(len(payload) for _, payload in message.buffers))
+        handle_patch(message)
+
+    session._handle_patch = counted_patch
+    return session
+
+
+def percentiles(values: NDArray) -> Dict[str, float]:
+    if not len(values):
+        return {}
+    summary = {f"p{p}": float(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+    summary["max"] = float(np.max(values))
+    return summary
+
+
+def run(n_drivers: int, n_trackers: int, n_updates: int, rate: float, n_browsers: int, options: Dict,
+        timeout: float) -> Dict[str, Any]:
+    s = Server()
+    thread, address = serve_in_thread(s)
+    stats = instrument(s)
+    plots_port = start_plot_server(s, thread)
+
+    barrier = mp.Barrier(n_drivers + 1)
+    results = mp.Queue()
+    drivers = [mp.Process(target=driver_main,
+                          args=(address, i, n_trackers, n_updates, rate, options, barrier, results))
+               for i in range(n_drivers)]
+    for p in drivers:
+        p.start()
+    expected: int = n_drivers * n_trackers * n_updates
+    while len(s._registry) < n_drivers * n_trackers:
+        time.sleep(.01)
+
+    # the headless browsers, all on one loop
+    io_loop = IOLoop()
+    patches: List[int] = []
+    sessions = [follow(plots_port, io_loop, patches) for _ in range(n_browsers)]
+    stats["ticks"].clear()
+
+    outcome: List[Tuple[NDArray, float, int]] = []
+    finished: List[float] = []
+
+    def check():
+        # collect the drivers' results as they finish, then wait for the browser to catch up
+        while not results.empty():
+            outcome.append(results.get())
+        dropped = sum(d for _, _, d in outcome)
+        if len(outcome) == n_drivers and all(browser_rows(session.document) >= expected - dropped
+                                              for session in sessions):
+            finished.append(time.perf_counter())
+        if finished or time.perf_counter() - start > timeout:
+            for session in sessions:
+                session.close()
+        else:
+            io_loop.call_later(.01, check)
+
+    barrier.wait()
+    start = time.perf_counter()
+    io_loop.add_callback(check)
+    # a session only reads its websocket while its own loop_until_* runs, start the others' readers
+    for session in sessions[1:]:
+        io_loop.add_callback(session._connection._next)
+    for session in sessions:
+        session.loop_until_closed()
+    while len(outcome) < n_drivers:
+        outcome.append(results.get())
+    for p in drivers:
+        p.join()
+    thread.loop.call_soon_threadsafe(thread.loop.stop)
+    thread.join(10)
+
+    latencies = np.concatenate([lat for lat, _, _ in outcome]) / 1e3
+    received: int = stats["received"][0]
+    server_elapsed: float = stats["last_received"][0] - start
+    return {
+        "time": time.time(),
+        "python": platform.python_version(),
+        "params": {"drivers": n_drivers, "trackers": n_trackers, "updates": n_updates,
+                   "rate": rate, "browsers": n_browsers, **options},
+        "update_latency_us": percentiles(latencies),
+        "sent_per_second": float(n_drivers * n_trackers * n_updates / max(e for _, e, _ in outcome)),
+        "received_per_second": received / server_elapsed if server_elapsed > 0 else 0.,
+        "received": received,
+        "dropped": sum(d for _, _, d in outcome),
+        "tick_us": percentiles(np.array(stats["ticks"]) / 1e3),
+        "ticks": len(stats["ticks"]),
+        "patches": len(patches),
+        "patch_bytes": int(sum(patches)),
+        "browser_rows": min(browser_rows(session.document) for session in sessions),
+        "browser_lag_s": finished[0] - stats["last_received"][0] if finished else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drivers", type=int, default=1, help="trainer processes")
+    parser.add_argument("--trackers", type=int, default=10, help="trackers per trainer")
+    parser.add_argument("--updates", type=int, default=2000, help="updates sent by each tracker")
+    parser.add_argument("--rate", type=float, default=0., help="steps per second of each trainer, 0 for unlimited")
+    parser.add_argument("--browsers", type=int, default=1, help="headless browser sessions following the plots")
+    parser.add_argument("--background", action="store_true", help="send from a background thread")
+    parser.add_argument("--timeout", type=float, default=120., help="seconds to wait for the browser")
+    parser.add_argument("--output", help="JSON lines file the results are appended to")
+    args = parser.parse_args()
+
+    options: Dict = {"background": True} if args.background else {}
+    result = run(args.drivers, args.trackers, args.updates, args.rate, args.browsers, options, args.timeout)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "a") as fp:
+            fp.write(json.dumps(result) + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+""" Import time of what a trainer loads (trackers and client) and of the server.
+
+Every import runs in a fresh interpreter, the best of ``--repeat`` runs is
+reported. Exits with an error if the trainer's import exceeds ``--budget``.
+Usage::
+
+    python -m benchmarks.bench_import --repeat 5 --budget 0.3
+"""
+import argparse
+import subprocess
+import sys
+
+from traintracker.util.defs import *
+
+IMPORTS: Dict[str, str] = {
+    "python": "pass",
+    "numpy": "import numpy",
+    "trainer": "import traintracker.trackers, traintracker.client",
+    "server": "import traintracker.server",
+}
+# what a trainer must never load, checked by tests/unit_tests/test_imports.py too
+SERVER_ONLY: Tuple[str, ...] = ("bokeh", "tornado", "dask", "asyncio")
+
+
+def time_import(statement: str) -> Tuple[float, List[str]]:
+    """ Returns the seconds an import takes in a fresh interpreter and the server only modules it loaded. """
+    code = ("import sys, time; start = time.perf_counter(); " + statement + "\n"
+            "print(time.perf_counter() - start); "
+            f"print(' '.join(m for m in {SERVER_ONLY!r} if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    seconds, loaded = out.split("\n", 1)
+    return float(seconds), loaded.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=.3, help="seconds a trainer's import may take")
+    args = parser.parse_args()
+
+    print(f"{'import':>8} {'ms':>8}  server only modules")
+    for name, statement in IMPORTS.items():
+        runs = [time_import(statement) for _ in range(args.repeat)]
+        seconds = min(s for s, _ in runs)
+        loaded = runs[0][1]
+        print(f"{name:>8} {seconds * 1e3:>8.1f}  {' '.join(loaded)}")
+        if name == "trainer" and (seconds > args.budget or loaded):
+            sys.exit(f"trainer import over budget: {seconds * 1e3:.1f} ms (budget {args.budget * 1e3:.0f} ms), "
+                     f"loaded: {loaded}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+""" Aggregate update throughput of one server with N concurrently connected clients.
+
+Every client runs in its own process and sends its updates as fast as it can.
+Usage::
+
+    python -m benchmarks.bench_multi_client --clients 1 2 4 8 16 --updates 200000
+"""
+import argparse
+import multiprocessing as mp
+import time
+
+from traintracker.client import Client
+from traintracker.server import Server
+from traintracker.util.defs import *
+from tests.server_utils import serve_in_thread
+
+
+def client_main(address: Tuple[str, int], client_id: int, n_updates: int, batch: bool, barrier) -> None:
+    c = Client(background=True)
+    c.connect(*address)
+    plot_id = c.add_plot(PlotType.train_val_loss, f"client {client_id}")
+    rows: NDArray = np.random.rand(n_updates, 3).astype(np.float32)
+    barrier.wait()
+
+    if batch:
+        with c.batch():
+            for row in rows:
+                c.update_plot(plot_id, row)
+    else:
+        for row in rows:
+            c.update_plot(plot_id, row)
+    c.shutdown_server()
+    c.close_connection()
+
+
+def run(n_clients: int, n_updates: int, batch: bool) -> float:
+    """ Returns the number of updates per second received by the server. """
+    s = Server()
+    thread, address = serve_in_thread(s)
+    barrier = mp.Barrier(n_clients + 1)
+    procs = [mp.Process(target=client_main, args=(address, i + 1, n_updates, batch, barrier))
+             for i in range(n_clients)]
+    for p in procs:
+        p.start()
+    # every client has to join before any of them may leave
+    while len(s._sessions) < n_clients:
+        time.sleep(.01)
+
+    barrier.wait()
+    start = time.perf_counter()
+    thread.join()
+    elapsed = time.perf_counter() - start
+    for p in procs:
+        p.join()
+
+    # without a plot server rows are kept in the plots' stores only, never queued
+    received = s._stats.rows
+    assert received == n_clients * n_updates, f"received {received} of {n_clients * n_updates} updates"
+    return received / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--updates", type=int, default=100_000, help="updates sent by each client")
+    parser.add_argument("--batch", action="store_true", help="send updates in batch frames")
+    args = parser.parse_args()
+
+    print(f"{'clients':>8} {'updates/s':>14} {'speedup':>8}")
+    base: Optional[float] = None
+    for n_clients in args.clients:
+        rate = run(n_clients, args.updates, args.batch)
+        base = base or rate
+        print(f"{n_clients:>8} {rate:>14,.0f} {rate / base:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+""" Browser messages and server CPU spent streaming queued rows into a plot.
+
+Compares streaming every queued row on its own (the previous behaviour) with
+draining the queue into one block and streaming it in a single call.
+Usage::
+
+    python -m benchmarks.bench_plot_stream --plots 10 --rows 100 --ticks 10
+"""
+import argparse
+import time
+from queue import Queue
+from bokeh.document.document import Document
+from bokeh.document.events import DocumentPatchedEvent
+from bokeh.protocol import Protocol
+
+from traintracker.tracker_plots import TrackerPlot
+from traintracker.util.defs import *
+from typing import Callable
+
+PROTOCOL = Protocol("1.0")
+
+
+def per_row(plot: TrackerPlot, queue: Queue) -> None:
+    while not queue.empty():
+        plot.stream(queue.get_nowait())
+
+
+def coalesced(plot: TrackerPlot, queue: Queue) -> None:
+    plot.update_from_queue(queue)
+
+
+def run(update: Callable, n_plots: int, n_rows: int, n_ticks: int) -> Tuple[int, int, float]:
+    """ Returns the number of patch messages, their size in bytes and the CPU seconds spent. """
+    doc = Document()
+    plots = [TrackerPlot.build_plot(PlotType.train_val_loss, f"plot {i}", i) for i in range(n_plots)]
+    queues = [Queue() for _ in plots]
+    for plot in plots:
+        doc.add_root(plot.add_view(doc).fig)
+
+    # every patch event becomes one PATCH-DOC message over the websocket
+    events: List[DocumentPatchedEvent] = []
+
+    def on_change(event) -> None:
+        if isinstance(event, DocumentPatchedEvent):
+            events.append(event)
+
+    doc.on_change(on_change)
+
+    cpu = 0.0
+    for tick in range(n_ticks):
+        # rows are ingested as they arrive, as the server does
+        for plot, queue in zip(plots, queues):
+            for i in range(n_rows):
+                queue.put(plot.ingest(np.array([1 / (i + 1), 2 / (i + 1), tick * n_rows + i], dtype=np.float32)))
+        start = time.process_time()
+        for plot, queue in zip(plots, queues):
+            update(plot, queue)
+        # what the Bokeh server does on its next tick
+        for callback in list(doc.session_callbacks):
+            callback.callback()
+        cpu += time.process_time() - start
+    n_bytes = sum(len(PROTOCOL.create("PATCH-DOC", [event], use_buffers=False).content_json) for event in events)
+    return len(events), n_bytes, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--plots", type=int, default=10)
+    parser.add_argument("--rows", type=int, default=100, help="rows queued per plot per tick")
+    parser.add_argument("--ticks", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'mode':>10} {'messages':>10} {'bytes':>12} {'cpu s':>8}")
+    for name, update in (("per row", per_row), ("coalesced", coalesced)):
+        n_messages, n_bytes, cpu = run(update, args.plots, args.rows, args.ticks)
+        print(f"{name:>10} {n_messages:>10,} {n_bytes:>12,} {cpu:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
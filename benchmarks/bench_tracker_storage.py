@@ -0,0 +1,93 @@
+""" Memory and latency of tracker histories: NumPy column store vs Python lists.
+
+Usage::
+
+    python -m benchmarks.bench_tracker_storage --points 10000000
+"""
+import argparse
+import time
+import tracemalloc
+
+from traintracker.trackers import TrainValLossTracker
+from traintracker.util.defs import *
+from typing import Callable
+
+
+class ListTracker:
+    """ The previous list based storage of ``TrainValLossTracker``. """
+    def __init__(self):
+        self._train: List[float] = []
+        self._val: List[float] = []
+        self._steps: List[int] = []
+
+    def update(self, train_loss: float, val_loss: float, step: int) -> None:
+        self._train.append(train_loss)
+        self._val.append(val_loss)
+        self._steps.append(step)
+
+    def get_all_tracked(self, as_np=False):
+        return np.array(self._train), np.array(self._val), np.array(self._steps)
+
+
+def fill(tracker, n_points: int) -> float:
+    """ Returns the mean update latency in nanoseconds. """
+    losses: List[float] = np.random.rand(n_points).tolist()
+    start = time.perf_counter()
+    for step, loss in enumerate(losses):
+        tracker.update(loss, loss, step)
+    return (time.perf_counter() - start) / n_points * 1e9
+
+
+def memory(make_tracker: Callable, n_points: int) -> int:
+    """ Returns the number of bytes held by a tracker with ``n_points`` points. """
+    losses: List[float] = np.random.rand(n_points).tolist()
+    tracemalloc.start()
+    tracker = make_tracker()
+    for step, loss in enumerate(losses):
+        # fresh float objects, as a training loop would produce them
+        tracker.update(loss * 1., loss * 1., step)
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return used
+
+
+def query(tracker, n_queries: int = 10) -> float:
+    """ Returns the mean latency of ``get_all_tracked(as_np=True)`` in microseconds. """
+    start = time.perf_counter()
+    for _ in range(n_queries):
+        tracker.get_all_tracked(as_np=True)
+    return (time.perf_counter() - start) / n_queries * 1e6
+
+
+def early_stopping(tracker, n_steps: int) -> float:
+    """ Returns the seconds spent updating and querying the history at every step. """
+    start = time.perf_counter()
+    for step in range(n_steps):
+        tracker.update(.5, .5, step)
+        _, val, _ = tracker.get_all_tracked(as_np=True)
+        val[-10:].min()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--points", type=int, default=10_000_000)
+    parser.add_argument("--memory-points", type=int, default=1_000_000,
+                        help="points used to measure memory (tracing is slow)")
+    parser.add_argument("--early-stopping-steps", type=int, default=20_000)
+    args = parser.parse_args()
+
+    trackers: Dict[str, Callable] = {"lists": ListTracker, "column store": lambda: TrainValLossTracker("bench")}
+    print(f"{'storage':>13} {'update ns':>10} {'query us':>12} {'bytes/point':>12} {'early stop s':>13}")
+    for name, make_tracker in trackers.items():
+        tracker = make_tracker()
+        update_ns = fill(tracker, args.points)
+        query_us = query(tracker)
+        del tracker
+        bytes_per_point = memory(make_tracker, args.memory_points) / args.memory_points
+        early_stop_s = early_stopping(make_tracker(), args.early_stopping_steps)
+        print(f"{name:>13} {update_ns:>10,.0f} {query_us:>12,.1f} {bytes_per_point:>12,.1f} {early_stop_s:>13,.2f}")
+
+
+if __name__ == '__main__':
+    main()
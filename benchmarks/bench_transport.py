@@ -0,0 +1,78 @@
+""" Shared memory vs TCP transport between a trainer and a server on the same host.
+
+The trainer runs in its own process and reports its per-update latency, the
+server reports sustained updates/sec (until every update was received).
+Usage::
+
+    python -m benchmarks.bench_transport --updates 200000
+"""
+import argparse
+import multiprocessing as mp
+import time
+
+from traintracker.client import Client
+from traintracker.server import Server
+from traintracker.util.defs import *
+from tests.server_utils import serve_in_thread
+
+TRANSPORTS: Dict[str, Dict] = {
+    "tcp": {},
+    "tcp background": {"background": True},
+    "shared memory": {"shared_memory": True},
+}
+
+
+def client_main(address: Tuple[str, int], options: Dict, n_updates: int, barrier, results) -> None:
+    c = Client(ring_size=n_updates, **options)
+    c.connect(*address)
+    plot_id = c.add_plot(PlotType.train_val_loss, "bench")
+    rows: NDArray = np.random.rand(n_updates, 3).astype(np.float32)
+    latencies: NDArray = np.empty(n_updates)
+    barrier.wait()
+
+    clock = time.perf_counter
+    for i, row in enumerate(rows):
+        start = clock()
+        c.update_plot(plot_id, row)
+        latencies[i] = clock() - start
+    dropped = c.dropped
+    c.shutdown_server()
+    c.close_connection()
+    results.put((np.percentile(latencies, [50, 99]) * 1e9, dropped))
+
+
+def run(options: Dict, n_updates: int) -> Tuple[float, NDArray, int]:
+    """ Returns updates/sec, the p50/p99 update latency in ns and the number of dropped updates. """
+    s = Server()
+    thread, address = serve_in_thread(s)
+    barrier = mp.Barrier(2)
+    results = mp.Queue()
+    p = mp.Process(target=client_main, args=(address, options, n_updates, barrier, results))
+    p.start()
+
+    barrier.wait()
+    start = time.perf_counter()
+    thread.join()
+    elapsed = time.perf_counter() - start
+    latency, dropped = results.get()
+    p.join()
+
+    # without a plot server rows are kept in the plot's store only, never queued
+    received = s._stats.rows
+    assert received + dropped == n_updates, f"received {received} of {n_updates} updates"
+    return received / elapsed, latency, dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=200_000)
+    args = parser.parse_args()
+
+    print(f"{'transport':>15} {'updates/s':>12} {'p50 ns':>8} {'p99 ns':>8} {'dropped':>8}")
+    for name, options in TRANSPORTS.items():
+        rate, (p50, p99), dropped = run(options, args.updates)
+        print(f"{name:>15} {rate:>12,.0f} {p50:>8,.0f} {p99:>8,.0f} {dropped:>8,}")
+
+
+if __name__ == '__main__':
+    main()
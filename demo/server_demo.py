@@ -1,4 +1,5 @@
-from traintracker.server import Server, PORT, PS_PORT
+from traintracker.server import Server
+from traintracker.util.defs import PORT, PS_PORT
 
 
 def main():
@@ -26,5 +26,7 @@ setup(
     ],
     packages=["traintracker", "tests"],
     python_requires=">=3.7",
-    install_requires=REQUIREMENTS
+    install_requires=REQUIREMENTS,
+    # trainers only need the client, the server and its plots need bokeh, Parquet exports need pyarrow
+    extras_require={"server": ["bokeh"], "parquet": ["pyarrow"]}
 )
@@ -0,0 +1,49 @@
+import asyncio
+import threading
+
+from traintracker.server import Server
+from traintracker.util.defs import *
+
+
+def serve_in_thread(server: Server, port: int = 0) -> Tuple[threading.Thread, Tuple[str, int]]:
+    """ Run the server's socket loop (without a plot server) on a background thread. """
+    started = threading.Event()
+    address: List[Tuple[str, int]] = []
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        listener = loop.run_until_complete(asyncio.start_server(server._handle_serving, "127.0.0.1", port))
+        address.append(listener.sockets[0].getsockname())
+        thread.loop = loop
+        started.set()
+        # stopped by a server_shutdown command
+        loop.run_forever()
+        listener.close()
+        loop.run_until_complete(listener.wait_closed())
+        loop.close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    started.wait()
+    return thread, address[0]
+
+
+def received(server: Server, plot_name: str) -> NDArray:
+    """ The rows a server has kept for a plot, in the order they were received. """
+    plot = server._plots[server._registry[plot_name]]
+    return np.stack([plot.store[column] for column in plot.columns], axis=1)
+
+
+def kill_server(server: Server, thread: threading.Thread) -> None:
+    """ Stop a server started by ``serve_in_thread`` as if it crashed, dropping every connection. """
+    loop = thread.loop
+
+    def kill():
+        for session in list(server._sessions.values()):
+            session.writer.transport.abort()
+        # the connections are closed on the next iteration, before the loop stops
+        loop.call_soon(loop.stop)
+
+    loop.call_soon_threadsafe(kill)
+    thread.join(10)
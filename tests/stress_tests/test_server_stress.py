@@ -0,0 +1,33 @@
+from unittest import TestCase
+
+from traintracker.client import Client
+from traintracker.server import Server
+from traintracker.util.defs import *
+from tests.server_utils import serve_in_thread, received
+
+
+class TestServerStress(TestCase):
+    def test_million_updates(self):
+        n_updates = 1_000_000
+        n_single = 100_000
+        s = Server()
+        thread, address = serve_in_thread(s)
+
+        c = Client(background=True)
+        c.connect(*address)
+        plot_id = c.add_plot(PlotType.train_val_loss, "stress")
+        # every value is distinct and exactly representable as float32
+        values = np.arange(n_updates * 3, dtype=np.float32).reshape(n_updates, 3)
+        for i in range(n_single):
+            c.update_plot(plot_id, values[i])
+        with c.batch():
+            for i in range(n_single, n_updates):
+                c.update_plot(plot_id, values[i])
+        c.shutdown_server()
+        c.close_connection()
+        thread.join(60)
+
+        self.assertEqual(0, c.dropped)
+        rows = received(s, "stress")
+        self.assertEqual(values.shape, rows.shape)
+        self.assertTrue(np.array_equal(values, rows), "Every value should arrive intact and in order.")
@@ -0,0 +1,51 @@
+from unittest import TestCase
+
+from traintracker.aggregate import RankAggregator
+from traintracker.util.defs import *
+
+
+class TestRankAggregator(TestCase):
+    def test_releases_complete_steps_in_order(self):
+        agg = RankAggregator(world_size=2, reduce=Reduce.mean)
+        self.assertEqual(0, len(agg.add(0, np.array([[1, 0], [3, 1], [5, 2]]))))
+        # rank 1 lags behind
+        merged = agg.add(1, np.array([[2, 0], [4, 1]]))
+        self.assertTrue(np.all(merged == [[1.5, 0], [3.5, 1]]))
+        self.assertEqual(1, agg.pending)
+        merged = agg.add(1, np.array([6, 2]))
+        self.assertTrue(np.all(merged == [[5.5, 2]]))
+
+    def test_skipped_steps_pass_the_watermark(self):
+        agg = RankAggregator(world_size=2, reduce=Reduce.max)
+        agg.add(0, np.array([[1, 0], [1, 1]]))
+        # rank 1 never logs step 0
+        merged = agg.add(1, np.array([[4, 1], [7, 2]]))
+        self.assertTrue(np.all(merged == [[1, 0], [4, 1]]))
+        self.assertTrue(np.all(agg.finish(0) == [[7, 2]]))
+
+    def test_ranks_that_send_again_are_waited_for(self):
+        agg = RankAggregator(world_size=2, reduce=Reduce.mean)
+        agg.add(0, np.array([0, 0]))
+        agg.add(1, np.array([1, 0]))
+        self.assertEqual(0, len(agg.finish(0)))
+        self.assertTrue(np.all(agg.add(1, np.array([[1, 1], [1, 2]])) == [[1, 1], [1, 2]]))
+        # rank 0 comes back: its rows for released steps are dropped, and step 3 waits for it
+        self.assertEqual(0, len(agg.add(0, np.array([[0, 1], [0, 2], [0, 3]]))))
+        self.assertEqual(2, agg.late)
+        self.assertTrue(np.all(agg.add(1, np.array([1, 4])) == [[0, 3]]))
+        self.assertTrue(np.all(agg.add(0, np.array([0, 4])) == [[0.5, 4]]))
+
+    def test_duplicate_rows_count_once(self):
+        agg = RankAggregator(world_size=2, reduce=Reduce.mean)
+        agg.add(0, np.array([1, 0]))
+        # rank 0 sends step 0 again, e.g. resent after a reconnect: the step still waits for rank 1
+        self.assertEqual(0, len(agg.add(0, np.array([3, 0]))))
+        self.assertEqual(1, agg.pending)
+        self.assertTrue(np.all(agg.add(1, np.array([5, 0])) == [[4, 0]]))
+
+    def test_reductions(self):
+        rows = [np.array([2, 5]), np.array([-1, 5]), np.array([8, 5])]
+        for reduce, expected in ((Reduce.sum, 9), (Reduce.min, -1), (Reduce.max, 8), (Reduce.mean, 3)):
+            agg = RankAggregator(world_size=3, reduce=reduce)
+            merged = [agg.add(rank, row) for rank, row in enumerate(rows)][-1]
+            self.assertTrue(np.all(merged == [[expected, 5]]), reduce.name)
@@ -0,0 +1,72 @@
+from unittest import TestCase
+import asyncio
+
+from traintracker.async_client import AsyncClient
+from traintracker.server import Server
+from traintracker.trackers import AccuracyTracker
+from traintracker.util.defs import *
+from tests.server_utils import serve_in_thread, received
+
+
+class TestAsyncClient(TestCase):
+    def test_concurrent_workers(self):
+        s = Server()
+        thread, address = serve_in_thread(s)
+        n_workers, n_steps = 50, 20
+
+        async def worker(tracker: AccuracyTracker):
+            for step in range(n_steps):
+                tracker.update(np.ones(4), np.ones(4), step)
+                await asyncio.sleep(0)
+
+        async def main():
+            client = AsyncClient()
+            # trackers may register before the connection is up
+            trackers = [AccuracyTracker(str(i), client) for i in range(n_workers)]
+            await client.connect(*address)
+            await asyncio.gather(*(worker(t) for t in trackers))
+            client.shutdown_server()
+            await client.close_connection()
+            # registrations, updates and the shutdown command
+            self.assertEqual(n_workers * (n_steps + 1) + 1, client.sent)
+            return trackers
+
+        trackers = asyncio.run(main())
+        thread.join(10)
+        self.assertFalse(thread.is_alive(), "Server should stop after the shutdown command.")
+        for tracker in trackers:
+            self.assertEqual(list(range(n_steps)), received(s, tracker._name)[:, -1].tolist())
+
+    def test_server_ids(self):
+        s = Server()
+        thread, address = serve_in_thread(s)
+
+        async def main():
+            first, second = AsyncClient(), AsyncClient()
+            first.add_plot(PlotType.accuracy, "a")
+            first.add_plot(PlotType.accuracy, "b")
+            # the second client's plot 0 is the first client's plot 1
+            second.add_plot(PlotType.accuracy, "b")
+            for client in (first, second):
+                await client.connect(*address)
+            ids = [await first.server_id(0), await first.server_id(1), await second.server_id(0)]
+            second.shutdown_server()
+            for client in (first, second):
+                await client.close_connection()
+            return ids
+
+        ids = asyncio.run(main())
+        thread.join(10)
+        self.assertEqual([s._registry["a"], s._registry["b"], s._registry["b"]], ids)
+        self.assertNotEqual(ids[0], ids[1])
+
+    def test_buffers_until_connected(self):
+        async def main():
+            client = AsyncClient()
+            client.update_plot(1, np.array([0.5, 1], dtype=np.float32))
+            self.assertGreater(client.pending, 0)
+            # nothing to write into yet, must not hang
+            await client.flush()
+            self.assertGreater(client.pending, 0)
+
+        asyncio.run(main())
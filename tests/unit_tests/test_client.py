@@ -0,0 +1,194 @@
+from unittest import TestCase
+import os
+import socket
+import tempfile
+import time
+
+from traintracker.client import Client
+from traintracker.server import Server
+from traintracker.sender import BackgroundSender
+from traintracker.protocol import HEADER, unpack_batch
+from traintracker.metric_log import read_log
+from traintracker.util.defs import *
+from tests.server_utils import serve_in_thread, kill_server, received
+
+
+class PartialWriteSocket(socket.socket):
+    """ Writes only the first ``limit`` bytes it is given, then fails. """
+    limit: int = 0
+
+    def send(self, data, flags=0):
+        if self.limit <= 0:
+            raise ConnectionResetError("Injected write failure.")
+        n = super(PartialWriteSocket, self).send(data[:self.limit], flags)
+        self.limit -= n
+        return n
+
+
+class TestBackgroundSender(TestCase):
+    def test_drop_newest(self):
+        a, b = socket.socketpair()
+        sender = BackgroundSender(a, capacity=2, policy=FullPolicy.drop_newest)
+        # sender thread is not started, so the buffer fills up deterministically
+        results = [sender.put(bytes([i])) for i in range(3)]
+        self.assertEqual([True, True, False], results)
+        self.assertEqual((2, 1, 2), (sender.queued, sender.dropped, sender.pending))
+        a.close()
+        b.close()
+
+    def test_drop_oldest_keeps_control_messages(self):
+        a, b = socket.socketpair()
+        sender = BackgroundSender(a, capacity=2, policy=FullPolicy.drop_oldest)
+        sender.put(b"c", droppable=False)
+        for data in (b"1", b"2", b"3"):
+            sender.put(data)
+        self.assertEqual(1, sender.dropped)
+        self.assertEqual([b"c", b"2", b"3"], [data for data, _ in sender._buffer])
+        a.close()
+        b.close()
+
+    def test_drains_in_order(self):
+        a, b = socket.socketpair()
+        sender = BackgroundSender(a, capacity=8)
+        sender.start()
+        expected = b"".join(bytes([i]) for i in range(100))
+        for i in range(100):
+            sender.put(bytes([i]))
+        sender.close()
+        received = b""
+        while len(received) < len(expected):
+            received += b.recv(BUFFSIZE)
+        self.assertEqual(expected, received)
+        self.assertEqual(100, sender.sent)
+        a.close()
+        b.close()
+
+    def test_partial_write_resends_only_unsent_messages(self):
+        a, b = socket.socketpair()
+        c, d = socket.socketpair()
+        torn = PartialWriteSocket(fileno=a.detach())
+        # the first message gets out whole, the second only half
+        torn.limit = 6
+        sender = BackgroundSender(torn, capacity=8, connect=lambda: c, handshake=lambda: [b"H"])
+        for data in (b"aaaa", b"bbbb", b"cccc"):
+            sender.put(data)
+        sender.start()
+        self.assertTrue(sender.drain(timeout=5))
+        sender.close()
+        resent = b""
+        while len(resent) < 9:
+            resent += d.recv(BUFFSIZE)
+        self.assertEqual(b"aaaabb", b.recv(BUFFSIZE))
+        self.assertEqual(b"Hbbbbcccc", resent)
+        self.assertEqual((1, 4), (sender.reconnects, sender.sent))
+        for s in (torn, b, c, d):
+            s.close()
+
+
+class TestClient(TestCase):
+    def test_background_update_plot(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        c = Client(background=True)
+        c.connect(*listener.getsockname())
+        conn, _ = listener.accept()
+
+        c.update_plot(7, np.array([1, 2, 3], dtype=np.float32))
+        # the server has nothing to reply
+        conn.shutdown(socket.SHUT_WR)
+        c.close_connection()
+        data = b""
+        while True:
+            chunk = conn.recv(BUFFSIZE)
+            if not chunk:
+                break
+            data += chunk
+        conn.close()
+        listener.close()
+
+        self.assertEqual((Cmd.update_plot, 7, 12), HEADER.unpack_from(data))
+        self.assertTrue(np.all(np.frombuffer(data[HEADER.size:], dtype=np.float32) == [1, 2, 3]))
+
+    def test_batch_coalesces_updates(self):
+        a, b = socket.socketpair()
+        c = Client()
+        c._socket = a
+        with c.batch():
+            for i in range(10):
+                c.update_plot(i % 2, np.array([i, i], dtype=np.float32))
+            c.update_plot(5, np.array([1, 2, 3], dtype=np.float32))
+            # nothing is sent before the batch exits
+            self.assertEqual(11, c._batch_size)
+        b.shutdown(socket.SHUT_WR)
+        c.close_connection()
+
+        data = b""
+        while True:
+            chunk = b.recv(BUFFSIZE)
+            if not chunk:
+                break
+            data += chunk
+        b.close()
+
+        widths = {}
+        while data:
+            cmd, _, size = HEADER.unpack_from(data)
+            self.assertEqual(Cmd.batch_update, cmd)
+            ids, rows = unpack_batch(data[HEADER.size: HEADER.size + size])
+            widths[rows.shape[1]] = (ids, rows)
+            data = data[HEADER.size + size:]
+        self.assertEqual({2, 3}, set(widths))
+        ids, rows = widths[2]
+        self.assertTrue(np.all(ids == np.arange(10) % 2))
+        self.assertTrue(np.all(rows[:, 0] == np.arange(10)))
+
+    def test_resilient_client_survives_server_restart(self):
+        first = Server()
+        thread, address = serve_in_thread(first)
+        c = Client(resilient=True)
+        plot_id = c.add_plot(PlotType.accuracy, "acc")
+        # updates made before connecting are buffered
+        c.update_plot(plot_id, np.array([0, 0]))
+        c.connect(*address)
+        c.update_plot(plot_id, np.array([0, 1]))
+        while first._stats.rows < 2:
+            time.sleep(.01)
+        kill_server(first, thread)
+
+        # the server is away, updates are buffered and never raise
+        for step in range(2, 5):
+            c.update_plot(plot_id, np.array([0, step]))
+        second = Server()
+        thread, _ = serve_in_thread(second, address[1])
+        c.update_plot(plot_id, np.array([0, 5]))
+        c.shutdown_server()
+        c.close_connection()
+        thread.join(10)
+
+        self.assertEqual(2, c.reconnects)
+        self.assertEqual({"acc": 0}, second._registry, "Registrations should be replayed.")
+        self.assertTrue(np.array_equal(np.arange(2, 6), received(second, "acc")[:, -1]))
+
+    def test_clients_sharing_a_log_dir_keep_their_own_logs(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            a, b, c = Client(run="a", log_dir=tmp), Client(run="b", log_dir=tmp), Client(run="c", log_dir=tmp)
+            # the first plot of each client has the same client id
+            a.update_plot(a.add_plot(PlotType.accuracy, "acc"), np.array([0.5, 1]))
+            b.update_plot(b.add_plot(PlotType.accuracy, "acc"), np.array([0.9, 1]))
+            c.update_plot(c.add_plot(PlotType.train_val_loss, "loss"), np.array([2, 3, 1]))
+            for client in (a, b, c):
+                client.close_connection()
+
+            logs = {}
+            for file_name in os.listdir(tmp):
+                info, rows = read_log(os.path.join(tmp, file_name))
+                logs[info.name] = np.array(rows)
+            self.assertEqual({"a/acc", "b/acc", "c/loss"}, set(logs))
+            self.assertTrue(np.array_equal([[0.5, 1]], logs["a/acc"]))
+            self.assertTrue(np.array_equal(np.array([[0.9, 1]], dtype=np.float32), logs["b/acc"]))
+            self.assertTrue(np.array_equal([[2, 3, 1]], logs["c/loss"]))
+
+    def test_resilient_rejects_shared_memory(self):
+        with self.assertRaises(ValueError):
+            Client(resilient=True, shared_memory=True)
@@ -0,0 +1,36 @@
+from unittest import TestCase
+
+from traintracker.util.column_store import ColumnStore
+from traintracker.util.defs import *
+
+
+class TestColumnStore(TestCase):
+    def test_grows_and_keeps_values(self):
+        store = ColumnStore({"x": np.float32, "step": np.int64}, capacity=2)
+        store.append(0.5, 0)
+        store.extend(np.array([[1.5, 1], [2.5, 2], [3.5, 3]]))
+        store.extend_columns(np.array([4.5]), np.array([4]))
+
+        self.assertEqual(5, len(store))
+        self.assertTrue(np.all(store["x"] == np.arange(5) + .5))
+        self.assertTrue(np.all(store["step"] == np.arange(5)))
+        self.assertEqual(np.int64, store["step"].dtype)
+
+    def test_columns_are_read_only_views(self):
+        store = ColumnStore({"x": np.float64})
+        store.extend_columns(np.arange(10))
+        view = store["x"]
+        with self.assertRaises(ValueError):
+            view[0] = 1
+        # the store itself is still writable
+        store.append(10)
+        self.assertEqual(10, store["x"][-1])
+
+    def test_keep_last(self):
+        store = ColumnStore({"x": np.float64})
+        store.extend_columns(np.arange(10))
+        store.append(10)
+        store.keep_last(3)
+        self.assertEqual([8, 9, 10], store["x"].tolist())
+        store.append(11)
+        self.assertEqual([8, 9, 10, 11], store["x"].tolist())
@@ -0,0 +1,54 @@
+from unittest import TestCase
+from unittest.mock import patch
+from bokeh.core.validation import check_integrity
+from bokeh.document.document import Document
+from bokeh.plotting.figure import Figure
+
+from traintracker.dashboard import Dashboard
+from traintracker.tracker_plots import TrackerPlot
+from traintracker.util.defs import *
+
+
+def build_plots(n: int, first_id: int = 0) -> List[TrackerPlot]:
+    return [TrackerPlot.build_plot(PlotType.accuracy, str(i), i) for i in range(first_id, first_id + n)]
+
+
+class TestDashboard(TestCase):
+    def setUp(self):
+        self.doc = Document()
+        self.plots = build_plots(3)
+        self.dashboard = Dashboard(self.doc, self.plots, page_size=4, n_columns=2)
+
+    def test_new_plots_are_inserted_in_place(self):
+        events = []
+        self.doc.on_change(events.append)
+        plot = build_plots(1, 3)[0]
+        self.dashboard.add_plot(plot)
+
+        self.assertEqual(1, len(plot.views))
+        self.assertEqual(1, len(events), "Only the new figure's cell should change.")
+        self.assertIs(self.dashboard._cells[3], events[0].model)
+        self.assertEqual([plot.views[0].fig], events[0].model.children)
+        self.assertFalse(self.dashboard._pager.visible)
+
+    def test_pages(self):
+        later = build_plots(3, 3)
+        for plot in later:
+            self.dashboard.add_plot(plot)
+        self.assertEqual(2, self.dashboard.n_pages)
+        self.assertTrue(self.dashboard._pager.visible)
+        self.assertEqual([1, 1, 1, 1, 0, 0], [len(plot.views) for plot in self.plots + later])
+
+        # only the page shown has views, the others cost nothing
+        self.dashboard._pager.value = "2"
+        self.assertEqual([0, 0, 0, 0, 1, 1], [len(plot.views) for plot in self.plots + later])
+        self.assertEqual([True, True, False, False],
+                         [isinstance(cell.children[0], Figure) for cell in self.dashboard._cells])
+
+        self.dashboard.close()
+        self.assertTrue(all(not plot.views for plot in self.plots + later))
+
+    def test_no_empty_layouts(self):
+        with patch("bokeh.core.validation.check.log") as log:
+            check_integrity(self.doc.roots[0].references())
+        log.warning.assert_not_called()
@@ -0,0 +1,35 @@
+from unittest import TestCase
+
+from traintracker.downsample import MinMaxDecimator
+from traintracker.util.column_store import ColumnStore
+from traintracker.util.defs import *
+
+
+class TestMinMaxDecimator(TestCase):
+    def test_bounded_and_keeps_extremes(self):
+        rng = np.random.RandomState(0)
+        store = ColumnStore({"y": np.float32, "step": np.float32})
+        decimator = MinMaxDecimator(["y"], max_points=200)
+        for _ in range(50):
+            # values arrive in blocks of varying size
+            n = rng.randint(1, 500)
+            store.extend_columns(rng.normal(size=n), np.arange(len(store), len(store) + n))
+            selected = decimator.update(store)
+
+            self.assertLessEqual(len(selected), 200 + 3)
+            self.assertTrue(np.all(np.diff(selected) > 0), "Selected rows should be sorted and unique.")
+            self.assertEqual(len(store) - 1, selected[-1], "The latest row should always be shown.")
+            y = store["y"]
+            self.assertIn(np.argmax(y), selected)
+            self.assertIn(np.argmin(y), selected)
+
+    def test_incremental_matches_from_scratch(self):
+        values = np.sin(np.arange(5000) / 50).astype(np.float32)
+        incremental = MinMaxDecimator(["y"], max_points=100)
+        store = ColumnStore({"y": np.float32})
+        for block in np.array_split(values, 37):
+            store.extend_columns(block)
+            selected = incremental.update(store)
+
+        scratch = MinMaxDecimator(["y"], max_points=100)
+        self.assertTrue(np.array_equal(scratch.update(store), selected))
@@ -0,0 +1,88 @@
+from unittest import TestCase, skipUnless
+import importlib.util
+import os
+import tempfile
+
+from traintracker.export import Exporter, read_export
+from traintracker.server import Server
+from traintracker.trackers import TrainValLossTracker
+from traintracker.util.column_store import ColumnStore
+from traintracker.util.defs import *
+
+
+class TestExport(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dtypes = {"loss": np.float64, "step": np.int64}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def export_rows(self, path: str) -> Exporter:
+        store = ColumnStore(self.dtypes)
+        store.extend_columns(np.arange(10) / 2, np.arange(10))
+        exporter = Exporter(path, self.dtypes, chunk_rows=4)
+        exporter.write_store(store)
+        for step in range(10, 15):
+            exporter.append(step / 2, step)
+        exporter.extend(np.array([[7.5, 15], [8, 16]]))
+        exporter.close()
+        return exporter
+
+    def test_npz_round_trip(self):
+        path = os.path.join(self.tmp.name, "run.npz")
+        exporter = self.export_rows(path)
+        self.assertEqual(17, exporter.rows)
+
+        columns = read_export(path)
+        self.assertEqual(["loss", "step"], list(columns))
+        self.assertEqual(np.int64, columns["step"].dtype)
+        self.assertTrue(np.array_equal(np.arange(17), columns["step"]))
+        self.assertTrue(np.array_equal(np.arange(17) / 2, columns["loss"]))
+        # chunks of the stored history, then of the staged rows
+        with np.load(path) as archive:
+            self.assertEqual(["loss/00000000", "step/00000000"], archive.files[:2])
+            self.assertEqual(2 * 5, len(archive.files))
+
+        with self.assertRaises(ValueError):
+            Exporter(os.path.join(self.tmp.name, "run.csv"), self.dtypes)
+
+    @skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+    def test_parquet_round_trip(self):
+        path = os.path.join(self.tmp.name, "run.parquet")
+        self.export_rows(path)
+        columns = read_export(path)
+        self.assertTrue(np.array_equal(np.arange(17), columns["step"]))
+        self.assertTrue(np.array_equal(np.arange(17) / 2, columns["loss"]))
+
+    def test_tracker_export(self):
+        path = os.path.join(self.tmp.name, "loss.npz")
+        tracker = TrainValLossTracker("loss")
+        tracker.update_many(np.arange(5.), np.arange(5.) + 1, np.arange(5))
+        tracker.export(path, chunk_rows=3)
+        with self.assertRaises(ValueError):
+            tracker.export(path)
+        for step in range(5, 10):
+            tracker.update(step, step + 1, step)
+        tracker.update_many(np.arange(10., 12.), np.arange(11., 13.), np.arange(10, 12))
+        tracker.close_export()
+
+        columns = read_export(path)
+        for values, exported in zip(tracker.get_all_tracked(as_np=True), columns.values()):
+            self.assertTrue(np.array_equal(values, exported))
+
+    def test_server_export(self):
+        path = os.path.join(self.tmp.name, "acc.npz")
+        s = Server()
+        plot_id = s._add_plot(PlotType.accuracy, "a/acc")
+        rows = np.stack([np.linspace(0, 1, 100), np.arange(100)], axis=1).astype(np.float32)
+        s._record(plot_id, rows[:40])
+        s.export("a/acc", path, chunk_rows=16)
+        s._record(plot_id, rows[40:])
+        s.close_export("a/acc")
+
+        columns = read_export(path)
+        self.assertTrue(np.array_equal(rows[:, 0], columns["acc"]))
+        self.assertTrue(np.array_equal(rows[:, 1], columns["step"]))
+        with self.assertRaises(ValueError):
+            s.export("missing", path)
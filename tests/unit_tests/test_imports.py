@@ -0,0 +1,15 @@
+from unittest import TestCase
+import subprocess
+import sys
+
+# what a trainer must never load, see also benchmarks/bench_import.py
+SERVER_ONLY = ("bokeh", "tornado", "dask", "asyncio")
+
+
+class TestImports(TestCase):
+    def test_trainer_loads_no_server_modules(self):
+        # a fresh interpreter, so that nothing imported by other tests counts
+        code = ("import sys; import traintracker.trackers, traintracker.client\n"
+                f"print(' '.join(m for m in {SERVER_ONLY!r} if m in sys.modules))")
+        out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+        self.assertEqual([], out.split(), f"A trainer should not import any of {SERVER_ONLY}.")
@@ -0,0 +1,46 @@
+from unittest import TestCase
+import os
+import tempfile
+
+from traintracker.metric_log import MetricLog, INITIAL_ROWS, read_log, read_log_info
+from traintracker.util.defs import *
+
+
+class TestMetricLog(TestCase):
+    def test_append_grow_and_read(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "1.ttlog")
+            log = MetricLog(path, PlotType.train_val_loss, "loss", 1, 3)
+            rows = np.arange(3 * (INITIAL_ROWS + 10), dtype=np.float32).reshape(-1, 3)
+            log.append(rows[0])
+            log.append(rows[1:])
+            log.close()
+
+            info, read = read_log(path)
+            self.assertEqual((PlotType.train_val_loss, 1, "loss", 3, len(rows)), tuple(info))
+            self.assertIsInstance(read, np.memmap)
+            self.assertTrue(np.array_equal(rows, read))
+
+    def test_only_synced_rows_are_visible(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "1.ttlog")
+            log = MetricLog(path, PlotType.accuracy, "acc", 1, 2, sync_every=4, sync_interval=60)
+            for step in range(6):
+                log.append(np.array([.5, step]))
+            # the first batch of 4 rows was synced, the last 2 were not yet
+            self.assertEqual(4, read_log_info(path).rows)
+            log.close()
+            self.assertEqual(6, read_log_info(path).rows)
+
+    def test_reopen_continues(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "1.ttlog")
+            log = MetricLog(path, PlotType.accuracy, "acc", 1, 2)
+            log.append(np.array([[.5, 0], [.6, 1]]))
+            log.close()
+            log = MetricLog(path, PlotType.accuracy, "acc", 1, 2)
+            log.append(np.array([.7, 2]))
+            log.close()
+
+            _, read = read_log(path)
+            self.assertTrue(np.allclose(read, [[.5, 0], [.6, 1], [.7, 2]]))
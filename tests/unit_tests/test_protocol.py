@@ -0,0 +1,77 @@
+from unittest import TestCase
+import asyncio
+import numpy as np
+
+from traintracker.protocol import *
+from traintracker.util.defs import *
+
+
+class TestBatch(TestCase):
+    def test_pack_unpack_roundtrip(self):
+        plot_ids = [3, 1, 3, 2]
+        rows = np.arange(12, dtype=np.float32).reshape(4, 3)
+        frame = pack_batch(plot_ids, rows)
+
+        cmd, _, size = HEADER.unpack_from(frame)
+        self.assertEqual(Cmd.batch_update, cmd)
+        self.assertEqual(len(frame) - HEADER.size, size)
+        ids, decoded = unpack_batch(frame[HEADER.size:])
+        self.assertTrue(np.all(ids == plot_ids))
+        self.assertTrue(np.all(decoded == rows))
+
+    def test_split_by_plot_keeps_row_order(self):
+        ids = np.array([3, 1, 3, 2])
+        rows = np.arange(8, dtype=np.float32).reshape(4, 2)
+        groups = dict(split_by_plot(ids, rows))
+
+        self.assertEqual([1, 2, 3], sorted(groups))
+        self.assertTrue(np.all(groups[3] == rows[[0, 2]]))
+        self.assertTrue(np.all(groups[1] == rows[[1]]))
+
+
+class TestFrameReader(TestCase):
+    def test_fragmented_stream(self):
+        frames = [pack_add_plot(PlotType.accuracy, "acc", 9),
+                  pack_update(9, np.array([0.5, 1])),
+                  pack_batch([9, 9], np.array([[0.25, 2], [0.75, 3]])),
+                  pack_frame(Cmd.server_shutdown)]
+        stream = b"".join(frames)
+
+        async def read_all():
+            reader = asyncio.StreamReader()
+            # deliver the stream in awkward pieces that split headers and payloads
+            for i in range(0, len(stream), 5):
+                reader.feed_data(stream[i: i + 5])
+            reader.feed_eof()
+            frame_reader = FrameReader(reader)
+            read = []
+            while True:
+                frame = await frame_reader.read_frame()
+                if frame is None:
+                    return read
+                read.append(frame)
+
+        read = asyncio.run(read_all())
+        self.assertEqual([Cmd.add_plot, Cmd.update_plot, Cmd.batch_update, Cmd.server_shutdown],
+                         [cmd for cmd, _, _ in read])
+        self.assertEqual((PlotType.accuracy, "acc", 0, ""), unpack_add_plot(read[0][2]))
+        self.assertTrue(np.all(np.frombuffer(read[1][2], dtype=np.float32) == [0.5, 1]))
+        _, rows = unpack_batch(read[2][2])
+        self.assertTrue(np.all(rows == [[0.25, 2], [0.75, 3]]))
+
+    def test_unknown_and_truncated_frames(self):
+        unknown = HEADER.pack(max(Cmd) + 1, 0, 4) + bytes(4)
+
+        async def read_all():
+            reader = asyncio.StreamReader()
+            reader.feed_data(unknown + pack_frame(Cmd.stats) + pack_update(1, np.array([0.5, 1]))[:-2])
+            reader.feed_eof()
+            frame_reader = FrameReader(reader)
+            with self.assertRaises(ValueError):
+                await frame_reader.read_frame()
+            # the unknown frame was read whole
+            self.assertEqual(Cmd.stats, (await frame_reader.read_frame())[0])
+            with self.assertRaises(asyncio.IncompleteReadError):
+                await frame_reader.read_frame()
+
+        asyncio.run(read_all())
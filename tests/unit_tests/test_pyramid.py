@@ -0,0 +1,45 @@
+from unittest import TestCase
+import numpy as np
+
+from traintracker.pyramid import Pyramid, FANOUT
+from traintracker.util.column_store import ColumnStore
+
+
+def brute_force(steps, values, bucket_starts, stop):
+    edges = np.append(bucket_starts, stop + 1)
+    buckets = [(steps >= lo) & (steps < hi) for lo, hi in zip(edges[:-1], edges[1:])]
+    return ([values[b].mean() for b in buckets], [values[b].min() for b in buckets],
+            [values[b].max() for b in buckets], [b.sum() for b in buckets])
+
+
+class TestPyramid(TestCase):
+    def setUp(self):
+        self.store = ColumnStore({"loss": np.float32, "step": np.float32})
+        self.pyramid = Pyramid(self.store.columns, "step")
+        self.values = np.random.RandomState(0).rand(10000).astype(np.float32)
+        self.steps = np.arange(len(self.values), dtype=np.float32)
+        # blocks of uneven sizes, as they arrive
+        for block in np.array_split(np.stack([self.values, self.steps], axis=1), 37):
+            self.store.extend(block)
+            self.pyramid.update(self.store)
+
+    def test_levels_summarize_complete_buckets(self):
+        self.assertEqual(4, self.pyramid.depth)
+        self.assertEqual(len(self.values) // FANOUT ** 2, len(self.pyramid._levels[1]))
+
+    def test_query_matches_brute_force(self):
+        for start, stop, max_points in ((0, 9999, 100), (13, 8765, 50), (1000, 1100, 30), (5, 9, 100)):
+            result = self.pyramid.query(self.store, start, stop, max_points)
+            self.assertLessEqual(len(result["count"]), max_points + 2)
+            self.assertEqual(stop - start + 1, result["count"].sum())
+            mean, low, high, count = brute_force(self.steps, self.values, result["step"], stop)
+            self.assertTrue(np.allclose(mean, result["loss"], rtol=1e-5))
+            self.assertTrue(np.array_equal(low, result["loss_min"]))
+            self.assertTrue(np.array_equal(high, result["loss_max"]))
+            self.assertTrue(np.array_equal(count, result["count"]))
+
+    def test_small_ranges_return_raw_rows(self):
+        result = self.pyramid.query(self.store, 10, 19)
+        self.assertTrue(np.array_equal(self.values[10:20], result["loss"]))
+        self.assertTrue(np.all(result["count"] == 1))
+        self.assertEqual(0, len(self.pyramid.query(self.store, 20000, 30000)["step"]))
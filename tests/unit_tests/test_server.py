@@ -1,20 +1,383 @@
 from unittest import TestCase
+import asyncio
+import multiprocessing as mp
+import socket
+import tempfile
+import time
+from bokeh.document.document import Document
 
+from traintracker.client import Client
 from traintracker.server import Server
 from traintracker.tracker_plots import SOURCE_FORMATS
+from traintracker.protocol import HEADER, pack_batch
+from traintracker.trackers import TrainValLossTracker
 from traintracker.util.defs import *
+from tests.server_utils import serve_in_thread, received
+
+
+def run_rank(address: Tuple[str, int], rank: int, world_size: int, barrier) -> None:
+    c = Client(rank=rank, world_size=world_size)
+    c.connect(*address)
+    tracker = TrainValLossTracker("loss", c)
+    # every rank stays connected until the server has seen all of them, or it would stop early
+    barrier.wait()
+    for step in range(20):
+        if rank == 1 and step == 5:
+            continue
+        tracker.update(rank + step, -rank, step)
+    c.shutdown_server()
+    c.close_connection()
 
 
 class TestServer(TestCase):
     def test_add_plot(self):
         name = "tvl"
-        id_ = 12345678
         s = Server()
-        s._add_plot(PlotType.train_val_loss, name, id_)
-        p = s._plots[id_]
+        id_ = s._add_plot(PlotType.train_val_loss, name)
+        source = s._plots[id_].add_view(Document()).source
         src = SOURCE_FORMATS[PlotType.train_val_loss]
-        self.assertTrue(p.source.data.keys() == src.keys(),
+        self.assertTrue(source.data.keys() == src.keys(),
                         "Column source for new plot should have same keys as template.")
-        self.assertTrue(all([not ls for ls in p.source.data.values()]),
+        self.assertTrue(all([not ls for ls in source.data.values()]),
                         "All values (lists) for column source for new plot should be empty.")
         self.assertFalse((not s._queues[id_]), "Queue for new plot's data should have been initialized")
+
+    def test_batch_update(self):
+        s = Server()
+        s._add_plot(PlotType.accuracy, "a", plot_id=1)
+        s._add_plot(PlotType.accuracy, "b", plot_id=2)
+        rows = np.arange(12, dtype=np.float32).reshape(6, 2)
+        frame = pack_batch([1, 2, 1, 1, 2, 1], rows)
+
+        s._handle_batch_update(frame[HEADER.size:])
+        self.assertTrue(np.all(received(s, "a") == rows[[0, 2, 3, 5]]))
+        self.assertTrue(np.all(received(s, "b") == rows[[1, 4]]))
+
+    def test_block_update(self):
+        s = Server()
+        plot_id = s._add_plot(PlotType.train_val_loss, "tvl")
+        rows = np.arange(12, dtype=np.float32).reshape(4, 3)
+
+        s._handle_plot_update(plot_id, rows.tobytes())
+        self.assertTrue(np.all(received(s, "tvl") == rows))
+
+    def test_plots_are_registered_by_run_and_name(self):
+        s = Server()
+        thread, address = serve_in_thread(s)
+        c1, c2, other_run = Client(run="a"), Client(run="a"), Client(run="b")
+        for c in (c1, c2, other_run):
+            c.connect(*address)
+        other_run.add_plot(PlotType.accuracy, "other")
+        ids = [c.add_plot(PlotType.accuracy, "acc") for c in (c1, c2, other_run)]
+        self.assertEqual([0, 0, 1], ids, "Client ids are local to each client.")
+        server_ids = [c.server_id(plot_id) for c, plot_id in zip((c1, c2, other_run), ids)]
+
+        # a client that reconnects resumes its plots
+        c1.close_connection()
+        c1.connect(*address)
+        c1.update_plot(ids[0], np.array([0.5, 1]))
+        self.assertEqual(server_ids[0], c1.server_id(ids[0]))
+        for c in (c1, c2, other_run):
+            c.shutdown_server()
+            c.close_connection()
+        thread.join(10)
+
+        self.assertEqual(server_ids[0], server_ids[1])
+        self.assertEqual({"a/acc", "b/other", "b/acc"}, set(s._registry))
+        self.assertEqual([0, 1, 2], sorted(s._registry.values()), "Server ids should be dense.")
+        self.assertEqual(3, len(s._plots))
+        self.assertTrue(np.all(received(s, "a/acc") == [0.5, 1]))
+
+    def test_sessions_are_independent(self):
+        s = Server()
+        thread, address = serve_in_thread(s)
+        c1, c2 = Client(), Client()
+        c1.connect(*address)
+        c2.connect(*address)
+        while len(s._sessions) < 2:
+            time.sleep(.01)
+        id1 = c1.add_plot(PlotType.accuracy, "c1")
+        id2 = c2.add_plot(PlotType.accuracy, "c2")
+        c1.update_plot(id1, np.array([0.5, 1]))
+        c1.shutdown_server()
+        c1.close_connection()
+
+        # the second client keeps its session after the first one has left
+        c2.update_plot(id2, np.array([0.25, 1]))
+        c2.shutdown_server()
+        c2.close_connection()
+        thread.join(10)
+
+        self.assertFalse(thread.is_alive(), "Server should stop once the last session has left.")
+        self.assertTrue(np.all(received(s, "c1") == [0.5, 1]))
+        self.assertTrue(np.all(received(s, "c2") == [0.25, 1]))
+
+    def test_update_plots_only_touches_dirty_plots(self):
+        s = Server()
+        for plot_id in range(1, 4):
+            s._add_plot(PlotType.accuracy, str(plot_id), plot_id=plot_id)
+        doc = Document()
+        s._make_document(doc)
+        s._handle_plot_update(2, np.array([0.5, 1], dtype=np.float32).tobytes())
+        self.assertEqual({2}, s._dirty)
+        s._update_plots()
+        self.assertEqual(set(), s._dirty)
+        self.assertTrue(s._queues[2].empty())
+        self.assertEqual(1, len(doc.session_callbacks), "Only the dirty plot should be streamed.")
+
+    def test_plots_are_added_to_open_documents(self):
+        s = Server()
+        s._add_plot(PlotType.accuracy, "a")
+        doc = Document()
+        s._make_document(doc)
+        plot = s._plots[s._add_plot(PlotType.accuracy, "b")]
+        self.assertEqual([], plot.views, "Documents are only changed from their own callbacks.")
+        for callback in list(doc.session_callbacks):
+            callback.callback()
+        self.assertEqual(1, len(plot.views))
+
+        s._drop_dashboard(s._dashboards[0])
+        self.assertTrue(all(not plot.views for plot in s._plots))
+
+    def test_replay_logs(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            s = Server(log_dir=tmp)
+            s._add_plot(PlotType.accuracy, "acc", plot_id=7)
+            rows = np.array([[.5, 1], [.6, 2], [.7, 3]], dtype=np.float32)
+            s._handle_plot_update(7, rows[0].tobytes())
+            s._handle_batch_update(pack_batch([7, 7], rows[1:])[HEADER.size:])
+            for log in s._logs.values():
+                log.close()
+
+            restarted = Server(log_dir=tmp)
+            restarted._replay_logs()
+            self.assertEqual("acc", restarted._plots[7]._name)
+            self.assertTrue(np.array_equal(rows, received(restarted, "acc")))
+            # without a plot server nothing drains the queues, the rows are only kept by the plot
+            self.assertEqual(set(), restarted._dirty)
+            self.assertTrue(restarted._queues[7].empty())
+            self.assertTrue(np.array_equal(rows[:, 0], restarted._plots[7].snapshot()["acc"]))
+            for log in restarted._logs.values():
+                log.close()
+
+    def test_replay_client_logs(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            # every client numbers its plots from 0
+            a, other_a, b = Client(run="a", log_dir=tmp), Client(run="a", log_dir=tmp), Client(run="b", log_dir=tmp)
+            a.update_plot(a.add_plot(PlotType.accuracy, "acc"), np.array([.5, 1]))
+            other_a.update_plot(other_a.add_plot(PlotType.accuracy, "acc"), np.array([.7, 2]))
+            b.update_plot(b.add_plot(PlotType.train_val_loss, "loss"), np.array([2, 3, 1]))
+            for c in (a, other_a, b):
+                c.close_connection()
+
+            for _ in range(2):
+                # the second time, the server's own (empty) logs of the first replay are there too
+                s = Server(log_dir=tmp)
+                s._replay_logs()
+                self.assertEqual({"a/acc": 0, "b/loss": 1}, s._registry)
+                rows = received(s, "a/acc")
+                self.assertTrue(np.array_equal(np.array([[.5, 1], [.7, 2]], dtype=np.float32), rows[np.argsort(rows[:, 1])]))
+                self.assertTrue(np.array_equal([[2, 3, 1]], received(s, "b/loss")))
+                for log in s._logs.values():
+                    log.close()
+
+    def test_shared_memory_updates(self):
+        s = Server()
+        thread, address = serve_in_thread(s)
+        c = Client(shared_memory=True)
+        c.connect(*address)
+        plot_id = c.add_plot(PlotType.accuracy, "acc")
+        rows = np.arange(2000, dtype=np.float32).reshape(1000, 2)
+        for row in rows:
+            c.update_plot(plot_id, row)
+        c.shutdown_server()
+        c.close_connection()
+        thread.join(10)
+
+        self.assertTrue(np.array_equal(rows, received(s, "acc")))
+        self.assertEqual({}, s._rings)
+
+    def test_ranks_are_merged(self):
+        s = Server()
+        thread, address = serve_in_thread(s)
+        world_size = 3
+        ctx = mp.get_context("spawn")
+        barrier = ctx.Barrier(world_size + 1)
+        ranks = [ctx.Process(target=run_rank, args=(address, rank, world_size, barrier))
+                 for rank in range(world_size)]
+        for p in ranks:
+            p.start()
+        while len(s._sessions) < world_size:
+            time.sleep(.01)
+        barrier.wait()
+        for p in ranks:
+            p.join(60)
+        thread.join(10)
+
+        self.assertEqual({"loss": 0}, s._registry)
+        rows = received(s, "loss")
+        expected = np.array([[1 + step, -1, step] for step in range(20)], dtype=np.float32)
+        # rank 1 skipped step 5
+        expected[5] = [6, -1, 5]
+        self.assertTrue(np.array_equal(expected, rows))
+
+    def test_stats_query(self):
+        s = Server()
+        thread, address = serve_in_thread(s)
+        c = Client()
+        c.connect(*address)
+        plot_id = c.add_plot(PlotType.accuracy, "acc")
+        c.update_plot(plot_id, np.array([[0.5, 1], [0.6, 2]]))
+        stats = c.server_stats()
+        c.shutdown_server()
+        c.close_connection()
+        thread.join(10)
+
+        self.assertEqual({"add_plot": 1, "update_plot": 1, "stats": 1}, stats["messages"])
+        self.assertEqual(16, stats["bytes"]["update_plot"])
+        self.assertEqual(2, stats["rows"])
+        # nothing is queued without a plot server to stream it
+        self.assertEqual({"0": 0}, stats["queue_depth"])
+        self.assertEqual(1, stats["sessions"])
+
+    def test_bad_messages_are_skipped(self):
+        s = Server()
+        thread, address = serve_in_thread(s)
+        c = Client()
+        c.connect(*address)
+        plot_id = c.add_plot(PlotType.accuracy, "acc")
+        # a plot the client never registered, and a row of the wrong width
+        c.update_plot(plot_id + 1, np.array([0.5, 1]))
+        c.update_plot(plot_id, np.array([0.5, 0.5, 1]))
+        c.update_plot(plot_id, np.array([0.6, 2]))
+        stats = c.server_stats()
+        c.shutdown_server()
+        c.close_connection()
+        thread.join(10)
+
+        self.assertEqual({"update_plot": 2}, stats["errors"])
+        self.assertEqual(1, stats["sessions"], "The session should survive bad messages.")
+        self.assertTrue(np.array_equal(np.array([[0.6, 2]], dtype=np.float32), received(s, "acc")))
+
+    def test_unknown_and_truncated_messages(self):
+        s = Server()
+        thread, address = serve_in_thread(s)
+        errors = []
+        thread.loop.call_soon_threadsafe(thread.loop.set_exception_handler, lambda loop, context: errors.append(context))
+        c = Client()
+        c.connect(*address)
+        c._socket.sendall(HEADER.pack(max(Cmd) + 1, 0, 4) + bytes(4))
+        stats = c.server_stats()
+        truncated = socket.create_connection(address)
+        truncated.sendall(HEADER.pack(Cmd.update_plot, 0, 8) + bytes(4))
+        truncated.close()
+        time.sleep(.1)
+        while len(s._sessions) > 1:
+            time.sleep(.01)
+        c.shutdown_server()
+        c.close_connection()
+        thread.join(10)
+
+        self.assertEqual(1, stats["unknown_commands"])
+        self.assertEqual(1, stats["sessions"], "The session should survive an unknown command.")
+        self.assertEqual([], errors, "A truncated message should end its session cleanly.")
+
+    def test_stats_http_endpoint(self):
+        s = Server()
+        s._add_plot(PlotType.accuracy, "acc")
+
+        async def get() -> bytes:
+            listener = await asyncio.start_server(s._handle_stats_request, "127.0.0.1", 0)
+            reader, writer = await asyncio.open_connection(*listener.sockets[0].getsockname())
+            writer.write(b"GET /metrics HTTP/1.0\r\nHost: localhost\r\n\r\n")
+            response = await reader.read()
+            writer.close()
+            listener.close()
+            await listener.wait_closed()
+            return response
+
+        response = asyncio.run(get())
+        head, body = response.split(b"\r\n\r\n", 1)
+        self.assertTrue(head.startswith(b"HTTP/1.0 200 OK"))
+        self.assertIn(b'traintracker_queue_depth{plot="0"} 0\n', body)
+
+    def test_query(self):
+        s = Server()
+        thread, address = serve_in_thread(s)
+        c = Client(run="a")
+        c.connect(*address)
+        plot_id = c.add_plot(PlotType.accuracy, "acc")
+        rows = np.stack([np.linspace(0, 1, 5000), np.arange(5000)], axis=1)
+        c.update_plot(plot_id, rows)
+        result = c.query("acc", start=1000, max_points=100)
+        with self.assertRaises(ValueError):
+            c.query("missing")
+        c.shutdown_server()
+        c.close_connection()
+        thread.join(10)
+
+        self.assertLessEqual(len(result["count"]), 102)
+        self.assertEqual(4000, result["count"].sum())
+        self.assertEqual(1000, result["step"][0])
+        self.assertTrue(np.allclose(rows[1000:, 0].max(), result["acc_max"].max()))
+
+    def test_leaving_rank_only_finishes_its_own_job(self):
+        s = Server()
+        thread, address = serve_in_thread(s)
+        a0, b0, b1 = Client(run="a", rank=0, world_size=2), Client(run="b", rank=0, world_size=2), \
+            Client(run="b", rank=1, world_size=2)
+        ids = {}
+        for c in (a0, b0, b1):
+            c.connect(*address)
+            ids[c] = c.add_plot(PlotType.accuracy, "acc")
+        b0.update_plot(ids[b0], np.array([0, 0]))
+        b1.update_plot(ids[b1], np.array([1, 0]))
+        for c in (a0, b0, b1):
+            c.server_id(ids[c])
+        # rank 0 of job a leaves, job b must keep waiting for its own rank 0
+        a0.close_connection()
+        while len(s._sessions) > 2:
+            time.sleep(.01)
+        b1.update_plot(ids[b1], np.array([[1, 1], [1, 2]]))
+        b1.server_id(ids[b1])
+        b0.update_plot(ids[b0], np.array([[0, 1], [0, 2]]))
+        for c in (b0, b1):
+            c.shutdown_server()
+            c.close_connection()
+        thread.join(10)
+
+        store = s._plots[s._registry["b/acc"]].store
+        self.assertTrue(np.array_equal([0.5, 0.5, 0.5], store["acc"]))
+        self.assertTrue(np.array_equal([0, 1, 2], store["step"]))
+
+    def test_reconnecting_rank_is_merged_again(self):
+        s = Server()
+        thread, address = serve_in_thread(s)
+        r0, r1 = Client(rank=0, world_size=2), Client(rank=1, world_size=2)
+        ids = {}
+        for c in (r0, r1):
+            c.connect(*address)
+            ids[c] = c.add_plot(PlotType.accuracy, "acc")
+        r0.update_plot(ids[r0], np.array([0, 0]))
+        r1.update_plot(ids[r1], np.array([1, 0]))
+        r0.server_id(ids[r0])
+        r0.close_connection()
+        while len(s._sessions) > 1:
+            time.sleep(.01)
+        # without rank 0, rank 1's steps are released alone
+        r1.update_plot(ids[r1], np.array([[1, 1], [1, 2]]))
+        r1.server_id(ids[r1])
+
+        r0.connect(*address)
+        # the steps released while rank 0 was away are not released again
+        r0.update_plot(ids[r0], np.array([[0, 1], [0, 2], [0, 3]]))
+        r0.server_id(ids[r0])
+        r1.update_plot(ids[r1], np.array([1, 3]))
+        for c in (r0, r1):
+            c.shutdown_server()
+            c.close_connection()
+        thread.join(10)
+
+        store = s._plots[s._registry["acc"]].store
+        self.assertTrue(np.array_equal([0.5, 1, 1, 0.5], store["acc"]))
+        self.assertTrue(np.array_equal([0, 1, 2, 3], store["step"]))
@@ -0,0 +1,24 @@
+from unittest import TestCase
+import os
+
+from traintracker.shm_ring import ShmRing
+from traintracker.util.defs import *
+
+
+class TestShmRing(TestCase):
+    def test_wraps_around_and_drops_when_full(self):
+        producer = ShmRing.create(f"tt_test_{os.getpid()}", capacity=4, width=2)
+        consumer = ShmRing.attach(producer.name)
+        rows = np.arange(20, dtype=np.float32).reshape(10, 2)
+
+        self.assertEqual(3, producer.push(rows[:3]))
+        self.assertTrue(np.array_equal(rows[:3], consumer.pop_all()))
+        # write position wraps around the end of the ring
+        self.assertEqual(3, producer.push(rows[3:6]))
+        self.assertEqual(1, producer.push(rows[6:8]))
+        self.assertEqual(1, producer.dropped)
+        self.assertTrue(np.array_equal(rows[3:7], consumer.pop_all()))
+        self.assertEqual(0, len(consumer.pop_all()))
+
+        consumer.close()
+        producer.close()
@@ -0,0 +1,42 @@
+from unittest import TestCase
+
+from traintracker.stats import Histogram, ServerStats, format_text
+from traintracker.util.defs import *
+
+
+class TestHistogram(TestCase):
+    def test_quantiles_are_bucket_upper_bounds(self):
+        h = Histogram()
+        for _ in range(90):
+            h.record(3e-6)
+        for _ in range(10):
+            h.record(1e-3)
+        summary = h.summary()
+
+        self.assertEqual(100, summary["count"])
+        self.assertAlmostEqual(90 * 3e-6 + 10 * 1e-3, summary["sum"])
+        # 3us falls in [2us, 4us), 1ms in [512us, 1024us)
+        self.assertEqual(4e-6, summary["p50"])
+        self.assertEqual(1e-3, summary["p99"], "Estimates never exceed the maximum.")
+
+    def test_empty(self):
+        self.assertEqual(0., Histogram().quantile(.5))
+
+
+class TestServerStats(TestCase):
+    def test_text_format(self):
+        stats = ServerStats()
+        stats.count_message(Cmd.update_plot, 12)
+        stats.count_message(Cmd.update_plot, 12)
+        stats.count_error(Cmd.update_plot)
+        stats.unknown_commands += 1
+        stats.ticks.record(.001)
+        text = format_text(stats.snapshot({3: 5}, sessions=1))
+
+        self.assertIn('traintracker_messages_total{cmd="update_plot"} 2\n', text)
+        self.assertIn('traintracker_received_bytes_total{cmd="update_plot"} 24\n', text)
+        self.assertIn('traintracker_errors_total{cmd="update_plot"} 1\n', text)
+        self.assertIn("traintracker_unknown_commands_total 1\n", text)
+        self.assertIn('traintracker_queue_depth{plot="3"} 5\n', text)
+        self.assertIn("traintracker_tick_seconds_count 1\n", text)
+        self.assertNotIn("add_plot", text, "Commands never received are left out.")
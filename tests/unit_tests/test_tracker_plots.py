@@ -0,0 +1,139 @@
+from unittest import TestCase
+from queue import Queue
+from bokeh.document.document import Document
+
+from traintracker.tracker_plots import TrackerPlot, Retention
+from traintracker.transforms import EMA, CumMin
+from traintracker.util.defs import *
+
+
+def run_next_tick_callbacks(doc: Document) -> None:
+    """ Run pending next tick callbacks, as the Bokeh server would. """
+    for callback in list(doc.session_callbacks):
+        callback.callback()
+
+
+class TestTrackerPlot(TestCase):
+    def test_update_from_queue_streams_once(self):
+        plot = TrackerPlot.build_plot(PlotType.accuracy, "acc", 1)
+        doc = Document()
+        view = plot.add_view(doc)
+        doc.add_root(view.fig)
+        queue = Queue()
+        queue.put(np.array([0.1, 1], dtype=np.float32))
+        queue.put(np.array([[0.2, 2], [0.3, 3]], dtype=np.float32))
+        queue.put(np.array([0.4, 4], dtype=np.float32))
+
+        plot.update_from_queue(queue)
+        self.assertEqual(1, len(doc.session_callbacks), "Queued rows should be streamed in one call.")
+        run_next_tick_callbacks(doc)
+        self.assertTrue(np.all(np.asarray(view.source.data["step"]) == [1, 2, 3, 4]))
+        self.assertTrue(np.allclose(view.source.data["acc"], [0.1, 0.2, 0.3, 0.4]))
+
+    def test_transforms_are_streamed_as_extra_columns(self):
+        plot = TrackerPlot.build_plot(PlotType.train_val_loss, "loss", 1,
+                                      transforms=[EMA("train", alpha=.5), CumMin("val")])
+        doc = Document()
+        view = plot.add_view(doc)
+        doc.add_root(view.fig)
+        for rows in (np.array([[4, 3, 1], [2, 5, 2]]), np.array([4, 1, 3])):
+            plot.update(rows)
+            run_next_tick_callbacks(doc)
+
+        self.assertTrue(np.allclose(view.source.data["train_ema"], [4, 3, 3.5]))
+        self.assertTrue(np.allclose(view.source.data["val_min"], [3, 3, 1]))
+        self.assertTrue(np.allclose(plot.store["val_min"], [3, 3, 1]))
+        with self.assertRaises(ValueError):
+            TrackerPlot.build_plot(PlotType.accuracy, "acc", 2, transforms=[EMA("loss")])
+
+    def test_rollover_retention(self):
+        plot = TrackerPlot.build_plot(PlotType.accuracy, "acc", 1, Retention.rolling(window=5))
+        doc = Document()
+        view = plot.add_view(doc)
+        doc.add_root(view.fig)
+        for step in range(3):
+            plot.update(np.array([[0.5, 4 * step], [0.5, 4 * step + 1], [0.5, 4 * step + 2], [0.5, 4 * step + 3]]))
+            run_next_tick_callbacks(doc)
+
+        self.assertTrue(np.all(np.asarray(view.source.data["step"]) == [7, 8, 9, 10, 11]))
+        self.assertEqual(12, len(plot.store), "The server should keep the full history.")
+
+    def test_decimated_retention(self):
+        plot = TrackerPlot.build_plot(PlotType.train_val_loss, "loss", 1, Retention.decimated(max_points=100))
+        doc = Document()
+        view = plot.add_view(doc)
+        doc.add_root(view.fig)
+        steps = np.arange(10000)
+        rows = np.stack([np.cos(steps / 100), np.sin(steps / 100), steps], axis=1)
+        for block in np.array_split(rows, 10):
+            plot.update(block)
+            run_next_tick_callbacks(doc)
+
+        self.assertLessEqual(len(view.source.data["step"]), 100 + 3)
+        self.assertEqual(9999, view.source.data["step"][-1])
+        self.assertEqual(10000, len(plot.store))
+
+    def test_confusion_matrix_accumulates_deltas(self):
+        plot = TrackerPlot.build_plot(PlotType.confusion_matrix, "cm", 1, width=5)
+        doc = Document()
+        view = plot.add_view(doc)
+        doc.add_root(view.fig)
+        plot.update(np.array([[3, 1, 0, 4, 1], [1, 0, 1, 2, 2]], dtype=np.float32))
+        run_next_tick_callbacks(doc)
+
+        self.assertTrue(np.all(plot.matrix == [[4, 1], [1, 6]]))
+        self.assertTrue(np.all(view.source.data["count"] == [4, 1, 1, 6]))
+        self.assertTrue(np.allclose(view.source.data["rate"], [.8, .2, 1 / 7, 6 / 7]))
+        with self.assertRaises(ValueError):
+            TrackerPlot.build_plot(PlotType.confusion_matrix, "cm", 2, width=6)
+
+    def test_confusion_matrix_memory_is_bounded(self):
+        window = 10
+        plot = TrackerPlot.build_plot(PlotType.confusion_matrix, "cm", 1, Retention.rolling(window), width=5)
+        for step in range(100):
+            plot.update(np.array([1, 0, 0, 1, step], dtype=np.float32))
+
+        self.assertLessEqual(len(plot.store), 2 * window)
+        self.assertEqual(99, plot.store["step"][-1])
+        self.assertTrue(np.all(plot.matrix == [[100, 0], [0, 100]]))
+
+    def test_histogram_memory_is_bounded(self):
+        n_bins, window = 4, 10
+        plot = TrackerPlot.build_plot(PlotType.histogram, "h", 1, Retention.rolling(window), width=n_bins + 3)
+        doc = Document()
+        view = plot.add_view(doc)
+        doc.add_root(view.fig)
+        for step in range(50):
+            plot.update(np.array([1, 2, 3, 4, -1, 1, step], dtype=np.float32))
+            run_next_tick_callbacks(doc)
+
+        self.assertLessEqual(len(plot.store), 2 * window)
+        self.assertEqual(49, plot.store["step"][-1])
+        self.assertEqual(window * n_bins, len(view.source.data["x"]))
+        self.assertTrue(np.allclose(view.source.data["center"][-n_bins:], [-.75, -.25, .25, .75]))
+        self.assertTrue(np.allclose(view.source.data["density"][-n_bins:], [.25, .5, .75, 1]))
+
+    def test_views_share_one_history(self):
+        plot = TrackerPlot.build_plot(PlotType.accuracy, "acc", 1, Retention.rolling(window=3))
+        first, late = Document(), Document()
+        view = plot.add_view(first)
+        queue = Queue()
+        queue.put(plot.ingest(np.array([[0.1, 1], [0.2, 2]])))
+        plot.update_from_queue(queue)
+        run_next_tick_callbacks(first)
+        # rows ingested but not streamed yet reach a new view with the next stream, not twice
+        queue.put(plot.ingest(np.array([[0.3, 3], [0.4, 4]])))
+        late_view = plot.add_view(late)
+        self.assertTrue(np.all(late_view.source.data["step"] == [1, 2]))
+
+        plot.update_from_queue(queue)
+        for doc in (first, late):
+            self.assertEqual(1, len(doc.session_callbacks))
+            run_next_tick_callbacks(doc)
+        self.assertTrue(np.all(np.asarray(view.source.data["step"]) == [2, 3, 4]))
+        self.assertTrue(np.all(np.asarray(late_view.source.data["step"]) == [2, 3, 4]))
+
+        plot.remove_view(first)
+        plot.update(np.array([0.5, 5]))
+        self.assertEqual(0, len(first.session_callbacks))
+        self.assertEqual(1, len(late.session_callbacks))
@@ -1,7 +1,8 @@
+import warnings
 from unittest import TestCase
 import numpy as np
 
-from traintracker.trackers import TrainValLossTracker, AccuracyTracker
+from traintracker.trackers import TrainValLossTracker, AccuracyTracker, ConfusionMatrixTracker, HistogramTracker
 
 
 class TestTrainValLossTracker(TestCase):
@@ -25,6 +26,31 @@ class TestTrainValLossTracker(TestCase):
         self.assertTrue(np.all(t == train_lss), msg.format(train_lss, t, "train loss"))
         self.assertTrue(np.all(v == val_lss), msg.format(val_lss, v, "val loss"))
 
+    def test_as_np_is_read_only_view(self):
+        tvlt = TrainValLossTracker("tv_loss")
+        for step in range(2000):
+            tvlt.update(step * .5, step * .25, step)
+        train = tvlt.get_train_losses(as_np=True)
+
+        self.assertFalse(train.flags.writeable)
+        self.assertTrue(np.shares_memory(train, tvlt.get_train_losses(as_np=True)),
+                        "Repeated queries should not copy the history.")
+        self.assertEqual(np.int64, tvlt.get_steps(as_np=True).dtype)
+        self.assertEqual(list(range(2000)), tvlt.get_steps())
+
+    def test_update_many_matches_update(self):
+        steps = np.arange(1000)
+        train, val = steps * .5, steps * .25
+        one, many = TrainValLossTracker("one"), TrainValLossTracker("many")
+        for i in steps:
+            one.update(train[i], val[i], i)
+        many.update_many(train, val, steps)
+        for a, b in zip(one.get_all_tracked(as_np=True), many.get_all_tracked(as_np=True)):
+            self.assertTrue(np.all(a == b))
+
+        with self.assertRaises(ValueError):
+            many.update_many(train, val[:10], steps)
+
 
 class TestAccuracyTracker(TestCase):
     def test_serverless_connection_update(self):
@@ -45,3 +71,81 @@ class TestAccuracyTracker(TestCase):
 
         self.assertEqual(true_acc, pred_acc,
                          f"Accuracy Tracker's computed accuracy {pred_acc} != {true_acc}")
+
+    def test_steps_recorded(self):
+        at = AccuracyTracker("acc")
+        at.update(np.array([1, 0]), np.array([1, 1]), step=3)
+        at.update(np.array([1, 1]), np.array([1, 1]), step=5)
+
+        acc, steps = at.get_all_tracked(as_np=True)
+        self.assertTrue(np.all(acc == [.5, 1]))
+        self.assertTrue(np.all(steps == [3, 5]))
+
+
+class TestConfusionMatrixTracker(TestCase):
+    def test_metrics(self):
+        cmt = ConfusionMatrixTracker("cm", n_classes=3)
+        cmt.update(np.array([0, 1, 1, 2]), np.array([0, 1, 2, 2]), step=1)
+        cmt.update(np.array([0, 0]), np.array([1, 0]), step=2)
+
+        self.assertTrue(np.all(cmt.get_matrix() == [[2, 0, 0], [1, 1, 0], [0, 1, 1]]))
+        self.assertEqual(4 / 6, cmt.get_accuracy())
+        self.assertTrue(np.allclose(cmt.get_precision(), [2 / 3, 1 / 2, 1]))
+        self.assertTrue(np.allclose(cmt.get_recall(), [1, 1 / 2, 1 / 2]))
+        self.assertTrue(np.allclose(cmt.get_f1(), [4 / 5, 1 / 2, 2 / 3]))
+        self.assertAlmostEqual(np.mean([4 / 5, 1 / 2, 2 / 3]), cmt.get_macro_averages()[2])
+        acc, steps = cmt.get_all_tracked()
+        self.assertEqual(([3 / 4, 1 / 2], [1, 2]), (acc, steps))
+
+    def test_rejects_out_of_range_classes(self):
+        cmt = ConfusionMatrixTracker("cm", n_classes=3)
+        # predicted 3 with label 0 and predicted -1 with label 1 would land in valid cells
+        for predicted, labels in (([3], [0]), ([-1], [1]), ([0], [3]), ([1], [-1])):
+            with self.assertRaises(ValueError):
+                cmt.update(np.array(predicted), np.array(labels), step=1)
+        self.assertEqual(0, cmt.get_matrix().sum())
+
+    def test_float_classes(self):
+        cmt = ConfusionMatrixTracker("cm", n_classes=2)
+        cmt.update(np.array([0., 1., 1.]), np.array([0., 1., 0.]), step=1)
+        self.assertTrue(np.all(cmt.get_matrix() == [[1, 1], [0, 1]]))
+
+    def test_empty_batch_is_skipped(self):
+        cmt = ConfusionMatrixTracker("cm", n_classes=2)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            cmt.update(np.array([], dtype=np.int64), np.array([], dtype=np.int64), step=1)
+        cmt.update(np.array([1]), np.array([1]), step=2)
+        self.assertEqual(([1.], [2]), cmt.get_all_tracked())
+        self.assertEqual(1., cmt.get_accuracy())
+
+
+class TestHistogramTracker(TestCase):
+    def test_adaptive_bins_match_numpy(self):
+        ht = HistogramTracker("w", n_bins=16)
+        # seeded, values that fall exactly on an inner bin edge may be binned differently from numpy
+        values = np.random.RandomState(0).randn(10000)
+        ht.update(values, step=1)
+
+        expected, edges = np.histogram(values, bins=16)
+        counts, lo, hi, steps = ht.get_all_tracked(as_np=True)
+        self.assertTrue(np.all(counts[0] == expected))
+        self.assertEqual((edges[0], edges[-1], 1), (lo[0], hi[0], steps[0]))
+
+    def test_fixed_range_clips_outliers(self):
+        ht = HistogramTracker("w", n_bins=4, value_range=(0, 1))
+        ht.update(np.array([-5, .1, .3, .6, .9, 7, np.nan]), step=1)
+        self.assertEqual([[2, 1, 1, 2]], ht.get_counts())
+
+    def test_extreme_values(self):
+        ht = HistogramTracker("w", n_bins=4, value_range=(0, 1))
+        with np.errstate(all="raise"):
+            ht.update(np.array([1e20, -1e20, 1, 0]), step=1)
+        self.assertEqual([[2, 0, 0, 2]], ht.get_counts())
+
+        ht = HistogramTracker("w", n_bins=4)
+        with np.errstate(all="raise"):
+            ht.update(np.array([-1e308, 1e308, 0.]), step=1)
+        self.assertEqual([[1, 0, 1, 1]], ht.get_counts())
+        self.assertEqual(([-1e308], [1e308]), ht.get_ranges())
+
@@ -0,0 +1,41 @@
+from unittest import TestCase
+import numpy as np
+
+from traintracker.transforms import EMA, CumMax, CumMin, RollingMean, RollingMedian
+
+
+def apply_in_blocks(transform, values, n_blocks):
+    return np.concatenate([transform.apply(block) for block in np.array_split(values, n_blocks)])
+
+
+class TestTransforms(TestCase):
+    def setUp(self):
+        self.values = np.random.RandomState(0).randn(1000)
+
+    def test_ema_matches_recurrence(self):
+        for alpha in (.01, .3, .999, 1):
+            expected = np.empty(len(self.values))
+            expected[0] = self.values[0]
+            for i in range(1, len(self.values)):
+                expected[i] = alpha * self.values[i] + (1 - alpha) * expected[i - 1]
+            self.assertTrue(np.allclose(expected, apply_in_blocks(EMA("x", alpha), self.values, 7)), alpha)
+
+        with self.assertRaises(ValueError):
+            EMA("x", alpha=0)
+
+    def test_best_so_far(self):
+        values = self.values.copy()
+        values[10] = np.nan
+        self.assertTrue(np.array_equal(np.fmax.accumulate(values), apply_in_blocks(CumMax("x"), values, 9)))
+        self.assertTrue(np.array_equal(np.fmin.accumulate(values), apply_in_blocks(CumMin("x"), values, 9)))
+
+    def test_rolling_windows_match_naive(self):
+        for window in (1, 5, 50):
+            windows = [self.values[max(i - window + 1, 0): i + 1] for i in range(len(self.values))]
+            # blocks shorter and longer than the window
+            for n_blocks in (3, 300):
+                self.assertTrue(np.allclose([np.mean(w) for w in windows],
+                                            apply_in_blocks(RollingMean("x", window), self.values, n_blocks)))
+                self.assertTrue(np.allclose([np.median(w) for w in windows],
+                                            apply_in_blocks(RollingMedian("x", window), self.values, n_blocks)))
+            self.assertEqual(("x_mean5", "x_median5"), (RollingMean("x", 5).name, RollingMedian("x", 5).name))
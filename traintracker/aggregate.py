@@ -0,0 +1,126 @@
+import heapq
+
+from traintracker.util.defs import *
+
+REDUCERS: Dict[Reduce, np.ufunc] = {
+    Reduce.mean: np.add,
+    Reduce.sum: np.add,
+    Reduce.min: np.minimum,
+    Reduce.max: np.maximum,
+}
+
+
+class RankAggregator:
+    """ Merges the rows that the ranks of a distributed job send for one plot.
+
+    Rows are merged per step (the last value of a row) as they arrive, and a
+    merged row is released, in step order, once every rank has sent its row
+    for that step. Ranks may be out of step or skip steps: since every rank's
+    steps only increase, a step is also released once every rank has moved
+    past it (the watermark), merged over the ranks that did send it. Ranks
+    that leave no longer hold the watermark back, until they send again.
+    Rows that arrive for a step that was already released are dropped, see
+    ``late``, and a rank that sends a step again (e.g. after a reconnect)
+    replaces its earlier row for it, so every rank counts once per step.
+    """
+    def __init__(self, world_size: int, reduce: Reduce = Reduce.mean):
+        """
+        Args:
+            world_size (int): number of ranks in the job
+            reduce (Reduce): how the rows of a step are merged
+        """
+        self._world_size: int = world_size
+        self._reduce: Reduce = reduce
+        self._ufunc: np.ufunc = REDUCERS[reduce]
+        # step -> rank -> the rank's values for that step
+        self._pending: Dict[float, Dict[int, NDArray]] = {}
+        self._steps: List[float] = []
+        self._last_steps: Dict[int, float] = {}
+        self._finished: Set[int] = set()
+        # the last step released, steps up to it are never released again
+        self._released: float = -np.inf
+        self._late: int = 0
+
+    @property
+    def pending(self) -> int:
+        """ Number of steps waiting for more ranks. """
+        return len(self._pending)
+
+    @property
+    def late(self) -> int:
+        """ Number of rows dropped because their step had already been released. """
+        return self._late
+
+    def add(self, rank: int, rows: NDArray) -> NDArray:
+        """ Merge a rank's rows.
+
+        Args:
+            rank (int): the rank that sent the rows
+            rows (NDArray): a row or a block of rows, with the step last
+
+        Returns:
+            NDArray: the merged rows that are complete, in step order (possibly none)
+        """
+        rows = np.atleast_2d(rows)
+        # a rank that sends again, e.g. after reconnecting, holds the watermark back again
+        self._finished.discard(rank)
+        for row in rows:
+            step: float = float(row[-1])
+            if step <= self._released:
+                self._late += 1
+                continue
+            entry: Optional[Dict[int, NDArray]] = self._pending.get(step)
+            if entry is None:
+                entry = self._pending[step] = {}
+                heapq.heappush(self._steps, step)
+            entry[rank] = row[:-1]
+        if len(rows):
+            self._last_steps[rank] = max(self._last_steps.get(rank, -np.inf), float(rows[:, -1].max()))
+        return self._pop_ready()
+
+    def finish(self, rank: int) -> NDArray:
+        """ Stop waiting for a rank that left.
+
+        Args:
+            rank (int): the rank that left
+
+        Returns:
+            NDArray: the merged rows that are complete, in step order (possibly none)
+        """
+        self._finished.add(rank)
+        return self._pop_ready()
+
+    def flush(self) -> NDArray:
+        """ Release every pending step, whatever ranks it is still waiting for.
+
+        Returns:
+            NDArray: the merged rows, in step order
+        """
+        return self._pop_ready(np.inf)
+
+    def _watermark(self) -> float:
+        active: List[float] = [step for rank, step in self._last_steps.items() if rank not in self._finished]
+        if len(active) + len(self._finished) < self._world_size:
+            # some rank has not sent anything yet
+            return -np.inf
+        return min(active, default=np.inf)
+
+    def _pop_ready(self, watermark: Optional[float] = None) -> NDArray:
+        if watermark is None:
+            watermark = self._watermark()
+        ready: List[NDArray] = []
+        while self._steps:
+            step: float = self._steps[0]
+            entry: Dict[int, NDArray] = self._pending[step]
+            if len(entry) < self._world_size and step > watermark:
+                break
+            heapq.heappop(self._steps)
+            del self._pending[step]
+            self._released = step
+            values: NDArray = self._ufunc.reduce(np.array(list(entry.values()), dtype=np.float64), axis=0)
+            if self._reduce == Reduce.mean:
+                values /= len(entry)
+            ready.append(np.append(values, step))
+        if not ready:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.array(ready, dtype=np.float32)
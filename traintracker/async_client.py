@@ -0,0 +1,213 @@
+import asyncio
+
+from traintracker.util.defs import *
+from traintracker.protocol import HEADER, PLOT_ID, pack_frame, pack_add_plot, pack_update, pack_set_rank
+
+
+class AsyncClient:
+    """ A client for trainers that already run an asyncio event loop.
+
+    It has the same surface as ``Client``, but never blocks the loop:
+    ``add_plot``, ``update_plot`` and the server commands only append the
+    encoded message to a buffer. A single writer task coalesces everything
+    buffered within one loop iteration into one write, and pipelines writes
+    without waiting for the server. Awaiting ``drain`` applies backpressure
+    once the socket cannot keep up, awaiting ``flush`` waits for everything.
+
+    Messages sent before ``connect`` are buffered and written once the
+    connection is up, so trackers may be created before connecting. The
+    server's replies are read when they are needed, see ``server_id``, and
+    when the connection is closed.
+    """
+    def __init__(self, high_water: int = SEND_BUFFER_SIZE * 64, rank: Optional[int] = None,
+                 world_size: int = 1, reduce: Reduce = Reduce.mean, run: str = ""):
+        """
+        Args:
+            high_water (int): number of buffered bytes above which ``drain``
+                waits for the socket to catch up
+            rank (int or None): rank of this process in a distributed job; trackers
+                with the same name on all ranks then share a plot
+            world_size (int): number of ranks in the distributed job
+            reduce (Reduce): how the server merges the rows of all ranks per step
+            run (str): name of the run; trackers with the same run and name share a
+                plot, e.g. across restarts or the ranks of a distributed job
+        """
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._high_water: int = high_water
+        self._rank: Optional[int] = rank
+        self._world_size: int = world_size
+        self._reduce: Reduce = reduce
+        self._run: str = run
+        self._n_plots: int = 0
+        # client plot id -> server plot id, filled in as the server's replies are read
+        self._server_ids: Dict[int, int] = {}
+
+        self._buffer: List[bytes] = []
+        self._buffered: int = 0
+        self._writer_task: Optional[asyncio.Task] = None
+        self._error: Optional[BaseException] = None
+
+        self.sent: int = 0
+
+    @property
+    def rank(self) -> Optional[int]:
+        return self._rank
+
+    @property
+    def pending(self) -> int:
+        """ Number of bytes waiting to be written to the socket. """
+        return self._buffered
+
+    async def connect(self, host: str, port: int) -> None:
+        """ Connect client to a server.
+
+        Args:
+            host (str): host where server is running
+            port (int): port where server is listening
+        """
+        self._reader, self._writer = await asyncio.open_connection(host, port)
+        self._server_ids.clear()
+        self._writer.transport.set_write_buffer_limits(high=self._high_water)
+        if self._rank is not None:
+            # the rank has to be known before any plot is added
+            data: bytes = pack_set_rank(self._rank, self._world_size, self._reduce)
+            self._buffer.insert(0, data)
+            self._buffered += len(data)
+        self._schedule_write()
+
+    async def drain(self) -> None:
+        """
+        Apply backpressure: wait while more than ``high_water`` bytes are buffered,
+        either by this client or by the socket. Cheap when the socket keeps up.
+        """
+        if self._error:
+            raise self._error
+        if self._writer_task and self._buffered > self._high_water:
+            await asyncio.shield(self._writer_task)
+        if self._writer:
+            await self._writer.drain()
+
+    async def flush(self) -> None:
+        """
+        Wait until every buffered message was handed to the socket.
+        """
+        while self._writer_task:
+            await asyncio.shield(self._writer_task)
+        if self._error:
+            raise self._error
+        if self._writer:
+            await self._writer.drain()
+
+    async def close_connection(self) -> None:
+        """
+        Send all buffered messages and close the connection with the server.
+        """
+        await self.flush()
+        if self._writer and self._reader:
+            # half-close and wait for the server to close too, unread replies would
+            # otherwise reset the connection and could lose our last messages
+            self._writer.write_eof()
+            try:
+                while True:
+                    self._handle_reply(*await asyncio.wait_for(self._recv_frame(), CLOSE_TIMEOUT))
+            except (asyncio.TimeoutError, ConnectionError):
+                pass
+            self._writer.close()
+            await self._writer.wait_closed()
+            self._reader = self._writer = None
+
+    def add_plot(self, plot_type: PlotType, plot_name: str, width: int = 0) -> int:
+        """ Register a plot with the server.
+
+        Args:
+            plot_type (PlotType): type of plot to be created
+            plot_name (str): name of the plot, unique within the run
+            width (int): number of values in each row, 0 for the plot type's fixed width
+
+        Returns:
+            int: the client's id for the plot, to be passed to ``update_plot``
+        """
+        plot_id: int = self._n_plots
+        self._n_plots += 1
+        self._send(pack_add_plot(plot_type, plot_name, plot_id, width, self._run))
+        return plot_id
+
+    async def server_id(self, plot_id: int) -> int:
+        """ The server's id for a plot, waits for the server's reply to its registration.
+
+        Args:
+            plot_id (int): the client's id for the plot
+
+        Returns:
+            int: the id the server assigned to the plot
+        """
+        if plot_id not in self._server_ids:
+            await self.flush()
+        while plot_id not in self._server_ids:
+            self._handle_reply(*await self._recv_frame())
+        return self._server_ids[plot_id]
+
+    def update_plot(self, plot_id: int, new_data: NDArray) -> None:
+        """ Send a row, or a 2D block of rows, to a plot.
+
+        A block is sent as a single contiguous float32 message.
+
+        Args:
+            plot_id (int): the plot to update
+            new_data (NDArray): a row of shape (width,) or rows of shape (n, width)
+        """
+        self._send(pack_update(plot_id, new_data))
+
+    def start_plot_server(self) -> None:
+        """
+        Instruct the server to start the plot server.
+        """
+        self._send(pack_frame(Cmd.start_plot_server))
+
+    def shutdown_server(self) -> None:
+        """
+        Instruct server to shutdown (that we are done with it)
+        """
+        self._send(pack_frame(Cmd.server_shutdown))
+
+    def _handle_reply(self, cmd: Cmd, plot_id: int, payload: bytes) -> None:
+        if cmd == Cmd.add_plot:
+            self._server_ids[plot_id], = PLOT_ID.unpack(payload)
+
+    async def _recv_frame(self) -> Tuple[Cmd, int, bytes]:
+        if self._reader is None:
+            raise ConnectionError("Not connected to a server.")
+        try:
+            cmd, plot_id, size = HEADER.unpack(await self._reader.readexactly(HEADER.size))
+            return Cmd(cmd), plot_id, await self._reader.readexactly(size)
+        except asyncio.IncompleteReadError as e:
+            raise ConnectionError("Connection closed by the server.") from e
+
+    def _send(self, data: bytes) -> None:
+        if self._error:
+            raise self._error
+        self._buffer.append(data)
+        self._buffered += len(data)
+        self._schedule_write()
+
+    def _schedule_write(self) -> None:
+        if self._writer and self._buffer and not self._writer_task:
+            self._writer_task = asyncio.ensure_future(self._write_buffered())
+
+    async def _write_buffered(self) -> None:
+        writer: Optional[asyncio.StreamWriter] = self._writer
+        try:
+            # everything buffered since the task was scheduled goes out in one write
+            while self._buffer and writer:
+                data: bytes = b"".join(self._buffer)
+                n: int = len(self._buffer)
+                self._buffer.clear()
+                self._buffered = 0
+                writer.write(data)
+                self.sent += n
+                await writer.drain()
+        except (ConnectionError, OSError) as e:
+            self._error = e
+        finally:
+            self._writer_task = None
@@ -1,24 +1,141 @@
+import json
+import os
 import socket
+import time
 import numpy as np
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from itertools import count
 
 from traintracker.util.defs import *
+from traintracker.sender import BackgroundSender
+from traintracker.protocol import (HEADER, PLOT_ID, pack_frame, pack_add_plot, pack_update, pack_batch, pack_set_rank,
+                                   pack_query, unpack_query_result)
+from traintracker.metric_log import MetricLog, tracker_log_path
 
 FAIL_MSG = "Correct data not received by server, received: {}, expected: {}"
 FAIL_SPEC = "Point of failure: {}"
 
+# tells apart the shared memory blocks of clients within one process
+_client_ids: Iterator[int] = count()
+
 
 class Client:
     """ A client is responsible for passing along data to the server. 
 
     A client will be referenced by all trackers that wish to send data 
     to the server.
+
+    Plots are registered with the server by (run, name). The client refers to
+    them with its own small ids, which stay valid across reconnects.
+
+    A resilient client never lets a failing server interrupt training: it keeps
+    buffering while the server is away, reconnects in the background and then
+    re-registers its plots and sends the backlog.
     """
-    def __init__(self):
+    def __init__(self, background: bool = False, buffer_size: int = SEND_BUFFER_SIZE,
+                 full_policy: Optional[FullPolicy] = None, max_batch: int = BATCH_SIZE,
+                 log_dir: Optional[str] = None, shared_memory: bool = False, ring_size: int = RING_SIZE,
+                 rank: Optional[int] = None, world_size: int = 1, reduce: Reduce = Reduce.mean,
+                 run: str = "", resilient: bool = False):
+        """
+        Args:
+            background (bool): whether to hand messages to a dedicated sender thread
+                instead of writing to the socket on the calling thread
+            buffer_size (int): maximum number of plot updates buffered in background mode
+            full_policy (FullPolicy or None): what to do with plot updates when the buffer
+                is full, by default block, or drop the oldest in resilient mode
+            max_batch (int): number of batched plot updates after which a batch is
+                flushed automatically
+            log_dir (str or None): directory in which every plot's rows are also
+                logged locally
+            shared_memory (bool): whether to pass plot updates to a server on the same
+                host through shared memory ring buffers instead of the socket
+            ring_size (int): number of rows held by each shared memory ring buffer
+            rank (int or None): rank of this process in a distributed job; trackers
+                with the same name on all ranks then share a plot
+            world_size (int): number of ranks in the distributed job
+            reduce (Reduce): how the server merges the rows of all ranks per step
+            run (str): name of the run; trackers with the same run and name share a
+                plot, e.g. across restarts or the ranks of a distributed job
+            resilient (bool): whether to buffer through connection failures and
+                reconnect, in background mode; updates made before ``connect`` are
+                buffered too
+        """
+        if resilient and shared_memory:
+            raise ValueError("A resilient client cannot use shared memory.")
+        if full_policy is None:
+            full_policy = FullPolicy.drop_oldest if resilient else FullPolicy.block
         self._host: Optional[str] = None
         self._port: Optional[int] = None
         self._socket: Optional[socket.socket] = None
 
+        self._background: bool = background or resilient
+        self._buffer_size: int = buffer_size
+        self._full_policy: FullPolicy = full_policy
+        self._resilient: bool = resilient
+        self._reconnects: int = 0
+        self._sender: Optional[BackgroundSender] = None
+        if resilient:
+            self._sender = self._resilient_sender()
+
+        self._max_batch: int = max_batch
+        self._batching: int = 0
+        self._batch_size: int = 0
+        # row width -> (plot ids, rows)
+        self._batch: Dict[int, Tuple[List[int], List[NDArray]]] = {}
+
+        self._run: str = run
+        # client plot id -> (plot type, name, row width); ids are dense, in order of registration
+        self._plot_info: Dict[int, Tuple[PlotType, str, int]] = {}
+        self._server_ids: Dict[int, int] = {}
+        self._server_stats: Optional[Dict[str, Any]] = None
+        self._query_ids: Iterator[int] = count()
+        # query id -> the reply's payload
+        self._query_results: Dict[int, bytes] = {}
+
+        # unique among the clients sharing a log directory or shared memory
+        self._instance_id: str = f"{os.getpid()}_{next(_client_ids)}"
+        self._log_dir: Optional[str] = log_dir
+        self._logs: Dict[int, MetricLog] = {}
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+
+        self._shared_memory: bool = shared_memory
+        self._ring_size: int = ring_size
+        self._ring_prefix: str = f"tt_{self._instance_id}"
+        # plot id -> ShmRing, only imported when shared memory is used
+        self._rings: Dict[int, Any] = {}
+
+        self._rank: Optional[int] = rank
+        self._world_size: int = world_size
+        self._reduce: Reduce = reduce
+
+    @property
+    def rank(self) -> Optional[int]:
+        return self._rank
+
+    @property
+    def queued(self) -> int:
+        """ Number of messages accepted into the background buffer. """
+        return self._sender.queued if self._sender else 0
+
+    @property
+    def dropped(self) -> int:
+        """ Number of plot updates discarded because a buffer was full. """
+        dropped: int = sum(ring.dropped for ring in self._rings.values())
+        return dropped + (self._sender.dropped if self._sender else 0)
+
+    @property
+    def pending(self) -> int:
+        """ Number of messages waiting in the background buffer. """
+        return self._sender.pending if self._sender else 0
+
+    @property
+    def reconnects(self) -> int:
+        """ Number of connections a resilient client has made to the server. """
+        return self._reconnects + (self._sender.reconnects if self._sender else 0)
+
     def connect(self, host: str, port: int) -> None:
         """ Connect client to a server.
 
@@ -28,38 +145,179 @@ class Client:
         """
         self._host = host
         self._port = port
-        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._socket.connect((self._host, self._port))
+        self._server_ids.clear()
+        if self._resilient:
+            # the sender connects, and reconnects, on its own
+            if self._sender is None:
+                self._sender = self._resilient_sender()
+            self._sender.start()
+            return
+        self._socket = self._open_socket()
+        if self._background:
+            self._sender = BackgroundSender(self._socket, self._buffer_size, self._full_policy)
+            self._sender.start()
+        for data in self._handshake():
+            self._safe_send(data)
 
     def close_connection(self) -> None:
         """
         Close connection with the server.
+
+        Pending batched updates and, in background mode, any buffered messages
+        are sent first. Shared memory ring buffers are freed once the server has
+        drained them (or after a timeout).
         """
+        self.flush()
+        self._close_rings()
+        if self._sender:
+            # a resilient client gives up on a server that does not come back
+            self._sender.close(CLOSE_TIMEOUT if self._resilient else None)
+            if self._resilient:
+                self._socket = self._sender.socket
+                self._reconnects += self._sender.reconnects
+            self._sender = None
+        for log in self._logs.values():
+            log.close()
+        self._logs.clear()
         if self._socket:
+            # half-close and read the server's remaining replies until it closes too;
+            # closing with unread replies would reset the connection and could lose
+            # our last messages
+            try:
+                self._socket.shutdown(socket.SHUT_WR)
+                self._socket.settimeout(CLOSE_TIMEOUT)
+                while True:
+                    self._handle_reply(*self._recv_frame())
+            except OSError:
+                pass
             self._socket.close()
             self._socket = None
 
-    def add_plot(self, plot_type: PlotType, plot_name: str, tracker_id: int) -> None:
-        self._send_cmd(Cmd.add_plot)
-        data: bytes = plot_type.to_bytes(INT32, BYTEORDER)
-        self._safe_send(data)
-        data = tracker_id.to_bytes(INT32, BYTEORDER)
-        self._safe_send(data)
-        data = plot_name.encode()
-        self._safe_send(len(data).to_bytes(INT32, BYTEORDER))
-        self._safe_send(data)
+    @contextmanager
+    def batch(self) -> Iterator["Client"]:
+        """ Coalesce all plot updates made inside this context into batch frames.
+
+        Batches may be nested, pending updates are flushed when the outermost
+        batch exits (or earlier, once ``max_batch`` updates are pending).
+
+        Example:
+            >>> with client.batch():
+            ...     for tracker in trackers:
+            ...         tracker.update(...)
+        """
+        self._batching += 1
+        try:
+            yield self
+        finally:
+            self._batching -= 1
+            if not self._batching:
+                self.flush()
+
+    def flush(self) -> None:
+        """
+        Send all pending batched plot updates, one frame per row width.
+        """
+        for plot_ids, rows in self._batch.values():
+            self._safe_send(pack_batch(plot_ids, rows), droppable=True)
+        self._batch.clear()
+        self._batch_size = 0
+
+    def add_plot(self, plot_type: PlotType, plot_name: str, width: int = 0) -> int:
+        """ Register a plot with the server.
+
+        Args:
+            plot_type (PlotType): type of plot to be created
+            plot_name (str): name of the plot, unique within the run
+            width (int): number of values in each row, 0 for the plot type's fixed width
+
+        Returns:
+            int: the client's id for the plot, to be passed to ``update_plot``
+        """
+        self.flush()
+        plot_id: int = len(self._plot_info)
+        self._plot_info[plot_id] = (plot_type, plot_name, width)
+        self._safe_send(pack_add_plot(plot_type, plot_name, plot_id, width, self._run))
+        return plot_id
+
+    def server_id(self, plot_id: int) -> int:
+        """ The server's id for a plot, waits for the server's reply to its registration.
+
+        Args:
+            plot_id (int): the client's id for the plot
+
+        Returns:
+            int: the id the server assigned to the plot
+        """
+        if self._resilient:
+            raise ValueError("Server ids are not available to a resilient client.")
+        while plot_id not in self._server_ids:
+            self._handle_reply(*self._recv_frame())
+        return self._server_ids[plot_id]
+
+    def server_stats(self) -> Dict[str, Any]:
+        """ Query the server's statistics about itself, see ``Server.stats``.
+
+        Returns:
+            Dict: the statistics
+        """
+        if self._resilient:
+            raise ValueError("Server statistics are not available to a resilient client.")
+        self._server_stats = None
+        self._send_cmd(Cmd.stats)
+        while self._server_stats is None:
+            self._handle_reply(*self._recv_frame())
+        return self._server_stats
+
+    def query(self, plot_name: str, start: float = -np.inf, stop: float = np.inf, max_points: int = MAX_POINTS,
+              run: Optional[str] = None) -> Dict[str, NDArray]:
+        """ Read a step range of any plot back from the server, at a bounded resolution.
+
+        The server answers from an index of the plot's history, so even long
+        ranges are cheap. Updates sent before the query are included.
+
+        Args:
+            plot_name (str): name of the plot
+            start (float): the first step included
+            stop (float): the last step included
+            max_points (int): maximum number of points returned
+            run (str or None): the run of the plot, by default the client's run
+
+        Returns:
+            Dict: per point, the step it starts at, the mean, min and max of every
+                other column (``<column>_min``, ``<column>_max``) and the number of
+                rows it summarizes (``count``)
+        """
+        if self._resilient:
+            raise ValueError("Queries are not available to a resilient client.")
+        run = self._run if run is None else run
+        query_id: int = next(self._query_ids)
+        self.flush()
+        self._safe_send(pack_query(query_id, f"{run}/{plot_name}" if run else plot_name, start, stop, max_points))
+        while query_id not in self._query_results:
+            self._handle_reply(*self._recv_frame())
+        return unpack_query_result(self._query_results.pop(query_id))
 
     def update_plot(self, plot_id: int, new_data: NDArray) -> None:
-        self._send_cmd(Cmd.update_plot)
-        # data = plot_name.encode()
-        data: bytes = plot_id.to_bytes(INT32, BYTEORDER)
-        self._safe_send(data)
+        """ Send a row, or a 2D block of rows, to a plot.
 
+        A block is sent as a single contiguous float32 message.
+
+        Args:
+            plot_id (int): the plot to update
+            new_data (NDArray): a row of shape (width,) or rows of shape (n, width)
+        """
         if new_data.dtype != np.float32:
             new_data = np.array(new_data, dtype=np.float32)
-        data = new_data.tobytes()
-        self._safe_send(len(data).to_bytes(INT32, BYTEORDER))
-        self._safe_send(data)
+        if self._log_dir:
+            self._log(plot_id, new_data)
+        if self._shared_memory and self._socket:
+            self._push_to_ring(plot_id, new_data)
+            return
+        if self._batching:
+            self._add_to_batch(plot_id, new_data)
+            return
+        # plot updates are the only messages a full background buffer may drop
+        self._safe_send(pack_update(plot_id, new_data), droppable=True)
 
     def start_plot_server(self) -> None:
         """
@@ -73,10 +331,93 @@ class Client:
         """
         self._send_cmd(Cmd.server_shutdown)
 
+    def _open_socket(self) -> socket.socket:
+        if self._port is None:
+            raise ConnectionError("No server to connect to, call connect first.")
+        return socket.create_connection((self._host, self._port))
+
+    def _handshake(self) -> List[bytes]:
+        # sent first on every connection; plots registered on an earlier connection are resumed
+        messages: List[bytes] = []
+        if self._rank is not None:
+            messages.append(pack_set_rank(self._rank, self._world_size, self._reduce))
+        for plot_id, (plot_type, plot_name, width) in list(self._plot_info.items()):
+            messages.append(pack_add_plot(plot_type, plot_name, plot_id, width, self._run))
+        return messages
+
+    def _resilient_sender(self) -> BackgroundSender:
+        return BackgroundSender(None, self._buffer_size, self._full_policy,
+                                connect=self._open_socket, handshake=self._handshake)
+
+    def _push_to_ring(self, plot_id: int, new_data: NDArray) -> None:
+        ring = self._rings.get(plot_id)
+        if ring is None:
+            from traintracker.shm_ring import ShmRing
+            ring = ShmRing.create(f"{self._ring_prefix}_{plot_id}", self._ring_size, new_data.shape[-1])
+            self._rings[plot_id] = ring
+            # the server polls the ring from now on
+            self._safe_send(pack_frame(Cmd.attach_shm, plot_id, ring.name.encode()))
+        ring.push(new_data)
+
+    def _close_rings(self) -> None:
+        deadline: float = time.monotonic() + RING_DRAIN_TIMEOUT
+        while any(len(ring) for ring in self._rings.values()) and time.monotonic() < deadline:
+            time.sleep(TIMEOUT / 10000)
+        for ring in self._rings.values():
+            ring.close()
+        self._rings.clear()
+
+    def _log(self, plot_id: int, new_data: NDArray) -> None:
+        if plot_id not in self._logs:
+            if plot_id not in self._plot_info or not self._log_dir:
+                # plot was never added through this client
+                return
+            plot_type, plot_name, _ = self._plot_info[plot_id]
+            if self._run:
+                plot_name = f"{self._run}/{plot_name}"
+            path: str = tracker_log_path(self._log_dir, plot_name, self._instance_id, plot_id)
+            self._logs[plot_id] = MetricLog(path, plot_type, plot_name, plot_id, new_data.shape[-1])
+        self._logs[plot_id].append(new_data)
+
+    def _add_to_batch(self, plot_id: int, new_data: NDArray) -> None:
+        new_rows: NDArray = new_data.reshape(-1, new_data.shape[-1])
+        plot_ids, rows = self._batch.setdefault(new_rows.shape[1], ([], []))
+        plot_ids.extend([plot_id] * len(new_rows))
+        rows.extend(new_rows)
+        self._batch_size += len(new_rows)
+        if self._batch_size >= self._max_batch:
+            self.flush()
+
     def _send_cmd(self, cmd: Cmd) -> None:
-        data: bytes = cmd.to_bytes(INT32, BYTEORDER)
-        self._safe_send(data)
+        self.flush()
+        self._safe_send(pack_frame(cmd))
 
-    def _safe_send(self, data: bytes) -> None:
-        if self._socket:
+    def _handle_reply(self, cmd: Cmd, plot_id: int, payload: bytes) -> None:
+        if cmd == Cmd.add_plot:
+            self._server_ids[plot_id], = PLOT_ID.unpack(payload)
+        elif cmd == Cmd.stats:
+            self._server_stats = json.loads(payload)
+        elif cmd == Cmd.query:
+            self._query_results[plot_id] = payload
+
+    def _recv_frame(self) -> Tuple[Cmd, int, bytes]:
+        header: bytes = self._recv_exactly(HEADER.size)
+        cmd, plot_id, size = HEADER.unpack(header)
+        return Cmd(cmd), plot_id, self._recv_exactly(size)
+
+    def _recv_exactly(self, size: int) -> bytes:
+        if self._socket is None:
+            raise ConnectionError("Not connected to a server.")
+        data: bytes = b""
+        while len(data) < size:
+            chunk: bytes = self._socket.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Connection closed by the server.")
+            data += chunk
+        return data
+
+    def _safe_send(self, data: bytes, droppable: bool = False) -> None:
+        if self._sender:
+            self._sender.put(data, droppable)
+        elif self._socket:
             self._socket.sendall(data)
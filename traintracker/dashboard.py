@@ -0,0 +1,81 @@
+from bokeh.document.document import Document
+from bokeh.models import Column, Row, Select, Spacer
+
+from traintracker.util.defs import *
+from traintracker.tracker_plots import TrackerPlot
+
+
+class Dashboard:
+    """
+    One browser session's layout of the plots: a grid of ``n_columns`` figures
+    per row, split in pages of ``page_size`` plots.
+
+    Only the plots of the page shown have views in the document, so plots on
+    other pages cost neither the browser nor the tick anything. Every cell of
+    the page is a container of its own, placing a figure in it only sends that
+    figure: plots registered while the page is open are inserted in place, the
+    figures already shown are neither rebuilt nor sent again. Cells without a
+    plot hold an empty spacer, Bokeh warns about every empty layout.
+    """
+    def __init__(self, doc: Document, plots: Sequence[TrackerPlot], page_size: int = PAGE_SIZE,
+                 n_columns: int = GRID_COLUMNS):
+        """
+        Args:
+            doc (Document): the session's document, the dashboard is its root
+            plots (Sequence[TrackerPlot]): the plots registered so far, in order
+            page_size (int): number of plots per page
+            n_columns (int): number of plots per row
+        """
+        self.doc: Document = doc
+        self.plots: List[TrackerPlot] = list(plots)
+        self.page_size: int = page_size
+        self.page: int = 0
+        self._cells: List[Column] = [Column(children=[Spacer()]) for _ in range(page_size)]
+        self._pager: Select = Select(title="Page", value="1")
+        self._update_pager()
+        self._pager.on_change("value", self._on_page)
+        grid = Column(children=[Row(children=self._cells[i: i + n_columns])
+                                for i in range(0, page_size, n_columns)])
+        doc.add_root(Column(children=[self._pager, grid]))
+        self._show_page()
+
+    @property
+    def n_pages(self) -> int:
+        return max(-(-len(self.plots) // self.page_size), 1)
+
+    def add_plot(self, plot: TrackerPlot) -> None:
+        """ Add a plot registered after the document was made, must run with the document locked.
+
+        Args:
+            plot (TrackerPlot): the plot
+        """
+        self.plots.append(plot)
+        self._update_pager()
+        position: int = len(self.plots) - 1
+        if position // self.page_size == self.page:
+            self._cells[position % self.page_size].children = [plot.add_view(self.doc).fig]
+
+    def close(self) -> None:
+        """
+        Stop updating the document's views, once its session has ended.
+        """
+        for plot in self._shown():
+            plot.remove_view(self.doc)
+
+    def _shown(self) -> List[TrackerPlot]:
+        return self.plots[self.page * self.page_size: (self.page + 1) * self.page_size]
+
+    def _show_page(self) -> None:
+        shown: List[TrackerPlot] = self._shown()
+        for i, cell in enumerate(self._cells):
+            cell.children = [shown[i].add_view(self.doc).fig if i < len(shown) else Spacer()]
+
+    def _on_page(self, attr: str, old: str, new: str) -> None:
+        # the views of the page left are dropped, the new page's start from the plots' snapshots
+        self.close()
+        self.page = int(new) - 1
+        self._show_page()
+
+    def _update_pager(self) -> None:
+        self._pager.options = [str(page + 1) for page in range(self.n_pages)]
+        self._pager.visible = self.n_pages > 1
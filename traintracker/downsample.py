@@ -0,0 +1,72 @@
+from traintracker.util.defs import *
+from traintracker.util.column_store import ColumnStore
+
+
+class MinMaxDecimator:
+    """ Incremental min/max bucket downsampling of a growing series.
+
+    Rows are grouped into buckets of equal size. Every bucket is represented by
+    the rows holding the minimum and maximum of each y column, so spikes are
+    never lost. Completed buckets are computed once; the bucket size doubles
+    (and buckets are recomputed) only when there are too many of them, which
+    keeps the work per new row amortized O(1).
+    """
+    def __init__(self, ys: Sequence[str], max_points: int):
+        """
+        Args:
+            ys (Sequence[str]): the columns whose extremes are kept
+            max_points (int): maximum number of rows selected for display
+        """
+        self._ys: Tuple[str, ...] = tuple(ys)
+        self._max_buckets: int = max(max_points // (2 * len(self._ys)), 1)
+        self._bucket_size: int = 1
+        self._n_buckets: int = 0
+        self._selected: NDArray = np.empty(0, dtype=np.int64)
+
+    @property
+    def bucket_size(self) -> int:
+        return self._bucket_size
+
+    def update(self, store: ColumnStore) -> NDArray:
+        """ Select the rows to display after new rows were added to ``store``.
+
+        Args:
+            store (ColumnStore): the full resolution data
+
+        Returns:
+            NDArray: sorted indices of the selected rows
+        """
+        n: int = len(store)
+        if n // self._bucket_size > self._max_buckets:
+            while n // self._bucket_size > self._max_buckets:
+                self._bucket_size *= 2
+            self._n_buckets = 0
+            self._selected = np.empty(0, dtype=np.int64)
+
+        n_buckets: int = n // self._bucket_size
+        if n_buckets > self._n_buckets:
+            new: NDArray = self._select(store, self._n_buckets * self._bucket_size,
+                                        n_buckets * self._bucket_size, self._bucket_size)
+            self._selected = np.concatenate((self._selected, new))
+            self._n_buckets = n_buckets
+
+        start: int = n_buckets * self._bucket_size
+        # the incomplete last bucket, if any
+        tail: NDArray = self._select(store, start, n, n - start) if start < n else self._selected[:0]
+        selected: NDArray = np.concatenate((self._selected, tail))
+        if n and selected[-1] != n - 1:
+            # always end at the latest row
+            selected = np.append(selected, n - 1)
+        return selected
+
+    def _select(self, store: ColumnStore, start: int, stop: int, bucket_size: int) -> NDArray:
+        offsets: NDArray = np.arange(start, stop, bucket_size).reshape(-1, 1)
+        picks: List[NDArray] = []
+        for y in self._ys:
+            buckets: NDArray = store[y][start: stop].reshape(-1, bucket_size)
+            picks.append(np.argmin(buckets, axis=1).reshape(-1, 1))
+            picks.append(np.argmax(buckets, axis=1).reshape(-1, 1))
+        indices: NDArray = np.sort(np.hstack(picks), axis=1) + offsets
+        indices = indices.ravel()
+        # buckets are in order, so the flattened indices are sorted; drop repeats
+        return indices[np.r_[True, np.diff(indices) != 0]]
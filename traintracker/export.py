@@ -0,0 +1,254 @@
+import os
+import zipfile
+from abc import ABC, abstractmethod
+
+from traintracker.util.defs import *
+from traintracker.util.column_store import ColumnStore
+
+NPZ_SUFFIX = ".npz"
+PARQUET_SUFFIXES: Tuple[str, ...] = (".parquet", ".pq")
+
+
+def _import_pyarrow():
+    # pyarrow is optional, only Parquet exports need it
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet exports need pyarrow, install it with: pip install traintracker[parquet]") from e
+    return pyarrow, pyarrow.parquet
+
+
+class ChunkWriter(ABC):
+    """
+    Writes chunks of columns to a file, one after the other, without holding
+    on to them.
+    """
+    def __init__(self, path: str, dtypes: Mapping[str, DTypeLike]):
+        """
+        Args:
+            path (str): path of the file, it is overwritten
+            dtypes (Mapping[str, DTypeLike]): the dtype of each column, in column order
+        """
+        self.path: str = path
+        self.dtypes: Dict[str, np.dtype] = {name: np.dtype(dtype) for name, dtype in dtypes.items()}
+
+    @abstractmethod
+    def write(self, chunk: Dict[str, NDArray]) -> None:
+        """ Write the next chunk.
+
+        Args:
+            chunk (Dict[str, NDArray]): values of equal length for every column
+        """
+        pass
+
+    @abstractmethod
+    def close(self) -> None:
+        """
+        Finish the file, it is only complete once closed.
+        """
+        pass
+
+
+class NpzWriter(ChunkWriter):
+    """
+    A NumPy archive with one ``<column>/<chunk>`` array per column and chunk,
+    so ``np.load`` reads it too. Chunks are compressed unless ``compress`` is
+    False.
+    """
+    def __init__(self, path: str, dtypes: Mapping[str, DTypeLike], compress: bool = True):
+        """
+        Args:
+            path (str): path of the file, it is overwritten
+            dtypes (Mapping[str, DTypeLike]): the dtype of each column, in column order
+            compress (bool): whether to deflate the chunks
+        """
+        super(NpzWriter, self).__init__(path, dtypes)
+        # the fastest level, exports are written while training runs
+        self._zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED,
+                                    compresslevel=1)
+        self._chunks: int = 0
+
+    def write(self, chunk: Dict[str, NDArray]) -> None:
+        for column, dtype in self.dtypes.items():
+            with self._zip.open(f"{column}/{self._chunks:08d}.npy", "w", force_zip64=True) as fp:
+                np.lib.format.write_array(fp, np.ascontiguousarray(chunk[column], dtype=dtype), allow_pickle=False)
+        self._chunks += 1
+
+    def close(self) -> None:
+        self._zip.close()
+
+
+class ParquetWriter(ChunkWriter):
+    """
+    A Parquet file with one row group per chunk, needs pyarrow.
+    """
+    def __init__(self, path: str, dtypes: Mapping[str, DTypeLike]):
+        """
+        Args:
+            path (str): path of the file, it is overwritten
+            dtypes (Mapping[str, DTypeLike]): the dtype of each column, in column order
+        """
+        super(ParquetWriter, self).__init__(path, dtypes)
+        self._pa, pq = _import_pyarrow()
+        self._schema = self._pa.schema([(column, self._pa.from_numpy_dtype(dtype))
+                                        for column, dtype in self.dtypes.items()])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, chunk: Dict[str, NDArray]) -> None:
+        arrays = [self._pa.array(np.asarray(chunk[column], dtype=dtype)) for column, dtype in self.dtypes.items()]
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+def open_writer(path: str, dtypes: Mapping[str, DTypeLike]) -> ChunkWriter:
+    """ A writer for the format given by the path's suffix, ``.npz`` or ``.parquet``.
+
+    Args:
+        path (str): path of the file, it is overwritten
+        dtypes (Mapping[str, DTypeLike]): the dtype of each column, in column order
+
+    Returns:
+        ChunkWriter: the writer
+    """
+    suffix: str = os.path.splitext(path)[1].lower()
+    if suffix == NPZ_SUFFIX:
+        return NpzWriter(path, dtypes)
+    if suffix in PARQUET_SUFFIXES:
+        return ParquetWriter(path, dtypes)
+    raise ValueError(f"Cannot export to {path}, the suffix must be {NPZ_SUFFIX} or one of {PARQUET_SUFFIXES}.")
+
+
+def read_export(path: str) -> Dict[str, NDArray]:
+    """ Read an export back, one array per column.
+
+    Every column is allocated once and its chunks are read straight into it.
+
+    Args:
+        path (str): path of a ``.npz`` or ``.parquet`` export
+
+    Returns:
+        Dict: the values of every column, in column order
+    """
+    if os.path.splitext(path)[1].lower() in PARQUET_SUFFIXES:
+        _, pq = _import_pyarrow()
+        table = pq.read_table(path)
+        return {column: table.column(column).to_numpy() for column in table.column_names}
+
+    columns: Dict[str, NDArray] = {}
+    with zipfile.ZipFile(path) as archive:
+        # the entries are in writing order, so every column's chunks are in order
+        chunks: Dict[str, List[Tuple[str, int]]] = {}
+        dtypes: Dict[str, np.dtype] = {}
+        for name in archive.namelist():
+            column: str = name.rsplit("/", 1)[0]
+            with archive.open(name) as fp:
+                shape, dtypes[column] = _read_npy_header(fp)
+            chunks.setdefault(column, []).append((name, shape[0]))
+        for column, entries in chunks.items():
+            values: NDArray = np.empty(sum(n for _, n in entries), dtype=dtypes[column])
+            offset: int = 0
+            for name, n in entries:
+                with archive.open(name) as fp:
+                    _read_npy_header(fp)
+                    _read_into(fp, values[offset: offset + n])
+                offset += n
+            columns[column] = values
+    return columns
+
+
+def _read_into(fp, values: NDArray) -> None:
+    # a zip entry is a binary file, it reads straight into the array's memory
+    fp.readinto(values.view(np.uint8).data)
+
+
+def _read_npy_header(fp) -> Tuple[Tuple[int, ...], np.dtype]:
+    version: Tuple[int, int] = np.lib.format.read_magic(fp)
+    if version == (1, 0):
+        shape, _, dtype = np.lib.format.read_array_header_1_0(fp)
+    else:
+        shape, _, dtype = np.lib.format.read_array_header_2_0(fp)
+    return shape, dtype
+
+
+class Exporter:
+    """ Streams rows to a file as they arrive, in chunks of at least ``chunk_rows`` rows.
+
+    Rows are staged in a ColumnStore that is emptied whenever a chunk is
+    written, so memory stays bounded by the chunk size whatever the length of
+    the history. Call ``close`` to write the last, partial chunk.
+    """
+    def __init__(self, path: str, dtypes: Mapping[str, DTypeLike], chunk_rows: int = EXPORT_CHUNK):
+        """
+        Args:
+            path (str): path of a ``.npz`` or ``.parquet`` file, it is overwritten
+            dtypes (Mapping[str, DTypeLike]): the dtype of each column, in column order
+            chunk_rows (int): number of rows written at once
+        """
+        self.chunk_rows: int = chunk_rows
+        self.rows: int = 0
+        self._writer: ChunkWriter = open_writer(path, dtypes)
+        self._staged: ColumnStore = ColumnStore(dtypes, capacity=chunk_rows)
+
+    @property
+    def path(self) -> str:
+        return self._writer.path
+
+    def append(self, *row) -> None:
+        """ Export a single row.
+
+        Args:
+            *row: one value per column, in column order
+        """
+        self._staged.append(*row)
+        if len(self._staged) >= self.chunk_rows:
+            self._write_staged()
+
+    def extend(self, rows: NDArray) -> None:
+        """ Export a 2D block of rows.
+
+        Args:
+            rows (NDArray): rows of shape (n, number of columns)
+        """
+        rows = np.atleast_2d(rows)
+        self.extend_columns(*(rows[:, i] for i in range(rows.shape[1])))
+
+    def extend_columns(self, *columns) -> None:
+        """ Export values column by column.
+
+        Args:
+            *columns: one array-like of equal length per column, in column order
+        """
+        self._staged.extend_columns(*columns)
+        if len(self._staged) >= self.chunk_rows:
+            self._write_staged()
+
+    def write_store(self, store: ColumnStore) -> None:
+        """ Export all the rows of a store, e.g. the history recorded before exporting started.
+
+        The rows are written straight from the store's arrays, in chunks.
+
+        Args:
+            store (ColumnStore): a store with the exported columns
+        """
+        self._write_staged()
+        for start in range(0, len(store), self.chunk_rows):
+            self._write({column: store[column][start: start + self.chunk_rows] for column in store.columns})
+
+    def close(self) -> None:
+        """
+        Write the rows that are still staged and finish the file.
+        """
+        self._write_staged()
+        self._writer.close()
+
+    def _write_staged(self) -> None:
+        if len(self._staged):
+            self._write({column: self._staged[column] for column in self._staged.columns})
+            self._staged.keep_last(0)
+
+    def _write(self, chunk: Dict[str, NDArray]) -> None:
+        self._writer.write(chunk)
+        self.rows += len(next(iter(chunk.values())))
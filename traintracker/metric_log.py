@@ -0,0 +1,177 @@
+import os
+import re
+import struct
+import time
+
+from traintracker.util.defs import *
+
+LOG_SUFFIX = ".ttlog"
+LOG_MAGIC = b"TTLOG\0\0\0"
+LOG_VERSION = 1
+# magic | version | plot type | plot id | row width | number of synced rows
+LOG_HEADER = struct.Struct("<8sIIIIQ")
+ROWS_OFFSET = LOG_HEADER.size - 8
+NAME_SIZE = 256
+DATA_OFFSET = 512
+INITIAL_ROWS = 4096
+
+
+class LogInfo(NamedTuple):
+    plot_type: PlotType
+    plot_id: int
+    name: str
+    width: int
+    rows: int
+
+
+def log_path(log_dir: str, plot_id: int) -> str:
+    """ Path of the log of a tracker/plot id within ``log_dir``. """
+    return os.path.join(log_dir, f"{plot_id}{LOG_SUFFIX}")
+
+
+def tracker_log_path(log_dir: str, name: str, owner: str, plot_id: int) -> str:
+    """ Path of the log that ``owner`` writes for its tracker ``name`` (run/name) within ``log_dir``. """
+    file_name: str = re.sub(r"[^\w.-]", "_", name)
+    return os.path.join(log_dir, f"{file_name}.{owner}_{plot_id}{LOG_SUFFIX}")
+
+
+def read_log_info(path: str) -> LogInfo:
+    """ Read the header of a metric log.
+
+    Args:
+        path (str): path of the log
+
+    Returns:
+        LogInfo: what the log holds
+    """
+    with open(path, "rb") as fp:
+        header: bytes = fp.read(DATA_OFFSET)
+    magic, version, plot_type, plot_id, width, rows = LOG_HEADER.unpack_from(header)
+    if magic != LOG_MAGIC or version != LOG_VERSION:
+        raise ValueError(f"{path} is not a version {LOG_VERSION} metric log.")
+    name: str = header[LOG_HEADER.size: LOG_HEADER.size + NAME_SIZE].rstrip(b"\0").decode()
+    return LogInfo(PlotType(plot_type), plot_id, name, width, rows)
+
+
+def read_log(path: str) -> Tuple[LogInfo, NDArray]:
+    """ Lazily read a metric log.
+
+    Only rows that were synced to disk are returned. Nothing is read into memory
+    until the returned array is accessed.
+
+    Args:
+        path (str): path of the log
+
+    Returns:
+        Tuple: the log's header and a read-only (rows, width) float32 memory map
+    """
+    info: LogInfo = read_log_info(path)
+    if not info.rows:
+        return info, np.empty((0, info.width), dtype=np.float32)
+    rows: NDArray = np.memmap(path, dtype=np.float32, mode="r", offset=DATA_OFFSET,
+                              shape=(info.rows, info.width))
+    return info, rows
+
+
+class MetricLog:
+    """ An append-only log of one tracker's rows in a memory-mapped file.
+
+    Rows are fixed-width float32 records. Appending only copies into the
+    memory map; the file is fsynced in batches, after ``sync_every`` rows or
+    ``sync_interval`` seconds, whichever comes first. The header's row count
+    is updated on every sync, so a crash loses at most one batch. Opening an
+    existing log continues appending to it.
+    """
+    def __init__(self, path: str, plot_type: PlotType, name: str, plot_id: int, width: int,
+                 sync_every: int = BATCH_SIZE, sync_interval: float = 1.):
+        """
+        Args:
+            path (str): path of the log file
+            plot_type (PlotType): type of the tracker's plot
+            name (str): name of the tracker
+            plot_id (int): id of the tracker and its plot
+            width (int): number of values in each row
+            sync_every (int): number of appended rows after which the log is synced
+            sync_interval (float): seconds after which appended rows are synced
+        """
+        self._path: str = path
+        self._width: int = width
+        self._sync_every: int = sync_every
+        self._sync_interval: float = sync_interval
+
+        if os.path.exists(path):
+            info: LogInfo = read_log_info(path)
+            if (info.plot_id, info.width) != (plot_id, width):
+                raise ValueError(f"Log {path} holds plot {info.plot_id} with width {info.width}, "
+                                 f"expected plot {plot_id} with width {width}.")
+            self._file = open(path, "r+b")
+            self._count: int = info.rows
+        else:
+            self._file = open(path, "w+b")
+            header = LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, plot_type, plot_id, width, 0)
+            self._file.write(header + name.encode()[:NAME_SIZE].ljust(DATA_OFFSET - len(header), b"\0"))
+            self._count = 0
+
+        self._capacity: int = 0
+        self._rows: Optional[np.memmap] = None
+        self._map(max(INITIAL_ROWS, self._count))
+        self._unsynced: int = 0
+        self._last_sync: float = time.monotonic()
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def append(self, rows: NDArray) -> None:
+        """ Append a row or a block of rows.
+
+        Args:
+            rows (NDArray): values of shape (width,) or (n, width)
+        """
+        rows = np.asarray(rows, dtype=np.float32).reshape(-1, self._width)
+        n: int = len(rows)
+        mapped: Optional[np.memmap] = self._rows
+        if mapped is None or self._count + n > self._capacity:
+            mapped = self._map(self._count + n)
+        mapped[self._count: self._count + n] = rows
+        self._count += n
+        self._unsynced += n
+        if self._unsynced >= self._sync_every or time.monotonic() - self._last_sync >= self._sync_interval:
+            self.sync()
+
+    def sync(self) -> None:
+        """
+        Write all appended rows to disk and make them visible to readers.
+        """
+        if self._rows is not None:
+            self._rows.flush()
+        self._file.seek(ROWS_OFFSET)
+        self._file.write(struct.pack("<Q", self._count))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        """
+        Sync and close the log.
+        """
+        self.sync()
+        self._rows = None
+        self._file.close()
+
+    def _map(self, min_rows: int) -> np.memmap:
+        capacity: int = max(self._capacity, INITIAL_ROWS)
+        while capacity < min_rows:
+            capacity *= 2
+        if self._rows is not None:
+            self._rows.flush()
+            self._rows = None
+        self._file.truncate(DATA_OFFSET + capacity * self._width * np.dtype(np.float32).itemsize)
+        self._rows = np.memmap(self._file, dtype=np.float32, mode="r+", offset=DATA_OFFSET,
+                               shape=(capacity, self._width))
+        self._capacity = capacity
+        return self._rows
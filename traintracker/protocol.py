@@ -0,0 +1,283 @@
+import struct
+from typing import TYPE_CHECKING
+
+from traintracker.util.defs import *
+
+if TYPE_CHECKING:
+    # asyncio is only needed by the server, trainers should not pay for importing it
+    from asyncio import StreamReader
+
+# every message starts with the same header: cmd | plot id | payload size
+HEADER = struct.Struct("<III")
+# the payload of an add_plot message starts with the plot type and row width, followed by
+# the run and the name (separated by a null byte)
+ADD_PLOT = struct.Struct("<II")
+# the payload of the server's reply to an add_plot message: the plot's server id
+PLOT_ID = struct.Struct("<I")
+# the payload of a set_rank message: rank | world size | reduce
+SET_RANK = struct.Struct("<III")
+# the payload of a query message starts with: first step | last step | max points, followed by
+# the plot's "run/name"
+QUERY = struct.Struct("<ddI")
+# the payload of the reply to a query starts with: number of rows | size of the column names,
+# followed by the null separated column names and the columns (float64); an error has no names
+# and is followed by its message
+QUERY_RESULT = struct.Struct("<II")
+# the commands a frame may carry
+CMDS: Set[int] = {int(cmd) for cmd in Cmd}
+
+
+def pack_frame(cmd: Cmd, plot_id: int = 0, payload: bytes = b"") -> bytes:
+    """ Encode a single message.
+
+    Args:
+        cmd (Cmd): the command
+        plot_id (int): the plot this message refers to (0 if it refers to none)
+        payload (bytes): the command specific payload
+
+    Returns:
+        bytes: the encoded frame
+    """
+    return HEADER.pack(cmd, plot_id, len(payload)) + payload
+
+
+def pack_add_plot(plot_type: PlotType, plot_name: str, plot_id: int, width: int = 0, run: str = "") -> bytes:
+    """ Encode an add_plot message.
+
+    Args:
+        plot_type (PlotType): type of plot to be created
+        plot_name (str): name of plot to be created
+        plot_id (int): the client's id for the plot, used by all its later messages
+        width (int): number of values in each row, 0 for the plot type's fixed width
+        run (str): the run the plot belongs to
+
+    Returns:
+        bytes: the encoded frame
+    """
+    payload: bytes = ADD_PLOT.pack(plot_type, width) + run.encode() + b"\0" + plot_name.encode()
+    return pack_frame(Cmd.add_plot, plot_id, payload)
+
+
+def unpack_add_plot(payload: bytes) -> Tuple[PlotType, str, int, str]:
+    """ Decode the payload of an add_plot message.
+
+    Args:
+        payload (bytes): the message's payload
+
+    Returns:
+        Tuple: the plot type, the plot name, the row width and the run
+    """
+    plot_type, width = ADD_PLOT.unpack_from(payload)
+    run, plot_name = bytes(payload[ADD_PLOT.size:]).decode().split("\0", 1)
+    return PlotType(plot_type), plot_name, width, run
+
+
+def pack_set_rank(rank: int, world_size: int, reduce: Reduce) -> bytes:
+    """ Encode a set_rank message.
+
+    Args:
+        rank (int): rank of the client within a distributed job
+        world_size (int): number of ranks in the job
+        reduce (Reduce): how rows of the ranks are merged
+
+    Returns:
+        bytes: the encoded frame
+    """
+    return pack_frame(Cmd.set_rank, 0, SET_RANK.pack(rank, world_size, reduce))
+
+
+def unpack_set_rank(payload: bytes) -> Tuple[int, int, Reduce]:
+    """ Decode the payload of a set_rank message.
+
+    Args:
+        payload (bytes): the message's payload
+
+    Returns:
+        Tuple: the rank, the world size and the reduce operation
+    """
+    rank, world_size, reduce = SET_RANK.unpack(payload)
+    return rank, world_size, Reduce(reduce)
+
+
+def pack_query(request_id: int, plot_name: str, start: float, stop: float, max_points: int) -> bytes:
+    """ Encode a query message.
+
+    Args:
+        request_id (int): an id the reply will carry, sent in place of a plot id
+        plot_name (str): name of the plot, prefixed with its run
+        start (float): the first step included
+        stop (float): the last step included
+        max_points (int): maximum number of points returned
+
+    Returns:
+        bytes: the encoded frame
+    """
+    return pack_frame(Cmd.query, request_id, QUERY.pack(start, stop, max_points) + plot_name.encode())
+
+
+def unpack_query(payload: bytes) -> Tuple[str, float, float, int]:
+    """ Decode the payload of a query message.
+
+    Args:
+        payload (bytes): the message's payload
+
+    Returns:
+        Tuple: the plot name, the first and last step, and the maximum number of points
+    """
+    start, stop, max_points = QUERY.unpack_from(payload)
+    return bytes(payload[QUERY.size:]).decode(), start, stop, max_points
+
+
+def pack_query_result(request_id: int, result: Union[Dict[str, NDArray], str]) -> bytes:
+    """ Encode the reply to a query.
+
+    Args:
+        request_id (int): the id of the query
+        result (Dict or str): the result's columns, or why the query failed
+
+    Returns:
+        bytes: the encoded frame
+    """
+    if isinstance(result, str):
+        return pack_frame(Cmd.query, request_id, QUERY_RESULT.pack(0, 0) + result.encode())
+    names: bytes = "\0".join(result).encode()
+    n_rows: int = len(next(iter(result.values()))) if result else 0
+    columns: bytes = np.array(list(result.values()), dtype=np.float64).tobytes()
+    return pack_frame(Cmd.query, request_id, QUERY_RESULT.pack(n_rows, len(names)) + names + columns)
+
+
+def unpack_query_result(payload: bytes) -> Dict[str, NDArray]:
+    """ Decode the reply to a query.
+
+    Args:
+        payload (bytes): the message's payload
+
+    Returns:
+        Dict: the result's columns
+
+    Raises:
+        ValueError: if the server could not answer the query
+    """
+    n_rows, names_size = QUERY_RESULT.unpack_from(payload)
+    names: bytes = bytes(payload[QUERY_RESULT.size: QUERY_RESULT.size + names_size])
+    if not names:
+        raise ValueError(bytes(payload[QUERY_RESULT.size:]).decode())
+    column_names: List[str] = names.decode().split("\0")
+    columns: NDArray = np.frombuffer(payload, dtype=np.float64, offset=QUERY_RESULT.size + names_size)
+    return dict(zip(column_names, columns.reshape(len(column_names), n_rows)))
+
+
+def pack_update(plot_id: int, new_data: NDArray) -> bytes:
+    """ Encode an update_plot message.
+
+    Args:
+        plot_id (int): the plot to update
+        new_data (NDArray): new values, sent as float32
+
+    Returns:
+        bytes: the encoded frame
+    """
+    return pack_frame(Cmd.update_plot, plot_id, np.asarray(new_data, dtype=np.float32).tobytes())
+
+
+def batch_dtype(width: int) -> np.dtype:
+    """ Record layout of a single (plot id, row) entry in a batched update.
+
+    Args:
+        width (int): number of float32 values in each row
+
+    Returns:
+        np.dtype: a structured dtype with an ``id`` and a ``row`` field
+    """
+    return np.dtype([("id", "<u4"), ("row", "<f4", (width,))])
+
+
+def pack_batch(plot_ids: Sequence[int], rows: Union[Sequence[NDArray], NDArray]) -> bytes:
+    """ Encode many plot updates of equal width as a single batch frame.
+
+    The payload is laid out as ``width | records``.
+
+    Args:
+        plot_ids (Sequence[int]): the plot each row belongs to
+        rows (Sequence[NDArray] or NDArray): rows of equal width, one per plot id
+
+    Returns:
+        bytes: the encoded frame
+    """
+    rows = np.asarray(rows, dtype=np.float32)
+    if rows.ndim == 1:
+        rows = rows.reshape(1, -1)
+    width: int = rows.shape[1]
+    records: NDArray = np.empty(len(plot_ids), dtype=batch_dtype(width))
+    records["id"] = plot_ids
+    records["row"] = rows
+    return pack_frame(Cmd.batch_update, 0, width.to_bytes(INT32, BYTEORDER) + records.tobytes())
+
+
+def unpack_batch(payload: bytes) -> Tuple[NDArray, NDArray]:
+    """ Decode the payload of a batch frame in a single pass.
+
+    Args:
+        payload (bytes): the batch frame's payload
+
+    Returns:
+        Tuple: plot ids (n,) and rows (n, width), both views over ``payload``
+    """
+    width: int = int.from_bytes(payload[:INT32], BYTEORDER)
+    records: NDArray = np.frombuffer(payload, dtype=batch_dtype(width), offset=INT32)
+    return records["id"], records["row"]
+
+
+def split_by_plot(plot_ids: NDArray, rows: NDArray) -> Iterator[Tuple[int, NDArray]]:
+    """ Group decoded rows by plot, preserving the order of rows within each plot.
+
+    Args:
+        plot_ids (NDArray): plot id of each row
+        rows (NDArray): the decoded rows
+
+    Returns:
+        Iterator: (plot id, rows) pairs
+    """
+    order: NDArray = np.argsort(plot_ids, kind="stable")
+    unique_ids, starts = np.unique(plot_ids[order], return_index=True)
+    for plot_id, block in zip(unique_ids, np.split(rows[order], starts[1:])):
+        yield int(plot_id), block
+
+
+class FrameReader:
+    """ Reads whole frames off a stream.
+
+    ``readexactly`` never returns short, so a slow or fragmented stream cannot
+    desynchronize the reader.
+    """
+    def __init__(self, reader: "StreamReader"):
+        """
+        Args:
+            reader (StreamReader): the stream to read frames from
+        """
+        self._reader: "StreamReader" = reader
+
+    async def read_frame(self) -> Optional[Tuple[Cmd, int, bytes]]:
+        """ Read the next frame.
+
+        Returns:
+            Tuple or None: the command, plot id and payload, or None if the stream
+                was closed on a frame boundary
+
+        Raises:
+            ValueError: if the frame's command is unknown, the frame was read
+                whole, so the next frame can still be read
+            asyncio.IncompleteReadError: if the stream was closed within a frame
+        """
+        try:
+            header: bytes = await self._reader.readexactly(HEADER.size)
+        except EOFError as e:
+            # an asyncio.IncompleteReadError, asyncio is not imported at runtime
+            if getattr(e, "partial", b""):
+                raise
+            return None
+        cmd, plot_id, size = HEADER.unpack(header)
+        payload: bytes = await self._reader.readexactly(size) if size else b""
+        if cmd not in CMDS:
+            raise ValueError(f"Unknown command {cmd}.")
+        return Cmd(cmd), plot_id, payload
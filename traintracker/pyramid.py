@@ -0,0 +1,158 @@
+from traintracker.util.defs import *
+from traintracker.util.column_store import ColumnStore
+
+# number of buckets of one level that make up a bucket of the next
+FANOUT = 8
+STATS: Tuple[str, ...] = ("min", "max", "sum")
+
+
+class Pyramid:
+    """ A multi-resolution min/max/sum index over the rows of a growing ColumnStore.
+
+    Level ``l`` summarizes every aligned run of ``FANOUT ** l`` rows, levels are
+    extended as rows arrive (amortized O(1) per row). A query over any row range
+    at any resolution then reads at most ``max_points`` summaries, plus
+    O(FANOUT * levels) for the partial buckets at its edges, and never scans
+    the raw rows.
+    """
+    def __init__(self, columns: Sequence[str], x: str):
+        """
+        Args:
+            columns (Sequence[str]): the columns of the indexed store
+            x (str): the column rows are ordered by, e.g. the step
+        """
+        self.columns: Tuple[str, ...] = tuple(columns)
+        self.x: str = x
+        # levels[l - 1] holds the summaries of level l
+        self._levels: List[ColumnStore] = []
+
+    @property
+    def depth(self) -> int:
+        return len(self._levels)
+
+    def update(self, store: ColumnStore) -> None:
+        """ Summarize the buckets that rows added to ``store`` have completed.
+
+        Args:
+            store (ColumnStore): the indexed rows
+        """
+        level: int = 0
+        while True:
+            below: int = len(self._levels[level - 1]) if level else len(store)
+            done: int = len(self._levels[level]) * FANOUT if level < len(self._levels) else 0
+            end: int = below - below % FANOUT
+            if end <= done:
+                return
+            if level:
+                # the completed buckets of the level below complete buckets of this one
+                below_level: ColumnStore = self._levels[level - 1]
+                blocks = [self._read(below_level, stat, done, end).reshape(-1, FANOUT, len(self.columns))
+                          for stat in STATS]
+            else:
+                rows: NDArray = self._rows(store, done, end)
+                blocks = [rows.reshape(-1, FANOUT, len(self.columns))] * len(STATS)
+            summaries: List[NDArray] = [blocks[0].min(axis=1), blocks[1].max(axis=1), blocks[2].sum(axis=1)]
+            if level == len(self._levels):
+                self._levels.append(ColumnStore({f"{column}_{stat}": np.float64
+                                                 for stat in STATS for column in self.columns}))
+            self._levels[level].extend(np.concatenate(summaries, axis=1))
+            level += 1
+
+    def query(self, store: ColumnStore, start: float = -np.inf, stop: float = np.inf,
+              max_points: int = MAX_POINTS) -> Dict[str, NDArray]:
+        """ The rows with ``x`` in [start, stop], reduced to at most about ``max_points`` buckets.
+
+        Args:
+            store (ColumnStore): the indexed rows, ordered by ``x``
+            start (float): the first value of ``x`` included
+            stop (float): the last value of ``x`` included
+            max_points (int): maximum number of buckets returned (two more may be
+                needed for the partial buckets at the range's edges)
+
+        Returns:
+            Dict: per bucket, ``x`` is its first value, every other column its mean,
+                ``<column>_min`` and ``<column>_max`` its extremes, and ``count``
+                the number of rows summarized
+        """
+        xs: NDArray = store[self.x]
+        i0, i1 = self._search(xs, start, "left"), self._search(xs, stop, "right")
+        if i1 - i0 <= max_points or not self._levels:
+            rows: NDArray = self._rows(store, i0, i1)
+            return self._result(rows, rows, rows, np.ones(len(rows)))
+        # the finest level that fits, it only uses complete buckets
+        level: int = 1
+        while level < len(self._levels) and (i1 - i0) / FANOUT ** level > max_points:
+            level += 1
+        size: int = FANOUT ** level
+        b0: int = -(-i0 // size)
+        b1: int = max(min(i1 // size, len(self._levels[level - 1])), b0)
+        # the partial buckets at the edges hold fewer than size rows each
+        parts: List[Tuple[NDArray, ...]] = []
+        left_end: int = min(b0 * size, i1)
+        if i0 < left_end:
+            parts.append(self._reduce(store, i0, left_end))
+        if b1 > b0:
+            summaries: ColumnStore = self._levels[level - 1]
+            parts.append(tuple(self._read(summaries, stat, b0, b1) for stat in STATS)
+                         + (np.full(b1 - b0, float(size)),))
+        right_start: int = max(b1 * size, left_end)
+        if right_start < i1:
+            parts.append(self._reduce(store, right_start, i1))
+        return self._result(*(np.concatenate([part[i] for part in parts]) for i in range(4)))
+
+    def _search(self, xs: NDArray, value: float, side: str) -> int:
+        # searching with a key of another dtype would convert all of xs, the
+        # rounded key can only be off by the values equal to it
+        key = xs.dtype.type(value)
+        i: int = int(np.searchsorted(xs, key, "left" if side == "left" else "right"))
+        if side == "left" and key < value:
+            while i < len(xs) and xs[i] < value:
+                i += 1
+        elif side == "right" and key > value:
+            while i > 0 and xs[i - 1] > value:
+                i -= 1
+        return i
+
+    def _reduce(self, store: ColumnStore, lo: int, hi: int) -> Tuple[NDArray, NDArray, NDArray, NDArray]:
+        # one bucket for rows [lo, hi), from the coarsest summaries that fit
+        mins: List[NDArray] = []
+        maxs: List[NDArray] = []
+        sums: List[NDArray] = []
+        i: int = lo
+        while i < hi:
+            for level in range(len(self._levels), 0, -1):
+                size = FANOUT ** level
+                if i % size == 0 and i + size <= hi and i // size < len(self._levels[level - 1]):
+                    summaries: ColumnStore = self._levels[level - 1]
+                    part = [self._read(summaries, stat, i // size, i // size + 1)[0] for stat in STATS]
+                    i += size
+                    break
+            else:
+                # raw rows up to the next bucket of the first level
+                j: int = min(hi, (i // FANOUT + 1) * FANOUT)
+                rows: NDArray = self._rows(store, i, j)
+                part = [rows.min(axis=0), rows.max(axis=0), rows.sum(axis=0)]
+                i = j
+            mins.append(part[0])
+            maxs.append(part[1])
+            sums.append(part[2])
+        return (np.min(mins, axis=0)[None], np.max(maxs, axis=0)[None], np.sum(sums, axis=0)[None],
+                np.array([hi - lo], dtype=np.float64))
+
+    def _rows(self, store: ColumnStore, lo: int, hi: int) -> NDArray:
+        return np.stack([store[column][lo: hi] for column in self.columns], axis=1).astype(np.float64)
+
+    def _read(self, summaries: ColumnStore, stat: str, lo: int, hi: int) -> NDArray:
+        return np.stack([summaries[f"{column}_{stat}"][lo: hi] for column in self.columns], axis=1)
+
+    def _result(self, mins: NDArray, maxs: NDArray, sums: NDArray, counts: NDArray) -> Dict[str, NDArray]:
+        result: Dict[str, NDArray] = {}
+        for i, column in enumerate(self.columns):
+            if column == self.x:
+                result[column] = mins[:, i]
+                continue
+            result[column] = sums[:, i] / counts
+            result[f"{column}_min"] = mins[:, i]
+            result[f"{column}_max"] = maxs[:, i]
+        result["count"] = counts
+        return result
@@ -0,0 +1,249 @@
+import select
+import socket
+import threading
+from collections import deque
+from typing import Callable
+
+from traintracker.util.defs import *
+
+
+class BackgroundSender:
+    """ A bounded ring buffer of outgoing messages drained by a dedicated thread.
+
+    Producers (e.g. the training thread) only ever touch the in-memory buffer,
+    the sender thread is the only one that writes to the socket.
+
+    Given a ``connect`` callable the sender is resilient: it (re)connects on its
+    own, with exponential backoff, and keeps buffering while the server is away.
+    After every reconnect the ``handshake`` messages are sent first, followed by
+    the backlog in a single write. A message that was only partly written when
+    the connection failed is sent again whole, those written before it are not;
+    these may still be lost if the server never read them.
+    """
+    def __init__(self, sock: Optional[socket.socket], capacity: int = SEND_BUFFER_SIZE,
+                 policy: FullPolicy = FullPolicy.block,
+                 connect: Optional[Callable[[], socket.socket]] = None,
+                 handshake: Optional[Callable[[], List[bytes]]] = None,
+                 backoff: Tuple[float, float] = RECONNECT_BACKOFF):
+        """
+        Args:
+            sock (socket.socket or None): a connected socket to drain messages into,
+                None to let ``connect`` open one
+            capacity (int): maximum number of droppable messages held in the buffer
+            policy (FullPolicy): what to do with a new message when the buffer is full
+            connect (callable or None): opens a new connection to the server, None
+                to stop at the first failed write
+            handshake (callable or None): the messages to send first on every new connection
+            backoff (tuple): initial and maximum number of seconds between reconnect attempts
+        """
+        if capacity < 1:
+            raise ValueError(f"Buffer capacity must be positive, got: {capacity}")
+        if sock is None and connect is None:
+            raise ValueError("A sender needs either a socket or a way to connect.")
+        self._socket: Optional[socket.socket] = sock
+        self._capacity: int = capacity
+        self._policy: FullPolicy = policy
+        self._connect: Optional[Callable[[], socket.socket]] = connect
+        self._handshake: Optional[Callable[[], List[bytes]]] = handshake
+        self._backoff: Tuple[float, float] = backoff
+
+        self._buffer: Deque[Tuple[bytes, bool]] = deque()
+        self._n_droppable: int = 0
+        self._cond = threading.Condition()
+        self._in_flight: int = 0
+        self._closed: bool = False
+        self._error: Optional[BaseException] = None
+        self._thread: Optional[threading.Thread] = None
+
+        self.queued: int = 0
+        self.dropped: int = 0
+        self.sent: int = 0
+        self.reconnects: int = 0
+
+    @property
+    def pending(self) -> int:
+        """ Number of messages currently waiting in the buffer. """
+        return len(self._buffer)
+
+    @property
+    def socket(self) -> Optional[socket.socket]:
+        """ The current connection, None while disconnected. """
+        return self._socket
+
+    def start(self) -> None:
+        """
+        Start the sender thread.
+        """
+        self._thread = threading.Thread(target=self._run, name="traintracker-sender", daemon=True)
+        self._thread.start()
+
+    def put(self, data: bytes, droppable: bool = True) -> bool:
+        """ Place a message in the buffer.
+
+        Control messages (``droppable=False``) are never dropped and do not count
+        towards the buffer's capacity.
+
+        Args:
+            data (bytes): an encoded message
+            droppable (bool): whether the full-buffer policy may discard this message
+
+        Returns:
+            bool: whether the message was accepted into the buffer
+        """
+        with self._cond:
+            self._raise_if_failed()
+            if droppable and self._n_droppable >= self._capacity:
+                if self._policy == FullPolicy.drop_newest:
+                    self.dropped += 1
+                    return False
+                elif self._policy == FullPolicy.drop_oldest:
+                    self._drop_oldest()
+                else:
+                    while self._n_droppable >= self._capacity and not self._closed:
+                        self._cond.wait()
+                        self._raise_if_failed()
+            self._buffer.append((data, droppable))
+            self._n_droppable += droppable
+            self.queued += 1
+            self._cond.notify_all()
+        return True
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """ Wait until every buffered message has been written to the socket.
+
+        Args:
+            timeout (float or None): maximum number of seconds to wait
+
+        Returns:
+            bool: whether the buffer was fully drained
+        """
+        with self._cond:
+            drained = self._cond.wait_for(
+                lambda: self._error is not None or not (self._buffer or self._in_flight), timeout
+            )
+            self._raise_if_failed()
+            return drained
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """ Drain the buffer and stop the sender thread.
+
+        Args:
+            timeout (float or None): maximum number of seconds to wait for the drain
+        """
+        if self._thread:
+            self.drain(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _drop_oldest(self) -> None:
+        for i, (_, droppable) in enumerate(self._buffer):
+            if droppable:
+                del self._buffer[i]
+                self._n_droppable -= 1
+                self.dropped += 1
+                return
+
+    def _raise_if_failed(self) -> None:
+        if self._error is not None:
+            raise ConnectionError(f"Background sender stopped: {self._error}") from self._error
+
+    def _requeue(self, batch: List[Tuple[bytes, bool]], written: int) -> None:
+        # messages the socket took whole are done, the first torn one and the rest of the
+        # batch go back in front of whatever was buffered meanwhile
+        n_sent: int = 0
+        for data, _ in batch:
+            if written < len(data):
+                break
+            written -= len(data)
+            n_sent += 1
+        batch = batch[n_sent:]
+        with self._cond:
+            self.sent += n_sent
+            self._buffer.extendleft(reversed(batch))
+            self._n_droppable += sum(droppable for _, droppable in batch)
+            while self._n_droppable > self._capacity and self._policy == FullPolicy.drop_oldest:
+                self._drop_oldest()
+            self._in_flight = 0
+            self._cond.notify_all()
+
+    def _peer_closed(self) -> bool:
+        # a write to a connection the server has closed still succeeds once, so
+        # look for its end of stream first; replies are of no use here and dropped
+        sock: Optional[socket.socket] = self._socket
+        if sock is None:
+            return True
+        try:
+            while select.select([sock], [], [], 0)[0]:
+                if not sock.recv(BUFFSIZE):
+                    return True
+        except OSError:
+            return True
+        return False
+
+    def _reconnect(self) -> bool:
+        if self._connect is None:
+            return False
+        connect: Callable[[], socket.socket] = self._connect
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        delay, max_delay = self._backoff
+        while True:
+            try:
+                sock: socket.socket = connect()
+                break
+            except OSError:
+                pass
+            with self._cond:
+                if self._cond.wait_for(lambda: self._closed, delay):
+                    return False
+            delay = min(delay * 2, max_delay)
+        self._socket = sock
+        self.reconnects += 1
+        if self._handshake:
+            with self._cond:
+                self._buffer.extendleft((data, False) for data in reversed(self._handshake()))
+        return True
+
+    def _run(self) -> None:
+        if self._socket is None and not self._reconnect():
+            return
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._buffer or self._closed)
+                if not self._buffer:
+                    return
+                # take everything that is buffered so it goes out in a single write
+                batch = list(self._buffer)
+                self._buffer.clear()
+                self._n_droppable = 0
+                self._in_flight = len(batch)
+                self._cond.notify_all()
+            payload = memoryview(b"".join(data for data, _ in batch))
+            written: int = 0
+            try:
+                sock: Optional[socket.socket] = self._socket
+                if sock is None or (self._connect and self._peer_closed()):
+                    raise ConnectionError("Connection closed by the server.")
+                # unlike sendall, send tells how much of the batch got out before a failure
+                while written < len(payload):
+                    written += sock.send(payload[written:])
+            except OSError as e:
+                if self._connect:
+                    self._requeue(batch, written)
+                    if self._reconnect():
+                        continue
+                    return
+                with self._cond:
+                    self._error = e
+                    self._in_flight = 0
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self.sent += self._in_flight
+                self._in_flight = 0
+                self._cond.notify_all()
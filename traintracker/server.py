@@ -1,14 +1,54 @@
 import asyncio
+import json
+import os
+import time
 from asyncio import StreamReader, StreamWriter
 from queue import Queue
-from bokeh.server.server import Server as BokehServer
-from bokeh.plotting import figure, ColumnDataSource, gridplot
-from bokeh.document.document import Document
+try:
+    from bokeh.server.server import Server as BokehServer
+    from bokeh.plotting import figure, ColumnDataSource
+    from bokeh.document.document import Document
+    from tornado.ioloop import PeriodicCallback
+except ImportError as e:
+    raise ImportError("The server needs bokeh, install it with: pip install traintracker[server]") from e
 from copy import deepcopy
-from dask import delayed, compute
+from functools import partial
+from itertools import count
 
 from traintracker.util.defs import *
-from traintracker.tracker_plots import TrackerPlot
+from traintracker.tracker_plots import TrackerPlot, Retention
+from traintracker.dashboard import Dashboard
+from traintracker.transforms import Transform
+from traintracker.protocol import (FrameReader, PLOT_ID, pack_frame, unpack_add_plot, unpack_batch,
+                                   unpack_set_rank, split_by_plot, unpack_query, pack_query_result)
+from traintracker.aggregate import RankAggregator
+from traintracker.metric_log import MetricLog, LOG_SUFFIX, log_path, read_log
+from traintracker.stats import ServerStats, format_text
+from traintracker.export import Exporter
+
+
+class Session:
+    """
+    The state of a single client connection.
+    """
+    def __init__(self, id_: int, reader: StreamReader, writer: StreamWriter):
+        """
+        Args:
+            id_ (int): a server unique id for this session
+            reader (StreamReader): stream the client's frames are read from
+            writer (StreamWriter): stream back to the client
+        """
+        self.id: int = id_
+        self.frames: FrameReader = FrameReader(reader)
+        self.writer: StreamWriter = writer
+        # the client's plot ids -> the server's plot ids
+        self.plot_ids: Dict[int, int] = {}
+        # plots whose updates arrive through shared memory rings owned by this client
+        self.ring_ids: List[int] = []
+        # set if the client is one rank of a distributed job
+        self.rank: Optional[int] = None
+        self.world_size: int = 1
+        self.reduce: Reduce = Reduce.mean
 
 
 class Server:
@@ -16,37 +56,199 @@ class Server:
     
     Communications involves commands regarding plot creation and updating.
     It is also responsible for managing a separate plot server.
+
+    Any number of clients may be connected at once, each one in its own session.
+    A client asking for a shutdown only ends its own session, the server stops
+    once the last session has left after a shutdown was requested (unless it is
+    kept alive).
+
+    Plots are registered by (run, tracker name) and get a dense server id, so
+    a client that reconnects, or restarts, resumes the same plot. Clients refer
+    to their plots with their own ids, which every session maps to the server's.
+    Clients that are ranks of a distributed job share one plot per tracker
+    name, the rows of all ranks are merged per step before they are plotted.
+
+    Any number of browsers may show the plots at once. Every browser session
+    gets its own document with its own views of the plots, all over the same
+    history, and one tick streams each plot's new rows to every document.
+
+    The server keeps statistics about itself, see ``stats``. Clients can query
+    them, and ``run`` can serve them as text over HTTP.
     """
-    def __init__(self):
+    def __init__(self, keep_alive: bool = False, retention: Retention = Retention(),
+                 log_dir: Optional[str] = None):
+        """
+        Args:
+            keep_alive (bool): whether to keep serving after every client has asked
+                for a shutdown, e.g. for one dashboard shared by a sweep of trainers
+            retention (Retention): how much history plots send to the browser,
+                unless overridden per plot with ``set_retention``
+            log_dir (str or None): directory in which every plot's rows are logged;
+                existing logs in it are replayed when the server runs
+        """
         self._host: Optional[str] = None
         self._port: Optional[int] = None
         self._plot_server_port: Optional[int] = None
 
-        self._reader: Optional[StreamReader] = None
-        self._writer: Optional[StreamWriter] = None
+        self._keep_alive: bool = keep_alive
+        self._shutdown_requested: bool = False
+        self._session_ids: Iterator[int] = count(1)
+        self._sessions: Dict[int, Session] = {}
         self._plot_server: Optional[BokehServer] = None
+        # streams to every document at once, see _update_plots
+        self._ticker: Optional[PeriodicCallback] = None
+        # one per browser session
+        self._dashboards: List[Dashboard] = []
+
+        self._retention: Retention = retention
+        self._retentions: Dict[str, Retention] = {}
+        self._transforms: Dict[str, List[Transform]] = {}
+        # "run/name" -> plot id, plot ids index the dense lists below
+        self._registry: Dict[str, int] = {}
+        self._plots: List[Optional[TrackerPlot]] = []
+        self._queues: List[Optional[Queue]] = []
+        # plots with queued data that has not been streamed yet
+        self._dirty: Set[int] = set()
+        self._log_dir: Optional[str] = log_dir
+        self._logs: Dict[int, MetricLog] = {}
+        self._exports: Dict[int, Exporter] = {}
+        # plot id -> merges the rows of the ranks of a distributed job
+        self._aggregators: Dict[int, RankAggregator] = {}
+        # (session id, server plot id) -> ShmRing, only imported when a client uses shared memory
+        self._rings: Dict[Tuple[int, int], Any] = {}
+        self._ring_poller: Optional[asyncio.TimerHandle] = None
+        self._stats: ServerStats = ServerStats()
+        self._stats_port: Optional[int] = None
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+
+    def set_retention(self, plot_name: str, retention: Retention) -> None:
+        """ Override the retention policy of a plot.
+
+        Plots are registered under their tracker's name prefixed with the client's
+        run, e.g. ``"run_1/loss"``, or under the bare name for clients without a
+        run. The policy has to be set before the plot is registered.
+
+        Args:
+            plot_name (str): name of the plot, prefixed with its run
+            retention (Retention): how much history the plot sends to the browser
+        """
+        self._retentions[plot_name] = retention
+
+    def add_transform(self, plot_name: str, transform: Transform) -> None:
+        """ Show a series derived from one of a plot's columns, e.g. its EMA.
+
+        The series is computed on the server, so it costs the client nothing.
+        Transforms have to be added before the plot is registered.
+
+        Args:
+            plot_name (str): name of the plot, prefixed with its run
+            transform (Transform): the transform, not shared with any other plot
+        """
+        self._transforms.setdefault(plot_name, []).append(transform)
+
+    def stats(self) -> Dict[str, Any]:
+        """ Statistics about the server: messages and bytes received and messages
+        skipped as invalid per command, messages with an unknown command, rows
+        received, queue depth per plot id, stream calls, the duration of plot
+        update ticks and the lag of the event loop.
+
+        Returns:
+            Dict: the statistics, JSON serializable
+        """
+        depths: Dict[int, int] = {plot_id: queue.qsize() for plot_id, queue in enumerate(self._queues) if queue}
+        return self._stats.snapshot(depths, len(self._sessions))
+
+    def query(self, plot_name: str, start: float = -np.inf, stop: float = np.inf,
+              max_points: int = MAX_POINTS) -> Dict[str, NDArray]:
+        """ A step range of a plot's history at a bounded resolution.
+
+        Served from the plot's min/max/mean index, whatever the size of its history.
+
+        Args:
+            plot_name (str): name of the plot, prefixed with its run
+            start (float): the first step included
+            stop (float): the last step included
+            max_points (int): maximum number of points returned
+
+        Returns:
+            Dict: per point, the step it starts at, the mean, min and max of every
+                other column, and the number of rows it summarizes
+        """
+        if plot_name not in self._registry:
+            raise ValueError(f"There is no plot named {plot_name}.")
+        return self._plot(self._registry[plot_name]).query(start, stop, max_points)
+
+    def export(self, plot_name: str, path: str, chunk_rows: int = EXPORT_CHUNK) -> Exporter:
+        """ Stream a plot's rows, derived columns included, to a file, see ``read_export`` to load it.
 
-        self._plots: Dict[int, TrackerPlot] = {}
-        self._queues: Dict[int, Queue] = {}
+        The rows received so far are written right away (for histograms, only
+        the retained window), later ones as they arrive, in chunks of
+        ``chunk_rows``. The file is complete once ``close_export`` is called,
+        or once the server stops.
 
-    def run(self, host: str, port: int = PORT, plots_port: int = PS_PORT) -> None:
+        Args:
+            plot_name (str): name of the plot, prefixed with its run
+            path (str): path of a ``.npz`` file, or of a ``.parquet`` file if pyarrow
+                is installed
+            chunk_rows (int): number of rows written at once
+
+        Returns:
+            Exporter: the export, e.g. to check how many rows were written
+        """
+        if plot_name not in self._registry:
+            raise ValueError(f"There is no plot named {plot_name}.")
+        plot_id: int = self._registry[plot_name]
+        if plot_id in self._exports:
+            raise ValueError(f"Plot {plot_name} is already exported to {self._exports[plot_id].path}.")
+        plot: TrackerPlot = self._plot(plot_id)
+        exporter = Exporter(path, plot.store.dtypes, chunk_rows)
+        exporter.write_store(plot.store)
+        self._exports[plot_id] = exporter
+        return exporter
+
+    def close_export(self, plot_name: str) -> None:
+        """ Write the rest of a plot's rows to its export and finish the file.
+
+        Args:
+            plot_name (str): name of the plot, prefixed with its run
+        """
+        plot_id: Optional[int] = self._registry.get(plot_name)
+        if plot_id in self._exports:
+            self._exports.pop(plot_id).close()
+
+    def run(self, host: str, port: int = PORT, plots_port: int = PS_PORT, stats_port: Optional[int] = None) -> None:
         """ Run the server.
 
         Args:
             host (str): host on which to run
             port (int): port on which to run the server
             plots_port (int): port on which to serve plots
+            stats_port (int or None): port on which to serve the server's statistics
+                as text over HTTP, on the local host only
         """
         self._host = host
         self._port = port
         self._plot_server_port = plots_port
+        self._stats_port = stats_port
+        if self._log_dir:
+            self._replay_logs()
         try:
             asyncio.run(self._run_async())
         except RuntimeError as re:
             print(f"Server shutdown with runtime error: {re}")
+        finally:
+            for log in self._logs.values():
+                log.close()
+            for exporter in self._exports.values():
+                exporter.close()
 
     async def _run_async(self) -> None:
         server = await asyncio.start_server(self._handle_serving, self._host, self. _port)
+        self._stats.watch_loop()
+        if self._stats_port is not None:
+            await asyncio.start_server(self._handle_stats_request, "127.0.0.1", self._stats_port)
+            print(f"Serving statistics on port: {self._stats_port}")
         if server.sockets:
             addr: Tuple[str, int] = server.sockets[0].getsockname()
             print(f"Serving at {addr[0]} on port {addr[1]}")
@@ -54,79 +256,279 @@ class Server:
                 await server.serve_forever()
 
     def _start_plot_server(self) -> None:
-        self._plot_server = BokehServer({'/': self._make_document}, port=self._plot_server_port, num_procs=1)
-        self._plot_server.start()
-        self._plot_server.io_loop.add_callback(self._plot_server.show, "/")
+        if self._plot_server:
+            # another session already started it
+            return
+        if self._plot_server_port is None:
+            raise ValueError("No port to serve plots on, call serve first.")
+        plot_server: BokehServer = self._serve_plots(self._plot_server_port)
+        plot_server.io_loop.add_callback(plot_server.show, "/")
         print(f"Serving plots on port: {self._plot_server_port}")
         # self._plot_server.io_loop.start()
 
+    def _serve_plots(self, port: int) -> BokehServer:
+        # must be called on the server's event loop, the plot server and the ticker share it
+        plot_server = BokehServer({'/': self._make_document}, port=port, num_procs=1)
+        plot_server.start()
+        self._plot_server = plot_server
+        self._ticker = PeriodicCallback(self._update_plots, TIMEOUT)
+        self._ticker.start()
+        return plot_server
+
     def _make_document(self, doc: Document) -> None:
+        # every browser session gets its own views, the data behind them is shared
         doc.title = "Train Tracker"
-        # for _, plot in self._plots.items():
-        #     doc.add_root(plot.fig)
-        figs = [plot.fig for _, plot in self._plots.items()]
-        grid = [figs[i: i + 3] for i in range(0, len(figs), 3)]
-        doc.add_root(gridplot(grid))
+        dashboard = Dashboard(doc, [plot for plot in self._plots if plot])
+        self._dashboards.append(dashboard)
+        doc.on_session_destroyed(lambda session_context: self._drop_dashboard(dashboard))
 
-        doc.add_periodic_callback(lambda: self._update_plots(doc), TIMEOUT)
+    def _drop_dashboard(self, dashboard: Dashboard) -> None:
+        dashboard.close()
+        self._dashboards.remove(dashboard)
 
     async def _handle_serving(self, reader: StreamReader, writer: StreamWriter) -> None:
-        self._writer = writer
-        self._reader = reader
+        session = Session(next(self._session_ids), reader, writer)
+        self._sessions[session.id] = session
 
-        while True:
-            cmd_bytes = await self._reader.read(INT32)
-            cmd = int.from_bytes(cmd_bytes, BYTEORDER)
-            # print(f"Received command: {Cmd(cmd).name}")
+        try:
+            while True:
+                try:
+                    frame = await session.frames.read_frame()
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    # the client went away, possibly within a frame
+                    break
+                except ValueError as e:
+                    # an unknown command, the frame was read whole and is skipped
+                    self._stats.unknown_commands += 1
+                    print(f"Skipped message: {e}")
+                    continue
+                if frame is None:
+                    # client went away without asking for a shutdown
+                    break
+                cmd, plot_id, payload = frame
+                self._stats.count_message(cmd, len(payload))
+                # print(f"Received command: {cmd.name}")
+
+                # If command is server_shutdown, this is a special case
+                if cmd == Cmd.server_shutdown:
+                    print(f"Closing connection...")
+                    self._shutdown_requested = True
+                    break
 
-            # If command is server_shutdown, this is a special case
-            if cmd == Cmd.server_shutdown:
-                print(f"Closing connection...")
-                self._writer.close()
-                asyncio.get_event_loop().stop()
-                return
+                # Handle command, a bad frame is skipped: a resilient client would resend it on every reconnect
+                try:
+                    self._handle_cmd(session, cmd, plot_id, payload)
+                except (KeyError, ValueError) as e:
+                    self._stats.count_error(cmd)
+                    print(f"Skipped {cmd.name} message for plot {plot_id}: {e!r}")
+        finally:
+            self._end_session(session)
 
-            # Handle command
-            await self._handle_cmd(Cmd(cmd))
+    def _end_session(self, session: Session) -> None:
+        del self._sessions[session.id]
+        session.writer.close()
+        self._detach_rings(session)
+        if session.rank is not None:
+            # only the session's own job stops waiting, and not if the rank already reconnected
+            for plot_id in set(session.plot_ids.values()):
+                if plot_id in self._aggregators and not self._rank_connected(session.rank, plot_id):
+                    self._record_merged(plot_id, self._aggregators[plot_id].finish(session.rank))
+        for log in self._logs.values():
+            log.sync()
+        if self._shutdown_requested and not self._sessions and not self._keep_alive:
+            asyncio.get_event_loop().stop()
 
-    async def _handle_cmd(self, cmd: Cmd) -> None:
-        if not self._reader:
-            raise AttributeError("Reader cannot be None when handling commands.")
+    def _rank_connected(self, rank: int, plot_id: int) -> bool:
+        return any(other.rank == rank and plot_id in other.plot_ids.values() for other in self._sessions.values())
 
+    def _handle_cmd(self, session: Session, cmd: Cmd, plot_id: int, payload: bytes) -> None:
         if cmd == Cmd.update_plot:
-            await self._handle_plot_update(self._reader)
+            self._handle_plot_update(session.plot_ids[plot_id], payload, session)
+        elif cmd == Cmd.batch_update:
+            self._handle_batch_update(payload, session)
         elif cmd == Cmd.add_plot:
-            await self._handle_add_plot(self._reader)
+            self._handle_add_plot(plot_id, payload, session)
+        elif cmd == Cmd.set_rank:
+            session.rank, session.world_size, session.reduce = unpack_set_rank(payload)
+        elif cmd == Cmd.attach_shm:
+            self._attach_ring(session, session.plot_ids[plot_id], payload.decode())
+        elif cmd == Cmd.query:
+            self._handle_query(session, plot_id, payload)
+        elif cmd == Cmd.stats:
+            session.writer.write(pack_frame(Cmd.stats, 0, json.dumps(self.stats()).encode()))
         elif cmd == Cmd.start_plot_server:
             self._start_plot_server()
 
-    async def _handle_plot_update(self, reader: StreamReader) -> None:
-        plot_id_bytes = await reader.read(INT32)
-        plot_id = int.from_bytes(plot_id_bytes, BYTEORDER)
-        new_data_size: int = int.from_bytes(await reader.read(INT32), BYTEORDER)
-        new_data: NDArray = np.frombuffer(await reader.read(new_data_size),
-                                          dtype=np.float32)
-        self._queues[plot_id].put(new_data)
-
-    async def _handle_add_plot(self, reader: StreamReader) -> None:
-        plot_type_bytes = await reader.read(INT32)
-        plot_type = PlotType(int.from_bytes(plot_type_bytes, BYTEORDER))
-        plot_id_bytes = await reader.read(INT32)
-        plot_id = int.from_bytes(plot_id_bytes, BYTEORDER)
-        plot_name_size = int.from_bytes(await reader.read(INT32), BYTEORDER)
-        plot_name_bytes = await reader.read(plot_name_size)
-        plot_name: str = plot_name_bytes.decode()
-
-        self._add_plot(plot_type, plot_name, plot_id)
-
-    def _add_plot(self, plot_type: PlotType, plot_name: str, plot_id: int) -> None:
-        if plot_id not in self._plots:
-            self._plots[plot_id] = TrackerPlot.build_plot(plot_type, plot_name, plot_id)
-            self._queues[plot_id] = Queue()
-
-    def _update_plots(self, doc: Document) -> None:
-        # update each plot/queue pair in parallel
-        compute(
-            delayed(plot.update_from_queue)(self._queues[name], doc) for name, plot, in self._plots.items()
-        )
+    def _handle_query(self, session: Session, request_id: int, payload: bytes) -> None:
+        try:
+            result: Union[Dict[str, NDArray], str] = self.query(*unpack_query(payload))
+        except ValueError as e:
+            result = str(e)
+        session.writer.write(pack_query_result(request_id, result))
+
+    async def _handle_stats_request(self, reader: StreamReader, writer: StreamWriter) -> None:
+        # a minimal HTTP/1.0 endpoint, whatever the path, the request is read up to its headers' end
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body: bytes = format_text(self.stats()).encode()
+            writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         b"Content-Length: %d\r\n\r\n" % len(body) + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _handle_plot_update(self, plot_id: int, payload: bytes, session: Optional[Session] = None) -> None:
+        # a single row or a contiguous block of rows
+        new_data: NDArray = np.frombuffer(payload, dtype=np.float32)
+        self._receive(session, plot_id, new_data.reshape(-1, len(self._plot(plot_id).columns)))
+
+    def _handle_batch_update(self, payload: bytes, session: Optional[Session] = None) -> None:
+        plot_ids, rows = unpack_batch(payload)
+        for plot_id, block in split_by_plot(plot_ids, rows):
+            self._receive(session, session.plot_ids[plot_id] if session else plot_id, block)
+
+    def _handle_add_plot(self, client_id: int, payload: bytes, session: Optional[Session] = None) -> None:
+        plot_type, plot_name, width, run = unpack_add_plot(payload)
+        plot_id: int = self._add_plot(plot_type, f"{run}/{plot_name}" if run else plot_name, width)
+        if session:
+            session.plot_ids[client_id] = plot_id
+            session.writer.write(pack_frame(Cmd.add_plot, client_id, PLOT_ID.pack(plot_id)))
+            if session.rank is not None and plot_id not in self._aggregators:
+                self._aggregators[plot_id] = RankAggregator(session.world_size, session.reduce)
+
+    def _add_plot(self, plot_type: PlotType, plot_name: str, width: int = 0, plot_id: Optional[int] = None) -> int:
+        """ Register a plot, unless a plot with the same name already exists.
+
+        Args:
+            plot_type (PlotType): type of plot to be created
+            plot_name (str): name of the plot, prefixed with its run
+            width (int): number of values in each row, 0 for the plot type's fixed width
+            plot_id (int or None): the id to register the plot under, by default the
+                next free id
+
+        Returns:
+            int: the plot's id
+        """
+        if plot_name in self._registry:
+            return self._registry[plot_name]
+        if plot_id is None:
+            plot_id = len(self._plots)
+        if plot_id >= len(self._plots):
+            self._plots.extend([None] * (plot_id + 1 - len(self._plots)))
+            self._queues.extend([None] * (plot_id + 1 - len(self._queues)))
+        self._registry[plot_name] = plot_id
+        retention = self._retentions.get(plot_name, self._retention)
+        plot: TrackerPlot = TrackerPlot.build_plot(plot_type, plot_name, plot_id, retention, width,
+                                                   self._transforms.get(plot_name, ()))
+        self._plots[plot_id] = plot
+        self._queues[plot_id] = Queue()
+        for dashboard in self._dashboards:
+            # documents are only changed from their own callbacks, where they are locked
+            dashboard.doc.add_next_tick_callback(partial(dashboard.add_plot, plot))
+        if self._log_dir:
+            width = len(plot.columns)
+            self._logs[plot_id] = MetricLog(log_path(self._log_dir, plot_id), plot_type, plot_name, plot_id, width)
+        return plot_id
+
+    def _plot(self, plot_id: int) -> TrackerPlot:
+        plot: Optional[TrackerPlot] = self._plots[plot_id] if plot_id < len(self._plots) else None
+        if plot is None:
+            raise ValueError(f"There is no plot with id {plot_id}.")
+        return plot
+
+    def _queue(self, plot_id: int) -> Queue:
+        queue: Optional[Queue] = self._queues[plot_id] if plot_id < len(self._queues) else None
+        if queue is None:
+            raise ValueError(f"There is no plot with id {plot_id}.")
+        return queue
+
+    def _receive(self, session: Optional[Session], plot_id: int, new_data: NDArray) -> None:
+        if session and session.rank is not None:
+            self._record_merged(plot_id, self._aggregators[plot_id].add(session.rank, new_data))
+        else:
+            self._record(plot_id, new_data)
+
+    def _record_merged(self, plot_id: int, merged: NDArray) -> None:
+        if len(merged):
+            self._record(plot_id, merged)
+
+    def _record(self, plot_id: int, new_data: NDArray) -> None:
+        self._stats.rows += len(new_data)
+        # ingested right away so queries see every row, streamed on the next tick
+        plot: TrackerPlot = self._plot(plot_id)
+        rows: NDArray = plot.ingest(new_data)
+        self._enqueue(plot, rows)
+        if plot_id in self._exports:
+            self._exports[plot_id].extend(rows)
+        if plot_id in self._logs:
+            self._logs[plot_id].append(new_data)
+
+    def _enqueue(self, plot: TrackerPlot, rows: NDArray) -> None:
+        if self._ticker or plot.views:
+            self._queue(plot.id).put(rows)
+            self._dirty.add(plot.id)
+        else:
+            # nothing drains the queue without a plot server, the rows are only kept in the plot's store
+            plot.stream(rows)
+
+    def _attach_ring(self, session: Session, plot_id: int, name: str) -> None:
+        from traintracker.shm_ring import ShmRing
+        self._rings[session.id, plot_id] = ShmRing.attach(name)
+        session.ring_ids.append(plot_id)
+        if not self._ring_poller:
+            self._schedule_ring_poll()
+
+    def _detach_rings(self, session: Session) -> None:
+        # whatever the client wrote before leaving is still delivered
+        for plot_id in session.ring_ids:
+            ring = self._rings.pop((session.id, plot_id))
+            if len(ring):
+                self._receive(session, plot_id, ring.pop_all())
+            ring.close()
+        if not self._rings and self._ring_poller:
+            self._ring_poller.cancel()
+            self._ring_poller = None
+
+    def _schedule_ring_poll(self) -> None:
+        self._ring_poller = asyncio.get_event_loop().call_later(TIMEOUT / 1000, self._poll_rings_periodically)
+
+    def _poll_rings_periodically(self) -> None:
+        self._poll_rings()
+        self._schedule_ring_poll()
+
+    def _poll_rings(self) -> None:
+        for (session_id, plot_id), ring in self._rings.items():
+            if len(ring):
+                self._receive(self._sessions[session_id], plot_id, ring.pop_all())
+
+    def _replay_logs(self) -> None:
+        # rows are handed to the plots as memory-mapped blocks, never as Python objects; the
+        # server's own logs, named by plot id, come first so that their plots keep their ids,
+        # client logs (from clients sharing the directory) are merged into the plots by name
+        log_dir: Optional[str] = self._log_dir
+        if not log_dir:
+            return
+        file_names: List[str] = [name for name in os.listdir(log_dir) if name.endswith(LOG_SUFFIX)]
+        own: List[str] = [name for name in file_names if name[:-len(LOG_SUFFIX)].isdigit()]
+        for file_name in sorted(own) + sorted(set(file_names) - set(own)):
+            info, rows = read_log(os.path.join(log_dir, file_name))
+            plot_id: int = self._add_plot(info.plot_type, info.name, info.width,
+                                          info.plot_id if file_name in own else None)
+            plot: TrackerPlot = self._plot(plot_id)
+            if info.width != len(plot.columns):
+                print(f"Skipped log {file_name}: rows of width {info.width} do not fit plot {info.name}.")
+                continue
+            if len(rows):
+                self._enqueue(plot, plot.ingest(rows))
 
+    def _update_plots(self) -> None:
+        # runs on the Bokeh IO loop once per tick, only plots with pending data are touched;
+        # each update is computed once and scheduled in every document showing the plot
+        start: float = time.perf_counter()
+        dirty, self._dirty = self._dirty, set()
+        for plot_id in dirty:
+            self._plot(plot_id).update_from_queue(self._queue(plot_id))
+        self._stats.streams += len(dirty)
+        self._stats.ticks.record(time.perf_counter() - start)
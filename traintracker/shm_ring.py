@@ -0,0 +1,152 @@
+from typing import TYPE_CHECKING
+
+from traintracker.util.defs import *
+
+if TYPE_CHECKING:
+    from multiprocessing.shared_memory import SharedMemory
+
+# write index | read index | capacity | width | dropped rows
+RING_HEADER_SIZE = 64
+_WRITE, _READ, _CAPACITY, _WIDTH, _DROPPED = range(5)
+
+
+def _import_shared_memory():
+    # multiprocessing.shared_memory is new in Python 3.8
+    try:
+        from multiprocessing import shared_memory, resource_tracker
+    except ImportError as e:
+        raise ImportError("Shared memory ring buffers need Python 3.8 or later.") from e
+    return shared_memory, resource_tracker
+
+
+class ShmRing:
+    """ A single-producer single-consumer ring buffer of float32 rows in shared memory.
+
+    The producer (a client) only ever moves the write index and the consumer
+    (the server) only ever moves the read index, so neither side needs a lock
+    or a system call. When the ring is full, new rows are dropped and counted.
+    """
+    def __init__(self, shm: "SharedMemory", owner: bool):
+        self._shm: "SharedMemory" = shm
+        self._owner: bool = owner
+        self._header: NDArray = np.ndarray((5,), dtype=np.uint64, buffer=shm.buf)
+        self._capacity: int = int(self._header[_CAPACITY])
+        self._width: int = int(self._header[_WIDTH])
+        self._data: NDArray = np.ndarray((self._capacity, self._width), dtype=np.float32,
+                                         buffer=shm.buf, offset=RING_HEADER_SIZE)
+        # the producer owns the write index, and only needs to re-read the
+        # consumer's read index when the ring looks full
+        self._write: int = int(self._header[_WRITE])
+        self._read: int = int(self._header[_READ])
+
+    @classmethod
+    def create(cls, name: str, capacity: int, width: int) -> "ShmRing":
+        """ Create a new ring, owned by the producer.
+
+        Args:
+            name (str): system wide name of the shared memory block
+            capacity (int): number of rows the ring holds
+            width (int): number of float32 values in each row
+        """
+        shared_memory, _ = _import_shared_memory()
+        size: int = RING_HEADER_SIZE + capacity * width * np.dtype(np.float32).itemsize
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header: NDArray = np.ndarray((5,), dtype=np.uint64, buffer=shm.buf)
+        header[:] = 0
+        header[_CAPACITY] = capacity
+        header[_WIDTH] = width
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "ShmRing":
+        """ Attach to an existing ring, as its consumer.
+
+        Args:
+            name (str): system wide name of the shared memory block
+        """
+        shared_memory, resource_tracker = _import_shared_memory()
+        shm = shared_memory.SharedMemory(name=name)
+        # the producer owns the block, the consumer must not unlink it when it exits;
+        # the tracker knows it by its POSIX name, which has a leading slash
+        resource_tracker.unregister("/" + shm.name, "shared_memory")
+        return cls(shm, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def width(self) -> int:
+        return self._width
+
+    @property
+    def dropped(self) -> int:
+        return int(self._header[_DROPPED])
+
+    def __len__(self) -> int:
+        return int(self._header[_WRITE] - self._header[_READ])
+
+    def push(self, rows: NDArray) -> int:
+        """ Write a row or a block of rows (producer side).
+
+        Args:
+            rows (NDArray): float32 values of shape (width,) or (n, width)
+
+        Returns:
+            int: number of rows written, rows that do not fit are dropped
+        """
+        if rows.ndim == 1:
+            return self._push_row(rows)
+        write: int = self._write
+        if write + len(rows) - self._read > self._capacity:
+            self._read = int(self._header[_READ])
+        n: int = min(len(rows), self._capacity - (write - self._read))
+        if n < len(rows):
+            self._header[_DROPPED] += len(rows) - n
+        if n <= 0:
+            return 0
+        start: int = write % self._capacity
+        first: int = min(n, self._capacity - start)
+        self._data[start: start + first] = rows[:first]
+        self._data[:n - first] = rows[first: n]
+        # publish the rows only once they are written
+        self._write = write + n
+        self._header[_WRITE] = self._write
+        return n
+
+    def _push_row(self, row: NDArray) -> int:
+        write: int = self._write
+        if write - self._read >= self._capacity:
+            self._read = int(self._header[_READ])
+            if write - self._read >= self._capacity:
+                self._header[_DROPPED] += 1
+                return 0
+        self._data[write % self._capacity] = row
+        self._write = write + 1
+        self._header[_WRITE] = self._write
+        return 1
+
+    def pop_all(self) -> NDArray:
+        """ Take every row written so far (consumer side).
+
+        Returns:
+            NDArray: a (n, width) copy of the rows
+        """
+        read: int = int(self._header[_READ])
+        n: int = int(self._header[_WRITE]) - read
+        start: int = read % self._capacity
+        first: int = min(n, self._capacity - start)
+        rows: NDArray = np.concatenate((self._data[start: start + first], self._data[:n - first]))
+        self._header[_READ] = read + n
+        return rows
+
+    def close(self) -> None:
+        """
+        Detach from the ring; the owner also frees it.
+        """
+        # views on the buffer have to go before the block can be closed
+        del self._header, self._data
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
@@ -0,0 +1,175 @@
+import asyncio
+import time
+
+from traintracker.util.defs import *
+
+# histograms have one bucket per power of two microseconds, the last one is open ended
+N_BUCKETS = 32
+QUANTILES: Tuple[float, ...] = (.5, .9, .99)
+
+
+class Histogram:
+    """ A fixed size histogram of durations with power of two buckets.
+
+    Recording is O(1) and allocates nothing; quantiles are estimated as the
+    upper bound of the bucket they fall in.
+    """
+    def __init__(self):
+        self.buckets: List[int] = [0] * N_BUCKETS
+        self.count: int = 0
+        self.sum: float = 0.
+        self.max: float = 0.
+
+    def record(self, seconds: float) -> None:
+        """ Add a duration.
+
+        Args:
+            seconds (float): the duration
+        """
+        self.buckets[min(int(seconds * 1e6).bit_length(), N_BUCKETS - 1)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """ Estimate a quantile.
+
+        Args:
+            q (float): the quantile, between 0 and 1
+
+        Returns:
+            float: the upper bound, in seconds, of the bucket holding the quantile
+        """
+        rank: float = q * self.count
+        seen: int = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return min(2 ** i / 1e6, self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        """ The count, sum, max and quantiles of the recorded durations, in seconds. """
+        summary: Dict[str, float] = {"count": self.count, "sum": self.sum, "max": self.max}
+        for q in QUANTILES:
+            summary[f"p{round(q * 100)}"] = self.quantile(q)
+        return summary
+
+
+class ServerStats:
+    """ Counters and histograms a server keeps about itself.
+
+    Everything is updated in place on the paths it measures, cheap enough to
+    always be on. Gauges, like queue depths, are only read in ``snapshot``.
+    """
+    def __init__(self):
+        # indexed by command
+        self.messages: List[int] = [0] * (max(Cmd) + 1)
+        self.bytes: List[int] = [0] * (max(Cmd) + 1)
+        self.errors: List[int] = [0] * (max(Cmd) + 1)
+        self.unknown_commands: int = 0
+        self.rows: int = 0
+        self.streams: int = 0
+        self.ticks: Histogram = Histogram()
+        self.loop_lag: Histogram = Histogram()
+        self._lag_monitor: Optional[asyncio.TimerHandle] = None
+
+    def count_message(self, cmd: Cmd, size: int) -> None:
+        """ Count a received message.
+
+        Args:
+            cmd (Cmd): the message's command
+            size (int): the size of the message's payload
+        """
+        self.messages[cmd] += 1
+        self.bytes[cmd] += size
+
+    def count_error(self, cmd: Cmd) -> None:
+        """ Count a received message that could not be handled.
+
+        Args:
+            cmd (Cmd): the message's command
+        """
+        self.errors[cmd] += 1
+
+    def watch_loop(self, interval: float = STATS_INTERVAL) -> None:
+        """ Measure the event loop's lag: how late a timer scheduled every ``interval`` seconds fires.
+
+        Args:
+            interval (float): seconds between measurements
+        """
+        loop = asyncio.get_event_loop()
+        due: float = loop.time() + interval
+
+        def measure():
+            nonlocal due
+            now: float = loop.time()
+            self.loop_lag.record(max(now - due, 0.))
+            due = now + interval
+            self._lag_monitor = loop.call_later(interval, measure)
+
+        self._lag_monitor = loop.call_later(interval, measure)
+
+    def stop(self) -> None:
+        """
+        Stop measuring the event loop's lag.
+        """
+        if self._lag_monitor:
+            self._lag_monitor.cancel()
+            self._lag_monitor = None
+
+    def snapshot(self, queue_depths: Dict[int, int], sessions: int) -> Dict[str, Any]:
+        """ The current value of every statistic, JSON serializable.
+
+        Args:
+            queue_depths (Dict[int, int]): the number of queued blocks of each plot id
+            sessions (int): the number of connected clients
+
+        Returns:
+            Dict: the statistics
+        """
+        return {
+            "time": time.time(),
+            "sessions": sessions,
+            "messages": {cmd.name: self.messages[cmd] for cmd in Cmd if self.messages[cmd]},
+            "bytes": {cmd.name: self.bytes[cmd] for cmd in Cmd if self.bytes[cmd]},
+            "errors": {cmd.name: self.errors[cmd] for cmd in Cmd if self.errors[cmd]},
+            "unknown_commands": self.unknown_commands,
+            "rows": self.rows,
+            "queue_depth": {str(plot_id): depth for plot_id, depth in queue_depths.items()},
+            "streams": self.streams,
+            "tick_seconds": self.ticks.summary(),
+            "loop_lag_seconds": self.loop_lag.summary(),
+        }
+
+
+def format_text(snapshot: Dict[str, Any]) -> str:
+    """ Render a snapshot in the Prometheus text exposition format.
+
+    Args:
+        snapshot (Dict): as returned by ``ServerStats.snapshot``
+
+    Returns:
+        str: one line per value
+    """
+    lines: List[str] = [f"traintracker_sessions {snapshot['sessions']}"]
+    for key, metric in (("messages", "messages_total"), ("bytes", "received_bytes_total"),
+                        ("errors", "errors_total")):
+        lines.append(f"# TYPE traintracker_{metric} counter")
+        lines.extend(f'traintracker_{metric}{{cmd="{cmd}"}} {n}' for cmd, n in snapshot[key].items())
+    lines.append(f"traintracker_unknown_commands_total {snapshot['unknown_commands']}")
+    lines.append(f"traintracker_rows_total {snapshot['rows']}")
+    lines.append(f"traintracker_streams_total {snapshot['streams']}")
+    lines.append("# TYPE traintracker_queue_depth gauge")
+    lines.extend(f'traintracker_queue_depth{{plot="{plot_id}"}} {depth}'
+                 for plot_id, depth in snapshot["queue_depth"].items())
+    for key in ("tick_seconds", "loop_lag_seconds"):
+        summary: Dict[str, float] = snapshot[key]
+        lines.append(f"# TYPE traintracker_{key} summary")
+        for q in QUANTILES:
+            lines.append(f'traintracker_{key}{{quantile="{q}"}} {summary[f"p{round(q * 100)}"]}')
+        lines.append(f"traintracker_{key}_sum {summary['sum']}")
+        lines.append(f"traintracker_{key}_count {summary['count']}")
+        lines.append(f"traintracker_{key}_max {summary['max']}")
+    return "\n".join(lines) + "\n"
@@ -3,52 +3,152 @@ from queue import Queue
 from bokeh.document.document import Document
 from bokeh.plotting import figure, ColumnDataSource
 from bokeh.plotting.figure import Figure
+from bokeh.palettes import Blues256, Category10
+from bokeh.transform import linear_cmap
 from copy import deepcopy
+from functools import partial
+from itertools import cycle
 
 from traintracker.util.defs import *
+from traintracker.util.column_store import ColumnStore
+from traintracker.downsample import MinMaxDecimator
+from traintracker.transforms import Transform
+from traintracker.pyramid import Pyramid
 
 
 SOURCE_FORMATS: Dict[PlotType, Dict] = {
     PlotType.train_val_loss: {"train": [], "val": [], "step": []},
     PlotType.accuracy: {"acc": [], "step": []},
+    PlotType.confusion_matrix: {"predicted": [], "label": [], "count": [], "rate": []},
+    PlotType.histogram: {"x": [], "width": [], "center": [], "height": [], "density": []},
     PlotType.random: {'x': [], 'y': []},
     PlotType.test_line_plt: {'x': [], 'y': []}
 }
 
+class Retention(NamedTuple):
+    """ How much of a plot's history is sent to the browser.
+
+    The server always keeps the full resolution data, retention only bounds
+    what the Bokeh document (and so the browser) holds.
+    """
+    mode: RetentionMode = RetentionMode.full
+    # rollover: number of most recent points kept
+    window: int = ROLLOVER
+    # decimate: maximum number of points displayed
+    max_points: int = MAX_POINTS
+
+    @classmethod
+    def rolling(cls, window: int = ROLLOVER) -> "Retention":
+        """ Keep only the most recent ``window`` points. """
+        return cls(RetentionMode.rollover, window=window)
+
+    @classmethod
+    def decimated(cls, max_points: int = MAX_POINTS) -> "Retention":
+        """ Show the whole history, downsampled to at most ``max_points`` points. """
+        return cls(RetentionMode.decimate, max_points=max_points)
+
+
+class PlotView:
+    """
+    One document's copy of a plot's Bokeh models. Bokeh models belong to a
+    single document, so every browser session gets its own source and figure
+    over the plot's shared history.
+    """
+    def __init__(self, doc: Document, source: ColumnDataSource, fig: Figure):
+        """
+        Args:
+            doc (Document): the document the view is shown in
+            source (ColumnDataSource): the columns the view's browser holds
+            fig (Figure): the figure drawn from ``source``
+        """
+        self.doc: Document = doc
+        self.source: ColumnDataSource = source
+        self.fig: Figure = fig
+
+
 class TrackerPlot(ABC):
     """
     A plot that corresponds to a tracker on the client side.
+
+    Rows received for a plot are laid out in the order of its ``columns``. The
+    series its transforms derive from them follow as extra columns, they are
+    computed here so they never cross the client's socket.
+
+    Rows are ingested as soon as they arrive, so the history (and its index for
+    queries) is current whether or not a browser is shown the plot, and
+    streamed to the browser later.
+
+    The plot is shown in any number of documents, one per browser session,
+    each through its own ``PlotView``. An update is computed once and then
+    handed to every view, so the cost of a tick does not grow with the number
+    of viewers beyond scheduling the update in each document.
     """
-    def __init__(self, name: str, id_: int, source: ColumnDataSource):
+    plot_type: PlotType
+    columns: Tuple[str, ...] = ()
+    x: str = "step"
+    # whether the history is indexed for queries
+    indexed: bool = True
+
+    def __init__(self, name: str, id_: int, retention: Retention = Retention(),
+                 transforms: Sequence[Transform] = ()):
         """ A plot that corresponds with a tracker.
         
         Args:
             name (str): name of this plot
             id_ (int): a unique id that identifies both this plot and the tracker
                 that is related to it.
-            source (ColumnDataSource): a columnar data source from which this plot
-                receives updates
+            retention (Retention): how much of the history is sent to the browser
+            transforms (Sequence[Transform]): series derived from the plot's columns
         """
         self._name: str = name
         self._id: int = id_
-        self.fig: Optional[Figure] = None
+        self.views: List[PlotView] = []
 
-        self.source: ColumnDataSource = source
+        self.retention: Retention = retention
+        self.transforms: Tuple[Transform, ...] = tuple(transforms)
+        for transform in self.transforms:
+            if transform.column not in self.columns:
+                raise ValueError(f"Plot {name} has no column {transform.column} to transform.")
+        # full resolution history, whatever the browser is shown
+        self.store: ColumnStore = ColumnStore({column: np.float32 for column in self.source_columns})
+        self.pyramid: Optional[Pyramid] = Pyramid(self.source_columns, self.x) if self.indexed else None
+        # number of the store's last rows that were ingested but not streamed yet
+        self._pending: int = 0
+        self._decimator: Optional[MinMaxDecimator] = None
+        if retention.mode == RetentionMode.decimate:
+            ys = [column for column in self.columns if column != self.x]
+            self._decimator = MinMaxDecimator(ys, retention.max_points)
 
     @classmethod
-    def build_plot(cls, plot_type: PlotType, name: str, id_: int) -> "TrackerPlot":
+    def build_plot(cls, plot_type: PlotType, name: str, id_: int, retention: Retention = Retention(),
+                   width: int = 0, transforms: Sequence[Transform] = ()) -> "TrackerPlot":
         """
         Args:
             plot_type (PlotType): type of plot to be created
             name (str): name of plot to be created
             id_ (int): a unique id that identifies both this plot and the tracker
                 that is related to it.
+            retention (Retention): how much of the history is sent to the browser
+            width (int): number of values in each row, only needed by plot types
+                without a fixed width
+            transforms (Sequence[Transform]): series derived from the plot's columns,
+                only for line plots
         """
-        source = ColumnDataSource(deepcopy(SOURCE_FORMATS[plot_type]))
         if plot_type == PlotType.train_val_loss:
-            return TrainValLossPlot(name, id_, source)
+            return TrainValLossPlot(name, id_, retention, transforms)
         elif plot_type == PlotType.accuracy:
-            return AccuraccyPlot(name, id_, source)
+            return AccuraccyPlot(name, id_, retention, transforms)
+        elif transforms:
+            raise ValueError(f"{plot_type.name} plots do not support transforms.")
+        elif plot_type == PlotType.confusion_matrix:
+            n_classes: int = int(np.sqrt(max(width - 1, 0)))
+            if n_classes < 1 or n_classes ** 2 + 1 != width:
+                raise ValueError(f"Width {width} is not a valid confusion matrix row width.")
+            return ConfusionMatrixPlot(name, id_, n_classes, retention)
+        elif plot_type == PlotType.histogram:
+            if width < 4:
+                raise ValueError(f"Width {width} is not a valid histogram row width.")
+            return HistogramPlot(name, id_, width - 3, retention)
         else:
             raise ValueError(f"{PlotType} is not a valid PlotType.")
 
@@ -56,63 +156,306 @@ class TrackerPlot(ABC):
     def id(self) -> int:
         return self._id
 
-    @abstractmethod
-    def update(self, new_data, doc: Document) -> None:
-        pass
+    @property
+    def source_columns(self) -> Tuple[str, ...]:
+        """ The plot's columns followed by the derived ones. """
+        return self.columns + tuple(transform.name for transform in self.transforms)
+
+    def add_view(self, doc: Document) -> PlotView:
+        """ Show this plot in a document, starting from what was streamed so far.
+
+        Args:
+            doc (Document): the document, the caller adds the view's figure to it
+
+        Returns:
+            PlotView: the document's source and figure
+        """
+        source = ColumnDataSource(deepcopy(SOURCE_FORMATS[self.plot_type]))
+        for transform in self.transforms:
+            source.add([], transform.name)
+        snapshot: Dict[str, NDArray] = self.snapshot()
+        if len(next(iter(snapshot.values()))):
+            source.data = snapshot
+        view = PlotView(doc, source, self._init_figure(source))
+        self.views.append(view)
+        return view
+
+    def remove_view(self, doc: Document) -> None:
+        """ Stop updating a document, e.g. once its browser session has ended.
+
+        Args:
+            doc (Document): the document
+        """
+        self.views = [view for view in self.views if view.doc is not doc]
+
+    def snapshot(self) -> Dict[str, NDArray]:
+        """ The columns a new view starts with: the retained part of the rows streamed so far. """
+        if self._decimator:
+            # the whole selection is replaced on every stream, rows pending now are simply shown early
+            selected: NDArray = self._decimator.update(self.store)
+            return {column: self.store[column][selected] for column in self.source_columns}
+        end: int = len(self.store) - self._pending
+        start: int = max(end - self.retention.window, 0) if self.retention.mode == RetentionMode.rollover else 0
+        return {column: self.store[column][start: end] for column in self.source_columns}
+
+    def update(self, new_data: NDArray) -> None:
+        """ Ingest and stream a row or a block of rows into this plot.
+
+        Args:
+            new_data (NDArray): a single row or a 2D block of rows
+        """
+        self.stream(self.ingest(new_data))
+
+    def ingest(self, new_data: NDArray) -> NDArray:
+        """ Add a row or a block of rows to the history, without streaming them.
+
+        Args:
+            new_data (NDArray): a single row or a 2D block of rows
+
+        Returns:
+            NDArray: the rows with their derived columns, to be streamed
+        """
+        rows: NDArray = self._append(np.atleast_2d(new_data))
+        self._pending += len(rows)
+        return rows
+
+    def stream(self, rows: NDArray) -> None:
+        """ Show ingested rows in every view.
+
+        Args:
+            rows (NDArray): rows returned by ``ingest``, in order
+        """
+        self._pending -= len(rows)
+        self._publish(rows)
+
+    def update_from_queue(self, new_data_queue: Queue) -> None:
+        """ Stream everything that is queued for this plot in a single update.
+
+        Args:
+            new_data_queue (Queue): queued blocks of ingested rows
+        """
+        blocks: List[NDArray] = []
+        while not new_data_queue.empty():
+            blocks.append(np.atleast_2d(new_data_queue.get_nowait()))
+        if blocks:
+            self.stream(np.concatenate(blocks))
+
+    def query(self, start: float = -np.inf, stop: float = np.inf, max_points: int = MAX_POINTS) -> Dict[str, NDArray]:
+        """ A step range of the history, reduced to about ``max_points`` buckets, see ``Pyramid.query``.
+
+        Args:
+            start (float): the first step included
+            stop (float): the last step included
+            max_points (int): maximum number of buckets returned
+
+        Returns:
+            Dict: the buckets' columns
+        """
+        if not self.pyramid:
+            raise ValueError(f"Plot {self._name} does not support queries.")
+        return self.pyramid.query(self.store, start, stop, max_points)
+
+    def _append(self, rows: NDArray) -> NDArray:
+        rows = self._derive(rows)
+        self.store.extend(rows)
+        if self.pyramid:
+            self.pyramid.update(self.store)
+        return rows
+
+    def _publish(self, rows: NDArray) -> None:
+        if self._decimator:
+            if not self.views:
+                # the selection catches up with the store when a view asks for a snapshot
+                return
+            selected: NDArray = self._decimator.update(self.store)
+            self._replace_all({column: self.store[column][selected] for column in self.source_columns})
+        else:
+            rollover = self.retention.window if self.retention.mode == RetentionMode.rollover else None
+            self._stream_all(self._to_columns(rows), rollover)
+
+    def _derive(self, rows: NDArray) -> NDArray:
+        if not self.transforms:
+            return rows
+        derived = [transform.apply(rows[:, self.columns.index(transform.column)])
+                   for transform in self.transforms]
+        return np.column_stack([rows] + derived).astype(np.float32, copy=False)
+
+    def _stream_all(self, new: Dict[str, NDArray], rollover: Optional[int] = None) -> None:
+        # add_next_tick_callback() can be used safely without taking the document lock,
+        # the views share the new columns, Bokeh never modifies them in place
+        for view in self.views:
+            view.doc.add_next_tick_callback(partial(view.source.stream, new, rollover))
+
+    def _replace_all(self, new: Dict[str, NDArray]) -> None:
+        for view in self.views:
+            view.doc.add_next_tick_callback(partial(self._replace_data, view.source, new))
+
+    @staticmethod
+    def _replace_data(source: ColumnDataSource, new: Dict[str, NDArray]) -> None:
+        # each source gets its own dict, streaming into one must not change the others
+        source.data = dict(new)
+
+    def _to_columns(self, rows: NDArray) -> Dict[str, NDArray]:
+        return {column: rows[:, i] for i, column in enumerate(self.source_columns)}
+
+    def _plot_transforms(self, fig: Figure, source: ColumnDataSource) -> None:
+        # legend_label, a plain legend would be taken for a column of the same name
+        for transform, color in zip(self.transforms, cycle(Category10[10])):
+            fig.line(source=source, x=self.x, y=transform.name, color=color, line_dash="dashed",
+                     legend_label=transform.name)
 
     @abstractmethod
-    def update_from_queue(self, new_data_queue: Queue, doc: Document) -> None:
+    def _init_figure(self, source: ColumnDataSource) -> Figure:
         pass
 
 
 class TrainValLossPlot(TrackerPlot):
-    def __init__(self, name: str, id_: int, source: ColumnDataSource):
-        super(TrainValLossPlot, self).__init__(name=name, id_=id_, source=source)
-        self._init_figure()
+    plot_type = PlotType.train_val_loss
+    columns = ("train", "val", "step")
 
-    def update(self, new_data, doc: Document) -> None:
-        new = {"train": [new_data[0]], "val": [new_data[1]], "step": [new_data[2]]}
-        # add_next_tick_callback() can be used safely without taking the document lock
-        doc.add_next_tick_callback(lambda: self.source.stream(new))
-
-    def update_from_queue(self, new_data_queue: Queue, doc: Document) -> None:
-        while not new_data_queue.empty():
-            new_data = new_data_queue.get_nowait()
-            # add_next_tick_callback() can be used safely without taking the document lock
-            doc.add_next_tick_callback(
-                lambda: self.source.stream({"train": [new_data[0]],
-                                            "val": [new_data[1]],
-                                            "step": [new_data[2]]})
-            )
-
-    def _init_figure(self) -> None:
-        self.fig = figure(title=self._name)
-        self.fig.line(source=self.source, x="step", y="train", color="blue", legend="training loss")
-        self.fig.line(source=self.source, x="step", y="val", color="orange", legend="validation loss")
-        self.fig.xaxis.axis_label = "Step"
-        self.fig.yaxis.axis_label = "Loss"
+    def _init_figure(self, source: ColumnDataSource) -> Figure:
+        fig = figure(title=self._name)
+        fig.line(source=source, x="step", y="train", color="blue", legend="training loss")
+        fig.line(source=source, x="step", y="val", color="orange", legend="validation loss")
+        fig.xaxis.axis_label = "Step"
+        fig.yaxis.axis_label = "Loss"
+        self._plot_transforms(fig, source)
+        return fig
 
 
 class AccuraccyPlot(TrackerPlot):
-    def __init__(self, name: str, id_: int, source: ColumnDataSource):
-        super(AccuraccyPlot, self).__init__(name=name, id_=id_, source=source)
-        self._init_figure()
+    plot_type = PlotType.accuracy
+    columns = ("acc", "step")
 
-    def update(self, new_data, doc: Document) -> None:
-        new = {"acc": [new_data[0]], "step": [new_data[1]]}
-        # add_next_tick_callback() can be used safely without taking the document lock
-        doc.add_next_tick_callback(lambda: self.source.stream(new))
+    def _init_figure(self, source: ColumnDataSource) -> Figure:
+        fig = figure(title=self._name)
+        fig.line(source=source, x="step", y="acc", color="blue", legend="accuracy")
+        fig.xaxis.axis_label = "Step"
+        fig.yaxis.axis_label = "Accuracy"
+        self._plot_transforms(fig, source)
+        return fig
 
-    def update_from_queue(self, new_data_queue: Queue, doc: Document) -> None:
-        while not new_data_queue.empty():
-            new_data = new_data_queue.get_nowait()
-            # add_next_tick_callback() can be used safely without taking the document lock
-            doc.add_next_tick_callback(
-                lambda: self.source.stream({"acc": [new_data[0]], "step": [new_data[1]]})
-            )
-
-    def _init_figure(self) -> None:
-        self.fig = figure(title=self._name)
-        self.fig.line(source=self.source, x="step", y="acc", color="blue", legend="accuracy")
-        self.fig.xaxis.axis_label = "Step"
-        self.fig.yaxis.axis_label = "Accuracy"
+
+class ConfusionMatrixPlot(TrackerPlot):
+    """
+    A heatmap of a running confusion matrix.
+
+    Rows hold the matrix's delta counts (row-major, labels by predictions)
+    followed by the step. Cells are colored by the share of each label that
+    was predicted as each class, so the diagonal shows per-class recall. The
+    browser only holds the running matrix, the server keeps it and the delta
+    rows of the last ``window`` steps (between ``window`` and twice as many).
+    """
+    plot_type = PlotType.confusion_matrix
+    # the matrix is cumulative, its history is not indexed
+    indexed = False
+
+    def __init__(self, name: str, id_: int, n_classes: int,
+                 retention: Retention = Retention.rolling(HISTOGRAM_WINDOW)):
+        self.n_classes: int = n_classes
+        self.columns = tuple(f"n{i}" for i in range(n_classes ** 2)) + ("step",)
+        if retention.mode != RetentionMode.rollover:
+            # a full history of k * k deltas per step grows without bound
+            retention = Retention.rolling(HISTOGRAM_WINDOW)
+        super(ConfusionMatrixPlot, self).__init__(name=name, id_=id_, retention=retention)
+        self.matrix: NDArray = np.zeros((n_classes, n_classes), dtype=np.int64)
+        label, predicted = np.divmod(np.arange(n_classes ** 2), n_classes)
+        self._cells: Dict[str, NDArray] = {"predicted": predicted, "label": label}
+
+    def snapshot(self) -> Dict[str, NDArray]:
+        """ The current matrix, it is replaced as a whole on every stream. """
+        return self._heatmap()
+
+    def _append(self, rows: NDArray) -> NDArray:
+        self.store.extend(rows)
+        if len(self.store) > 2 * self.retention.window:
+            self.store.keep_last(self.retention.window)
+        self.matrix += rows[:, :-1].sum(axis=0, dtype=np.int64).reshape(self.n_classes, self.n_classes)
+        return rows
+
+    def _publish(self, rows: NDArray) -> None:
+        self._replace_all(self._heatmap())
+
+    def _heatmap(self) -> Dict[str, NDArray]:
+        totals: NDArray = self.matrix.sum(axis=1, keepdims=True)
+        rate: NDArray = np.divide(self.matrix, totals, out=np.zeros(self.matrix.shape), where=totals > 0)
+        return dict(self._cells, count=self.matrix.ravel(), rate=rate.ravel())
+
+    def _init_figure(self, source: ColumnDataSource) -> Figure:
+        fig = figure(title=self._name, tooltips=[("label", "@label"), ("predicted", "@predicted"),
+                                                 ("count", "@count")])
+        fig.rect(source=source, x="predicted", y="label", width=1, height=1,
+                 fill_color=linear_cmap("rate", Blues256[::-1], 0, 1), line_color=None)
+        fig.y_range.flipped = True
+        fig.xaxis.axis_label = "Predicted"
+        fig.yaxis.axis_label = "Label"
+        return fig
+
+
+class HistogramPlot(TrackerPlot):
+    """
+    A heatmap of a distribution over steps, one column of bins per step.
+
+    Rows hold the bin counts followed by the range of the bins and the step.
+    Each step's counts are normalized by its fullest bin. Memory is bounded on
+    both ends: the browser only holds the last ``window`` steps, and so does
+    the server (between ``window`` and twice as many).
+    """
+    plot_type = PlotType.histogram
+    # only a window of the history is kept, it is not indexed
+    indexed = False
+
+    def __init__(self, name: str, id_: int, n_bins: int, retention: Retention = Retention.rolling(HISTOGRAM_WINDOW)):
+        self.n_bins: int = n_bins
+        self.columns = tuple(f"n{i}" for i in range(n_bins)) + ("lo", "hi", "step")
+        if retention.mode != RetentionMode.rollover:
+            # a full history of bins does not fit in a browser
+            retention = Retention.rolling(HISTOGRAM_WINDOW)
+        super(HistogramPlot, self).__init__(name=name, id_=id_, retention=retention)
+        self._last_step: Optional[float] = None
+
+    def snapshot(self) -> Dict[str, NDArray]:
+        """ The cells of the last ``window`` steps streamed so far. """
+        # rows pending for longer than the store retains them were never shown
+        end: int = max(len(self.store) - self._pending, 0)
+        start: int = max(end - self.retention.window, 0)
+        rows: NDArray = np.stack([self.store[column][start: end] for column in self.columns], axis=1)
+        return self._to_cells(rows, self.store["step"][start - 1] if start else None)
+
+    def _append(self, rows: NDArray) -> NDArray:
+        self.store.extend(rows)
+        if len(self.store) > 2 * self.retention.window:
+            self.store.keep_last(self.retention.window)
+        return rows
+
+    def _publish(self, rows: NDArray) -> None:
+        cells: Dict[str, NDArray] = self._to_cells(rows, self._last_step)
+        self._last_step = rows[-1, self.n_bins + 2]
+        self._stream_all(cells, self.retention.window * self.n_bins)
+
+    def _to_cells(self, rows: NDArray, last_step: Optional[float]) -> Dict[str, NDArray]:
+        if not len(rows):
+            return {column: np.empty(0) for column in SOURCE_FORMATS[self.plot_type]}
+        counts: NDArray = rows[:, :self.n_bins]
+        lo, hi, steps = rows[:, self.n_bins], rows[:, self.n_bins + 1], rows[:, self.n_bins + 2]
+        # every step's cells stretch to the previous step
+        previous: NDArray = np.concatenate(([steps[0] - 1 if last_step is None else last_step], steps[:-1]))
+        height: NDArray = (hi - lo) / self.n_bins
+        center: NDArray = lo[:, None] + (np.arange(self.n_bins) + .5) * height[:, None]
+        peak: NDArray = counts.max(axis=1, keepdims=True)
+        density: NDArray = np.divide(counts, peak, out=np.zeros(counts.shape), where=peak > 0)
+        return {
+            "x": np.repeat((steps + previous) / 2, self.n_bins),
+            "width": np.repeat(steps - previous, self.n_bins),
+            "center": center.ravel(),
+            "height": np.repeat(height, self.n_bins),
+            "density": density.ravel(),
+        }
+
+    def _init_figure(self, source: ColumnDataSource) -> Figure:
+        fig = figure(title=self._name)
+        fig.rect(source=source, x="x", y="center", width="width", height="height",
+                 fill_color=linear_cmap("density", Blues256[::-1], 0, 1), line_color=None)
+        fig.xaxis.axis_label = "Step"
+        fig.yaxis.axis_label = "Value"
+        return fig
@@ -1,23 +1,19 @@
 from abc import ABC, abstractmethod
-import random
+from typing import TYPE_CHECKING
 
 from traintracker.util.defs import *
 from traintracker.client import Client
+from traintracker.util.column_store import ColumnStore
+from traintracker.export import Exporter
 
+if TYPE_CHECKING:
+    # only trainers that use the asyncio client import it
+    from traintracker.async_client import AsyncClient
 
-def unique_id() -> Iterator[int]:
-    """ Generate a continuous stream of unique IDs.
 
-    First ID is random, next IDs are incremented from initial seed.
-    
-    Returns:
-        int: a unique id, based on a randomly seeded initial ID.
-    """
-    seed_id = random.getrandbits(32)
-
-    while True:
-        yield seed_id
-        seed_id += 1
+# trackers only ever call the client's non-blocking surface, so the asyncio
+# client can be used from inside a running event loop
+AnyClient = Union[Client, "AsyncClient"]
 
 
 class Tracker(ABC):
@@ -26,42 +22,108 @@ class Tracker(ABC):
     Trackers are utilities that track various metrics
     regarding the performance of a model.
     """
-    id_generator: Iterator[int] = unique_id()
-    def __init__(self, plot_type: PlotType, name: str, client: Optional[Client] = None):
+    # number of values sent per row, 0 if the plot type has a fixed width
+    _width: int = 0
+    # tracked metrics, one column per metric
+    _history: ColumnStore
+    def __init__(self, plot_type: PlotType, name: str, client: Optional[AnyClient] = None):
         """
         Args:
             plot_type (PlotType): type of plot that will be made by server if
                 tracker is connected to a client
             name (str): the name of this tracker, e.g. "model 1 loss"
-            client (Client or None): the client that the tracker is connected to
+            client (Client, AsyncClient or None): the client that the tracker is connected to
         """
         self._plot_type: PlotType = plot_type
-        self._client: Optional[Client] = client
+        self._client: Optional[AnyClient] = client
         self._name: str = name
-        self._id: int = next(self.id_generator)
+        # assigned by the client when the tracker is added to the server
+        self._id: Optional[int] = None
+        self._exporter: Optional[Exporter] = None
 
     @property
     def plot_type(self) -> PlotType:
         return self._plot_type
 
     @property
-    def id(self) -> int:
+    def id(self) -> Optional[int]:
+        """ The client's id for this tracker's plot, None until a client is connected. """
         return self._id
 
-    def connect_client(self, client: Client) -> None:
+    def connect_client(self, client: AnyClient) -> None:
         """ Connect this tracker to a client.
         
         Args:
-            client (Client): the client to which this tracker will send its data
+            client (Client or AsyncClient): the client to which this tracker will send its data
         """
         if self._client:
             raise ValueError(f"Cannot add new client, client already exists: {self._client}")
         self._client = client
         self._add_to_server()
 
+    def export(self, path: str, chunk_rows: int = EXPORT_CHUNK) -> Exporter:
+        """ Stream this tracker's history to a file, see ``read_export`` to load it.
+
+        The rows tracked so far are written right away, later ones as they are
+        tracked, in chunks of ``chunk_rows``. The file is complete once
+        ``close_export`` is called.
+
+        Args:
+            path (str): path of a ``.npz`` file, or of a ``.parquet`` file if pyarrow
+                is installed
+            chunk_rows (int): number of rows written at once
+
+        Returns:
+            Exporter: the export, e.g. to check how many rows were written
+        """
+        if self._exporter:
+            raise ValueError(f"Tracker {self._name} is already exported to {self._exporter.path}.")
+        exporter = Exporter(path, self._history.dtypes, chunk_rows)
+        exporter.write_store(self._history)
+        self._exporter = exporter
+        return exporter
+
+    def close_export(self) -> None:
+        """
+        Write the rest of the history to the export and finish its file.
+        """
+        if self._exporter:
+            self._exporter.close()
+            self._exporter = None
+
     def _add_to_server(self) -> None:
         if self._client:
-            self._client.add_plot(self._plot_type, self._name, self._id)
+            self._id = self._client.add_plot(self._plot_type, self._name, self._width)
+
+    def _send(self, new_data: NDArray) -> None:
+        if self._client is None or self._id is None:
+            raise ValueError(f"Tracker {self._name} has not been added to a server.")
+        self._client.update_plot(self._id, new_data)
+
+    def _extend(self, *columns) -> None:
+        # one vectorized append, then one contiguous block for the client
+        columns = tuple(np.asarray(column).ravel() for column in columns)
+        if len({len(column) for column in columns}) > 1:
+            raise ValueError(f"All columns must have the same length, got: {[len(c) for c in columns]}")
+        self._history.extend_columns(*columns)
+        if self._exporter:
+            self._exporter.extend_columns(*columns)
+
+        if self._client:
+            new_data: NDArray = np.empty((len(columns[0]), len(columns)), dtype=np.float32)
+            for i, column in enumerate(columns):
+                new_data[:, i] = column
+            self._send(new_data)
+
+    def _append(self, *row) -> None:
+        self._history.append(*row)
+        if self._exporter:
+            self._exporter.append(*row)
+
+    def _get(self, column: str, as_np: bool) -> Union[List, NDArray]:
+        # as_np views are read-only and zero-copy, lists are a fresh copy
+        values: NDArray = self._history[column]
+        return values if as_np else values.tolist()
 
     @abstractmethod
     def update(self, *args) -> None:
@@ -88,16 +150,15 @@ class TrainValLossTracker(Tracker):
     A tracker object that keeps a record of a model's train and validation loss for a given
     list of steps.
     """
-    def __init__(self, name: str, client: Optional[Client] = None):
+    def __init__(self, name: str, client: Optional[AnyClient] = None, dtype: DTypeLike = np.float64):
         """
         Args:
             name (str): the name of this tracker, e.g. "model 1 loss"
-            client (Client or None): the client that the tracker is connected to
+            client (Client, AsyncClient or None): the client that the tracker is connected to
+            dtype (DTypeLike): dtype in which losses are stored (steps are int64)
         """
         super(TrainValLossTracker, self).__init__(name=name, client=client, plot_type=PlotType.train_val_loss)
-        self._train: List[float] = []
-        self._val: List[float] = []
-        self._steps: List[int] = []
+        self._history: ColumnStore = ColumnStore({"train": dtype, "val": dtype, "step": np.int64})
 
         self._add_to_server()
 
@@ -110,9 +171,7 @@ class TrainValLossTracker(Tracker):
         Returns:
             List or Array: collected training losses
         """
-        if as_np:
-            return np.array(self._train)
-        return self._train
+        return self._get("train", as_np)
 
     def get_val_losses(self, as_np=False) -> Union[List, NDArray]:
         """ Retrieve the collected validation set losses.
@@ -123,9 +182,7 @@ class TrainValLossTracker(Tracker):
         Returns:
             List or NDArray: collected validation losses
         """
-        if as_np:
-            return np.array(self._val)
-        return self._val
+        return self._get("val", as_np)
 
     def get_steps(self, as_np=False) -> Union[List, NDArray]:
         """ Retrieve the collected step numbers.
@@ -136,9 +193,7 @@ class TrainValLossTracker(Tracker):
         Returns:
             List or NDArray: steps (we do not assume a regular sequence, so this is necessary)
         """
-        if as_np:
-            return np.array(self._steps)
-        return self._steps
+        return self._get("step", as_np)
 
     def get_all_tracked(self, as_np=False) -> Tuple[Union[List, NDArray], Union[List, NDArray], Union[List, NDArray]]:
         """ Retrieve all collected metrics.
@@ -149,9 +204,7 @@ class TrainValLossTracker(Tracker):
         Returns:
             Tuple: a 3-tuple of all collected metrics
         """
-        if as_np:
-            return np.array(self._train), np.array(self._val), np.array(self._steps)
-        return self._train, self._val, self._steps
+        return self._get("train", as_np), self._get("val", as_np), self._get("step", as_np)
 
     def update(self, train_loss: float, val_loss: float, step: int) -> None:
         """ Update the tracker's metrics.
@@ -161,28 +214,38 @@ class TrainValLossTracker(Tracker):
             val_loss (float): validation set loss
             step (int): step for which metrics are being gathered
         """
-        self._train.append(train_loss)
-        self._val.append(val_loss)
-        self._steps.append(step)
+        self._append(train_loss, val_loss, step)
 
         if self._client:
             new_data: NDArray = np.array([train_loss, val_loss, step], dtype=np.float32)
-            self._client.update_plot(self._id, new_data)
+            self._send(new_data)
+
+    def update_many(self, train_losses: NDArray, val_losses: NDArray, steps: NDArray) -> None:
+        """ Update the tracker's metrics with many steps at once.
+
+        The values are appended in one go and sent to the server as a single block.
+
+        Args:
+            train_losses (NDArray): train set losses
+            val_losses (NDArray): validation set losses
+            steps (NDArray): step for which each pair of losses was gathered
+        """
+        self._extend(train_losses, val_losses, steps)
 
 
 class AccuracyTracker(Tracker):
     """
     A tracker object that keeps a record of a model's accuracies for *categorical* data.
     """
-    def __init__(self, name: str, client: Optional[Client] = None):
+    def __init__(self, name: str, client: Optional[AnyClient] = None, dtype: DTypeLike = np.float64):
         """
         Args: 
             name (str): the name of this tracker, e.g. "model 1 loss"
-            client (Client or None): the client that the tracker is connected to
+            client (Client, AsyncClient or None): the client that the tracker is connected to
+            dtype (DTypeLike): dtype in which accuracies are stored (steps are int64)
         """
-        super(AccuracyTracker, self).__init__(name=name, plot_type=PlotType.accuracy)
-        self._accuracy: List[float] = []
-        self._steps: List[int] = []
+        super(AccuracyTracker, self).__init__(name=name, client=client, plot_type=PlotType.accuracy)
+        self._history: ColumnStore = ColumnStore({"acc": dtype, "step": np.int64})
 
         self._add_to_server()
     
@@ -195,9 +258,7 @@ class AccuracyTracker(Tracker):
         Returns:
             List or NDArray: collected accuracies
         """
-        if as_np:
-            return np.array(self._accuracy)
-        return self._accuracy
+        return self._get("acc", as_np)
 
     def get_steps(self, as_np=False) -> Union[List, NDArray]:
         """ Retrieve the collected step numbers.
@@ -208,9 +269,7 @@ class AccuracyTracker(Tracker):
         Returns:
             List or NDarray: steps (we do not assume a regular sequence, so this is necessary)
         """
-        if as_np:
-            return np.array(self._steps)
-        return self._steps
+        return self._get("step", as_np)
 
     def get_all_tracked(self, as_np=False) -> Tuple[Union[List, NDArray], Union[List, NDArray]]:
         """ Retrieve all collected metrics.
@@ -221,9 +280,7 @@ class AccuracyTracker(Tracker):
         Returns:
             Tuple: a 2-tuple of all collected metrics
         """
-        if as_np:
-            return np.array(self._accuracy), np.array(self._steps)
-        return self._accuracy, self._steps
+        return self._get("acc", as_np), self._get("step", as_np)
 
     def update(self, predicted: NDArray, labels: NDArray, step: int) -> None:
         """ Update the tracker's metrics.
@@ -235,8 +292,292 @@ class AccuracyTracker(Tracker):
         """
         n: int = len(labels)
         acc = np.sum(predicted == labels) / n
-        self._accuracy.append(acc)
+        self._append(acc, step)
 
         if self._client:
             new_data: NDArray = np.array([acc, step], dtype=np.float32)
-            self._client.update_plot(self._id, new_data)
+            self._send(new_data)
+
+    def update_many(self, accuracies: NDArray, steps: NDArray) -> None:
+        """ Update the tracker's metrics with many steps at once, e.g. to backfill
+        accuracies computed elsewhere.
+
+        The values are appended in one go and sent to the server as a single block.
+
+        Args:
+            accuracies (NDArray): accuracies
+            steps (NDArray): step for which each accuracy was gathered
+        """
+        self._extend(accuracies, steps)
+
+
+class ConfusionMatrixTracker(Tracker):
+    """
+    A tracker object that keeps a running confusion matrix of a model's predictions for
+    *categorical* data, from which accuracy and per-class precision, recall and F1 are
+    derived on demand.
+
+    Only each step's change to the matrix is sent to the server.
+    """
+    def __init__(self, name: str, n_classes: int, client: Optional[AnyClient] = None,
+                 dtype: DTypeLike = np.float64):
+        """
+        Args:
+            name (str): the name of this tracker, e.g. "model 1 confusion"
+            n_classes (int): number of classes, labels and predictions are in [0, n_classes)
+            client (Client, AsyncClient or None): the client that the tracker is connected to
+            dtype (DTypeLike): dtype in which per-step accuracies are stored (steps are int64)
+        """
+        super(ConfusionMatrixTracker, self).__init__(name=name, client=client, plot_type=PlotType.confusion_matrix)
+        self._n_classes: int = n_classes
+        self._width = n_classes ** 2 + 1
+        # rows are labels, columns are predictions
+        self._matrix: NDArray = np.zeros((n_classes, n_classes), dtype=np.int64)
+        # reused between steps, only grows when a larger batch comes along
+        self._index: NDArray = np.empty(0, dtype=np.int64)
+        self._history: ColumnStore = ColumnStore({"acc": dtype, "step": np.int64})
+
+        self._add_to_server()
+
+    @property
+    def n_classes(self) -> int:
+        return self._n_classes
+
+    def get_matrix(self) -> NDArray:
+        """ Retrieve the confusion matrix.
+
+        Returns:
+            NDArray: a read-only (n_classes, n_classes) view, rows are labels and
+                columns are predictions
+        """
+        view: NDArray = self._matrix.view()
+        view.flags.writeable = False
+        return view
+
+    def get_accuracy(self) -> float:
+        """ Retrieve the accuracy over all steps so far.
+
+        Returns:
+            float: the overall accuracy
+        """
+        total: int = self._matrix.sum()
+        return float(np.trace(self._matrix) / total) if total else 0.
+
+    def get_precision(self) -> NDArray:
+        """ Retrieve each class' precision, 0 for classes that were never predicted.
+
+        Returns:
+            NDArray: per-class precision
+        """
+        return self._ratio(self._matrix.sum(axis=0))
+
+    def get_recall(self) -> NDArray:
+        """ Retrieve each class' recall, 0 for classes that never occurred.
+
+        Returns:
+            NDArray: per-class recall
+        """
+        return self._ratio(self._matrix.sum(axis=1))
+
+    def get_f1(self) -> NDArray:
+        """ Retrieve each class' F1 score.
+
+        Returns:
+            NDArray: per-class F1 score
+        """
+        precision, recall = self.get_precision(), self.get_recall()
+        total: NDArray = precision + recall
+        return np.divide(2 * precision * recall, total, out=np.zeros(self._n_classes), where=total > 0)
+
+    def get_macro_averages(self) -> Tuple[float, float, float]:
+        """ Retrieve the unweighted mean of the per-class metrics.
+
+        Returns:
+            Tuple: macro precision, recall and F1
+        """
+        return float(self.get_precision().mean()), float(self.get_recall().mean()), float(self.get_f1().mean())
+
+    def get_accuracies(self, as_np=False) -> Union[List, NDArray]:
+        """ Retrieve the accuracy of every step.
+
+        Args:
+            as_np (bool): whether to return values as `numpy` arrays
+
+        Returns:
+            List or NDArray: per-step accuracies
+        """
+        return self._get("acc", as_np)
+
+    def get_steps(self, as_np=False) -> Union[List, NDArray]:
+        """ Retrieve the collected step numbers.
+
+        Args:
+            as_np (bool): whether to return values as `numpy` arrays
+
+        Returns:
+            List or NDArray: steps (we do not assume a regular sequence, so this is necessary)
+        """
+        return self._get("step", as_np)
+
+    def get_all_tracked(self, as_np=False) -> Tuple[Union[List, NDArray], Union[List, NDArray]]:
+        """ Retrieve all collected metrics.
+
+        Args:
+            as_np (bool): whether to return values as `numpy` arrays
+
+        Returns:
+            Tuple: a 2-tuple of per-step accuracies and steps
+        """
+        return self._get("acc", as_np), self._get("step", as_np)
+
+    def update(self, predicted: NDArray, labels: NDArray, step: int) -> None:
+        """ Update the tracker's metrics.
+
+        Args:
+            predicted (NDArray): predictions (categorical)
+            labels (NDArray): ground truth labels (categorical)
+            step (int): step for which metrics are being gathered
+        """
+        predicted = np.asarray(predicted, dtype=np.int64)
+        labels = np.asarray(labels, dtype=np.int64)
+        n: int = len(labels)
+        if not n:
+            # an empty batch has no accuracy, the step is not recorded
+            return
+        k: int = self._n_classes
+        for classes in (predicted, labels):
+            if len(classes) and (classes.min() < 0 or classes.max() >= k):
+                raise ValueError(f"Labels and predictions must be in [0, {k}).")
+        if len(self._index) < n:
+            self._index = np.empty(n, dtype=np.int64)
+        index: NDArray = self._index[:n]
+        np.multiply(labels, k, out=index)
+        np.add(index, predicted, out=index)
+        delta: NDArray = np.bincount(index, minlength=k * k)
+        self._matrix += delta.reshape(k, k)
+        self._append(delta[::k + 1].sum() / n, step)
+
+        if self._client:
+            new_data: NDArray = np.empty(k * k + 1, dtype=np.float32)
+            new_data[:-1] = delta
+            new_data[-1] = step
+            self._send(new_data)
+
+    def _ratio(self, totals: NDArray) -> NDArray:
+        return np.divide(np.diag(self._matrix), totals, out=np.zeros(self._n_classes), where=totals > 0)
+
+
+class HistogramTracker(Tracker):
+    """
+    A tracker object that keeps a record of the distribution of some values (e.g. a layer's
+    weights, gradients or activations) over steps.
+
+    Values are binned on the client and only the bin counts are kept and sent to the
+    server. Bins either span a fixed range, in which case values outside of it are counted
+    in the outermost bins, or adapt to each step's minimum and maximum.
+    """
+    def __init__(self, name: str, n_bins: int = HISTOGRAM_BINS, value_range: Optional[Tuple[float, float]] = None,
+                 client: Optional[AnyClient] = None, dtype: DTypeLike = np.float64):
+        """
+        Args:
+            name (str): the name of this tracker, e.g. "layer 1 weights"
+            n_bins (int): number of equal-width bins
+            value_range (Tuple or None): (low, high) edges of the bins, or None to
+                span each step's values
+            client (Client, AsyncClient or None): the client that the tracker is connected to
+            dtype (DTypeLike): dtype in which bin ranges are stored (counts and steps are int64)
+        """
+        super(HistogramTracker, self).__init__(name=name, client=client, plot_type=PlotType.histogram)
+        if value_range is not None and not value_range[0] < value_range[1]:
+            raise ValueError(f"Invalid value range: {value_range}")
+        self._n_bins: int = n_bins
+        self._range: Optional[Tuple[float, float]] = value_range
+        self._width = n_bins + 3
+        columns: Dict[str, DTypeLike] = {f"n{i}": np.int64 for i in range(n_bins)}
+        columns.update({"lo": dtype, "hi": dtype, "step": np.int64})
+        self._history: ColumnStore = ColumnStore(columns)
+
+        self._add_to_server()
+
+    @property
+    def n_bins(self) -> int:
+        return self._n_bins
+
+    def get_counts(self, as_np=False) -> Union[List, NDArray]:
+        """ Retrieve the collected bin counts.
+
+        Args:
+            as_np (bool): whether to return values as `numpy` arrays
+
+        Returns:
+            List or NDArray: counts of shape (steps, n_bins)
+        """
+        counts: NDArray = np.column_stack([self._history[f"n{i}"] for i in range(self._n_bins)])
+        return counts if as_np else counts.tolist()
+
+    def get_ranges(self, as_np=False) -> Tuple[Union[List, NDArray], Union[List, NDArray]]:
+        """ Retrieve the range spanned by the bins of each step.
+
+        Args:
+            as_np (bool): whether to return values as `numpy` arrays
+
+        Returns:
+            Tuple: lower and upper edges
+        """
+        return self._get("lo", as_np), self._get("hi", as_np)
+
+    def get_steps(self, as_np=False) -> Union[List, NDArray]:
+        """ Retrieve the collected step numbers.
+
+        Args:
+            as_np (bool): whether to return values as `numpy` arrays
+
+        Returns:
+            List or NDArray: steps (we do not assume a regular sequence, so this is necessary)
+        """
+        return self._get("step", as_np)
+
+    def get_all_tracked(self, as_np=False) -> Tuple[Union[List, NDArray], ...]:
+        """ Retrieve all collected metrics.
+
+        Args:
+            as_np (bool): whether to return values as `numpy` arrays
+
+        Returns:
+            Tuple: a 4-tuple of counts, lower and upper bin edges, and steps
+        """
+        return (self.get_counts(as_np),) + self.get_ranges(as_np) + (self.get_steps(as_np),)
+
+    def update(self, values: NDArray, step: int) -> None:
+        """ Update the tracker's metrics.
+
+        Args:
+            values (NDArray): values of any shape, non-finite values are ignored
+            step (int): step for which metrics are being gathered
+        """
+        values = np.asarray(values).ravel()
+        finite: NDArray = np.isfinite(values)
+        if not finite.all():
+            values = values[finite]
+        if self._range:
+            lo, hi = self._range
+        elif len(values):
+            lo, hi = float(values.min()), float(values.max())
+            if lo == hi:
+                lo, hi = lo - .5, hi + .5
+        else:
+            lo, hi = 0., 1.
+        # equal-width bins, so a value's bin follows from a division; the width and the
+        # offset are computed so that neither overflows for ranges spanning the whole float range
+        width: float = hi / self._n_bins - lo / self._n_bins
+        scaled: NDArray = values / width - lo / width
+        # clipped before the cast, out of range values may not fit in an int64
+        np.clip(scaled, 0, self._n_bins - 1, out=scaled)
+        counts: NDArray = np.bincount(scaled.astype(np.int64), minlength=self._n_bins)
+        self._append(*counts, lo, hi, step)
+
+        if self._client:
+            new_data: NDArray = np.empty(self._width, dtype=np.float32)
+            new_data[:-3] = counts
+            new_data[-3:] = lo, hi, step
+            self._send(new_data)
@@ -0,0 +1,168 @@
+from abc import ABC, abstractmethod
+from numpy.lib.stride_tricks import sliding_window_view
+
+from traintracker.util.defs import *
+
+# EMA blocks are computed in closed form over chunks short enough that the decay
+# weights span at most this many orders of magnitude
+EMA_CHUNK_DIGITS = 8
+# below this chunk length (fast decays) a plain loop is quicker
+EMA_MIN_CHUNK = 32
+
+
+class Transform(ABC):
+    """
+    A series derived from one column of a plot, computed on the server as rows
+    arrive and shown as an extra column. Transforms keep their own state, so
+    every plot needs its own instance.
+    """
+    def __init__(self, column: str, name: str):
+        """
+        Args:
+            column (str): the plot column the series is derived from
+            name (str): name of the derived column
+        """
+        self.column: str = column
+        self.name: str = name
+
+    @abstractmethod
+    def apply(self, values: NDArray) -> NDArray:
+        """ Derive the series for new rows.
+
+        Args:
+            values (NDArray): the new values of ``column``, in order
+
+        Returns:
+            NDArray: one derived value per new value
+        """
+        pass
+
+
+class EMA(Transform):
+    """
+    An exponential moving average, seeded with the first value. O(1) per value.
+    """
+    def __init__(self, column: str, alpha: float = .1, name: Optional[str] = None):
+        """
+        Args:
+            column (str): the plot column the series is derived from
+            alpha (float): weight of each new value, in (0, 1]
+            name (str or None): name of the derived column, by default ``<column>_ema``
+        """
+        if not 0 < alpha <= 1:
+            raise ValueError(f"EMA alpha must be in (0, 1], got: {alpha}")
+        super(EMA, self).__init__(column, name or f"{column}_ema")
+        self.alpha: float = alpha
+        decay: float = 1 - alpha
+        self._chunk: int = int(EMA_CHUNK_DIGITS * np.log(10) / -np.log(decay)) if decay else 0
+        self._last: Optional[float] = None
+
+    def apply(self, values: NDArray) -> NDArray:
+        values = np.asarray(values, dtype=np.float64)
+        out: NDArray = np.empty(len(values))
+        if not len(values):
+            return out
+        start: int = 0
+        if self._last is None:
+            out[0] = self._last = values[0]
+            start = 1
+        decay: float = 1 - self.alpha
+        if self._chunk < EMA_MIN_CHUNK:
+            last: float = self._last
+            for i, x in enumerate(values[start:].tolist(), start):
+                last = out[i] = self.alpha * x + decay * last
+            self._last = last
+            return out
+        # y_k = decay^k * (y_0 + alpha * sum_{j <= k} x_j / decay^j)
+        for i in range(start, len(values), self._chunk):
+            chunk: NDArray = values[i: i + self._chunk]
+            weights: NDArray = decay ** np.arange(1, len(chunk) + 1)
+            out[i: i + len(chunk)] = weights * (self._last + self.alpha * np.cumsum(chunk / weights))
+            self._last = out[i + len(chunk) - 1]
+        return out
+
+
+class CumMax(Transform):
+    """
+    The best (largest) value so far, NaNs are ignored. O(1) per value.
+    """
+    _ufunc: np.ufunc = np.fmax
+    _suffix: str = "max"
+
+    def __init__(self, column: str, name: Optional[str] = None):
+        """
+        Args:
+            column (str): the plot column the series is derived from
+            name (str or None): name of the derived column, by default ``<column>_max``
+        """
+        super(CumMax, self).__init__(column, name or f"{column}_{self._suffix}")
+        self._best: Optional[float] = None
+
+    def apply(self, values: NDArray) -> NDArray:
+        out: NDArray = self._ufunc.accumulate(np.asarray(values, dtype=np.float64))
+        if self._best is not None:
+            self._ufunc(out, self._best, out=out)
+        if len(out):
+            self._best = out[-1]
+        return out
+
+
+class CumMin(CumMax):
+    """
+    The best (smallest) value so far, NaNs are ignored. O(1) per value.
+    """
+    _ufunc = np.fmin
+    _suffix = "min"
+
+
+class RollingMean(Transform):
+    """
+    The mean of the last ``window`` values, or fewer at the start. O(1) per value.
+    """
+    _suffix: str = "mean"
+
+    def __init__(self, column: str, window: int, name: Optional[str] = None):
+        """
+        Args:
+            column (str): the plot column the series is derived from
+            window (int): number of values averaged
+            name (str or None): name of the derived column, by default ``<column>_mean<window>``
+        """
+        if window < 1:
+            raise ValueError(f"Window must be positive, got: {window}")
+        super(RollingMean, self).__init__(column, name or f"{column}_{self._suffix}{window}")
+        self.window: int = window
+        # the last window - 1 values, all a new value's window needs from before it
+        self._tail: NDArray = np.empty(0)
+
+    def apply(self, values: NDArray) -> NDArray:
+        values = np.asarray(values, dtype=np.float64)
+        buffer: NDArray = np.concatenate([self._tail, values])
+        out: NDArray = self._windows(buffer, len(self._tail))
+        self._tail = buffer[max(len(buffer) - self.window + 1, 0):]
+        return out
+
+    def _windows(self, buffer: NDArray, offset: int) -> NDArray:
+        # the sums are restarted every block, so rounding errors never accumulate
+        ends: NDArray = np.arange(offset + 1, len(buffer) + 1)
+        starts: NDArray = np.maximum(ends - self.window, 0)
+        sums: NDArray = np.concatenate([[0.], np.cumsum(buffer)])
+        return (sums[ends] - sums[starts]) / (ends - starts)
+
+
+class RollingMedian(RollingMean):
+    """
+    The median of the last ``window`` values, or fewer at the start. O(window) per value.
+    """
+    _suffix = "median"
+
+    def _windows(self, buffer: NDArray, offset: int) -> NDArray:
+        out: NDArray = np.empty(len(buffer) - offset)
+        # values with a full window, every earlier one only happens at the very start
+        first_full: int = min(max(self.window - 1 - offset, 0), len(out))
+        for i in range(first_full):
+            out[i] = np.median(buffer[: offset + i + 1])
+        if first_full < len(out):
+            windows: NDArray = sliding_window_view(buffer, self.window)
+            out[first_full:] = np.median(windows[offset + first_full - self.window + 1:], axis=1)
+        return out
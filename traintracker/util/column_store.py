@@ -0,0 +1,129 @@
+from traintracker.util.defs import *
+
+INITIAL_CAPACITY = 1024
+STAGING_SIZE = 256
+
+
+class ColumnStore:
+    """ Growable columnar storage backed by NumPy arrays.
+
+    Every column lives in its own preallocated array whose capacity doubles when
+    it runs out, so appending is amortized O(1) and values are stored unboxed.
+    Single rows are staged in a small list and copied into the arrays in bulk.
+    Converting the staged Python values still makes ``append`` about three to
+    four times slower than appending to lists, the price of unboxed storage and
+    zero-copy reads.
+    """
+    def __init__(self, dtypes: Mapping[str, DTypeLike], capacity: int = INITIAL_CAPACITY):
+        """
+        Args:
+            dtypes (Mapping[str, DTypeLike]): the dtype of each column, in column order
+            capacity (int): number of rows to allocate up front
+        """
+        self._dtypes: Dict[str, np.dtype] = {name: np.dtype(dtype) for name, dtype in dtypes.items()}
+        self._capacity: int = max(capacity, 1)
+        self._size: int = 0
+        self._staged: List[tuple] = []
+        self._data: Dict[str, NDArray] = {
+            name: np.empty(self._capacity, dtype=dtype) for name, dtype in self._dtypes.items()
+        }
+
+    def __len__(self) -> int:
+        return self._size + len(self._staged)
+
+    @property
+    def columns(self) -> Tuple[str, ...]:
+        return tuple(self._dtypes)
+
+    @property
+    def dtypes(self) -> Dict[str, np.dtype]:
+        return dict(self._dtypes)
+
+    @property
+    def nbytes(self) -> int:
+        """ Number of bytes allocated for all columns. """
+        return sum(column.nbytes for column in self._data.values())
+
+    def append(self, *row) -> None:
+        """ Append a single row.
+
+        Args:
+            *row: one value per column, in column order
+        """
+        self._staged.append(row)
+        if len(self._staged) == STAGING_SIZE:
+            self._flush()
+
+    def extend(self, rows: NDArray) -> None:
+        """ Append a 2D block of rows.
+
+        Args:
+            rows (NDArray): rows of shape (n, number of columns)
+        """
+        rows = np.atleast_2d(rows)
+        self.extend_columns(*(rows[:, i] for i in range(rows.shape[1])))
+
+    def extend_columns(self, *columns) -> None:
+        """ Append values column by column.
+
+        Args:
+            *columns: one array-like of equal length per column, in column order
+        """
+        self._flush()
+        n: int = len(columns[0])
+        if self._size + n > self._capacity:
+            self._grow(self._size + n)
+        for column, values in zip(self._data.values(), columns):
+            column[self._size: self._size + n] = values
+        self._size += n
+
+    def keep_last(self, n: int) -> None:
+        """ Drop all but the ``n`` most recent rows, keeping the allocated capacity.
+
+        Args:
+            n (int): number of rows to keep
+        """
+        self._flush()
+        if self._size <= n:
+            return
+        for column in self._data.values():
+            column[:n] = column[self._size - n: self._size]
+        self._size = n
+
+    def column(self, name: str) -> NDArray:
+        """ A read-only view of a column's values (no copy is made).
+
+        Args:
+            name (str): name of the column
+
+        Returns:
+            NDArray: the column's values
+        """
+        self._flush()
+        view: NDArray = self._data[name][:self._size]
+        view.flags.writeable = False
+        return view
+
+    def __getitem__(self, name: str) -> NDArray:
+        return self.column(name)
+
+    def _flush(self) -> None:
+        if not self._staged:
+            return
+        n: int = len(self._staged)
+        if self._size + n > self._capacity:
+            self._grow(self._size + n)
+        for column, values in zip(self._data.values(), zip(*self._staged)):
+            column[self._size: self._size + n] = values
+        self._size += n
+        self._staged.clear()
+
+    def _grow(self, min_capacity: int) -> None:
+        capacity: int = self._capacity
+        while capacity < min_capacity:
+            capacity *= 2
+        for name, column in self._data.items():
+            grown: NDArray = np.empty(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._data[name] = grown
+        self._capacity = capacity
@@ -1,8 +1,10 @@
-from typing import Dict, Tuple, List, Sequence, Optional, Union, Generator, Iterator
+from typing import Dict, Mapping, Tuple, List, Set, Sequence, Optional, Union, Generator, Iterator, Deque, NamedTuple, Any
 from enum import IntEnum
 import numpy as np
 
 NDArray = np.ndarray
+# anything np.dtype() accepts, e.g. np.float32
+DTypeLike = Union[np.dtype, type, str]
 
 PORT = 54321
 PS_PORT = 12345
@@ -11,6 +13,20 @@ BUFFSIZE = 1024
 BYTEORDER = "little"
 INT32 = 4
 GENERIC_ACK = 1
+SEND_BUFFER_SIZE = 4096
+BATCH_SIZE = 1024
+ROLLOVER = 10000
+MAX_POINTS = 2000
+RING_SIZE = 65536
+RING_DRAIN_TIMEOUT = 1.
+CLOSE_TIMEOUT = 5.
+RECONNECT_BACKOFF = (.1, 5.)
+STATS_INTERVAL = 1.
+HISTOGRAM_BINS = 64
+HISTOGRAM_WINDOW = 500
+GRID_COLUMNS = 3
+PAGE_SIZE = 30
+EXPORT_CHUNK = 65536
 
 
 NP_ORDER: Dict[str, str] = {
@@ -22,6 +38,8 @@ NP_ORDER: Dict[str, str] = {
 class PlotType(IntEnum):
     train_val_loss = 1
     accuracy = 2
+    confusion_matrix = 3
+    histogram = 4
     test_line_plt = 99
     random = 100
 
@@ -31,4 +49,27 @@ class Cmd(IntEnum):
     add_plot = 2
     start_plot_server = 3
     update_plot = 4
+    batch_update = 5
+    attach_shm = 6
+    set_rank = 7
+    stats = 8
+    query = 9
 
+
+class FullPolicy(IntEnum):
+    block = 1
+    drop_oldest = 2
+    drop_newest = 3
+
+
+class RetentionMode(IntEnum):
+    full = 1
+    rollover = 2
+    decimate = 3
+
+
+class Reduce(IntEnum):
+    mean = 1
+    sum = 2
+    min = 3
+    max = 4